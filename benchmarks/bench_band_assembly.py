@@ -0,0 +1,79 @@
+"""
+Microbenchmark of the assembly of sampleRectangle payloads into embedding patches.
+
+Compares the former per-band float64 path of Collection.extract with assemble_patch
+on synthetic payloads shaped like the ones returned by Google Earth Engine. Both paths
+give the same patches, as checked in tests/test_collection.py.
+
+    $ python benchmarks/bench_band_assembly.py --size 246 --target 244 --repeat 5
+"""
+import argparse
+import timeit
+import numpy as np
+from mangroves.collection import assemble_patch
+from mangroves.constants import BANDS
+
+
+def legacy_assemble_patch(properties, band_names, target_size):
+    """
+    Band assembly as previously implemented in Collection.extract.
+    """
+    bands_data = {}
+    for band_name in band_names:
+        if band_name in properties:
+            band_array = np.array(properties[band_name])
+            h, w = band_array.shape
+            if h > target_size:
+                start_h = (h - target_size) // 2
+                band_array = band_array[start_h:start_h+target_size, :]
+            if w > target_size:
+                start_w = (w - target_size) // 2
+                band_array = band_array[:, start_w:start_w+target_size]
+            h, w = band_array.shape
+            if h < target_size or w < target_size:
+                pad_h = max(0, target_size - h)
+                pad_w = max(0, target_size - w)
+                band_array = np.pad(band_array, ((0, pad_h), (0, pad_w)), mode='constant', constant_values=0)
+            bands_data[band_name] = np.flipud(band_array)
+
+    image_stack = []
+    for band_name in band_names:
+        if band_name in bands_data:
+            image_stack.append(bands_data[band_name])
+        else:
+            image_stack.append(np.zeros(list(bands_data.values())[0].shape))
+    return np.stack(image_stack, axis=0)
+
+
+def synthetic_properties(size: int, n_missing: int = 0, seed: int = 0) -> dict:
+    """
+    Build a sampleRectangle-shaped dict of nested lists, with the last bands missing.
+    """
+    rng = np.random.default_rng(seed)
+    bands = BANDS[:len(BANDS) - n_missing]
+    return {band_name: rng.uniform(-1, 1, (size, size)).tolist() for band_name in bands}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Band assembly microbenchmark')
+    parser.add_argument('--size', type=int, default=246, help='Side of the sampled rectangle in pixels.')
+    parser.add_argument('--target', type=int, default=244, help='Side of the patch in pixels.')
+    parser.add_argument('--missing', type=int, default=0, help='Number of missing bands.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs.')
+    args = parser.parse_args()
+
+    properties = synthetic_properties(args.size, args.missing)
+
+    runs = {
+        'legacy (float64)': lambda: legacy_assemble_patch(properties, BANDS, args.target),
+        'assemble_patch (float64)': lambda: assemble_patch(properties, BANDS, args.target, np.float64),
+        'assemble_patch (float32)': lambda: assemble_patch(properties, BANDS, args.target, np.float32),
+    }
+    print(f'{len(properties)} bands of {args.size}x{args.size} pixels -> {len(BANDS)}x{args.target}x{args.target}')
+    for name, run in runs.items():
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f'{name:<28} {best * 1e3:8.1f} ms  {run().nbytes / 1024 ** 2:6.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
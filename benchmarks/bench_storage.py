@@ -0,0 +1,72 @@
+"""
+Benchmark of the compact `.emb` storage of Embeddings.save against the compressed `.npz` files,
+on synthetic unit-length 64-d embeddings.
+
+    $ python benchmarks/bench_storage.py --size 244 --repeat 5
+"""
+import os
+import argparse
+import tempfile
+import timeit
+import numpy as np
+from mangroves import quantization
+from mangroves.embeddings import Embeddings
+
+
+def synthetic_patch(size: int, bands: int, rng: np.random.Generator) -> np.ndarray:
+    # Smooth fields, normalized to unit length per pixel as AlphaEarth embeddings
+    coarse = rng.normal(size=(bands, size // 8 + 1, size // 8 + 1))
+    data = np.repeat(np.repeat(coarse, 8, axis=1), 8, axis=2)[:, :size, :size]
+    data += 0.1 * rng.normal(size=data.shape)
+    return data / np.linalg.norm(data, axis=0, keepdims=True)
+
+
+def load_npz(path: str) -> np.ndarray:
+    with np.load(path) as npzfile:
+        return npzfile['data']
+
+
+def best_of(run, repeat):
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embeddings storage benchmark')
+    parser.add_argument('--size', type=int, default=244)
+    parser.add_argument('--bands', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    embeddings = Embeddings()
+    embeddings.from_patch(1.4, 103.9, 2020, args.size, 10, synthetic_patch(args.size, args.bands, np.random.default_rng(0)))
+    output_dir = tempfile.mkdtemp()
+
+    print(f'Patch of {args.bands}x{args.size}x{args.size}')
+    print(f'  {"format":<16} {"size (MB)":>10} {"load (ms)":>10} {"pixel load (ms)":>16} {"max error":>10}')
+    for name, dtype, data in [
+        ('npz float64', None, embeddings.data.astype(np.float64)),
+        ('npz float32', None, embeddings.data.astype(np.float32)),
+        ('emb float32', 'float32', embeddings.data),
+        ('emb float16', 'float16', embeddings.data),
+        ('emb int8', 'int8', embeddings.data),
+    ]:
+        path = os.path.join(output_dir, name.replace(' ', '_'))
+        embeddings.data = data
+        embeddings.save(path, 0, dtype)
+        if dtype is None:
+            path += '.npz'
+            load = lambda: load_npz(path)
+            pixel = lambda: load_npz(path)[:, args.size // 2, args.size // 2]
+        else:
+            path += quantization.EXTENSION
+            load = lambda: quantization.read(path)
+            pixel = lambda: np.array(quantization.read(path, raw=True)[:, args.size // 2, args.size // 2])
+        error = np.abs(load() - data).max()
+        # Touch every value, float32 .emb files being only memory-mapped by read
+        touch = lambda: np.asarray(load()).sum()
+        print(f'  {name:<16} {os.path.getsize(path) / 1024 ** 2:10.2f} {best_of(touch, args.repeat) * 1e3:10.1f} '
+              f'{best_of(pixel, args.repeat) * 1e3:16.3f} {error:10.2e}')
+
+
+if __name__ == '__main__':
+    main()
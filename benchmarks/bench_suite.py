@@ -0,0 +1,206 @@
+"""
+Offline throughput suite of the pipeline, against the fake Earth Engine backend of fake_ee.py.
+
+Each case runs in a fresh interpreter so that its peak RSS is its own, and reports its
+throughput in patches (or regions) per second. Results can be saved and compared with a
+baseline, failing when a case slows down by more than the tolerance.
+
+    $ python benchmarks/bench_suite.py --n 64 --latency 0.05 --failure_rate 0.05 --output results.json
+    $ python benchmarks/bench_suite.py --baseline results.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+import fake_ee
+
+SITES = [(1.4, 103.9), (9.9, -61.9), (-2.5, 140.7), (21.9, 89.2), (-18.9, 44.2)]  # Mangrove coasts
+
+
+def synthetic_sites(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Sites scattered within a few kilometers of known mangrove coasts, as in mangrove_metadata.csv.
+    """
+    rng = np.random.default_rng(seed)
+    centers = np.asarray(SITES)[rng.integers(len(SITES), size=n)]
+    lat, lon = (centers + rng.uniform(-0.05, 0.05, size=(n, 2))).T
+    ratio = rng.uniform(0, 1, size=n)
+    return pd.DataFrame({
+        'id': np.arange(n), 'ratio': ratio, 'category': np.ceil(ratio * 5).astype(int),
+        'lat': lat, 'lon': lon, 'year': 2020,
+    })
+
+
+def synthetic_patch(size: int, bands: int = 64) -> np.ndarray:
+    # Smooth fields, normalized to unit length per pixel as AlphaEarth embeddings
+    coarse = np.random.default_rng(0).normal(size=(bands, size // 8 + 1, size // 8 + 1))
+    data = np.repeat(np.repeat(coarse, 8, axis=1), 8, axis=2)[:, :size, :size]
+    return (data / np.linalg.norm(data, axis=0, keepdims=True)).astype(np.float32)
+
+
+def bench_region(args) -> dict:
+    from mangroves.geometry import Region
+    sites = synthetic_sites(args.n * 100)
+    start = time.perf_counter()
+    for lat, lon in zip(sites['lat'], sites['lon']):
+        Region(lat, lon, 244).region
+    return {'count': len(sites), 'elapsed_s': time.perf_counter() - start, 'unit': 'regions'}
+
+
+def bench_extract(args) -> dict:
+    from mangroves.collection import Collection
+    from mangroves.geometry import Region
+    sites = synthetic_sites(args.n)
+    collection = Collection('bench', requests_per_second=1e6)
+    regions = [Region(lat, lon, 244) for lat, lon in zip(sites['lat'], sites['lon'])]
+    start = time.perf_counter()
+    patches = [patch for _, patch in collection.extract_many(regions, 2020, max_workers=args.workers, backoff_s=0.01)]
+    return {'count': sum(patch is not None for patch in patches), 'elapsed_s': time.perf_counter() - start}
+
+
+def bench_points(args) -> dict:
+    from mangroves.collection import Collection
+    sites = synthetic_sites(args.n * 100)
+    collection = Collection('bench', requests_per_second=1e6)
+    start = time.perf_counter()
+    values = collection.sample_points(sites['lat'], sites['lon'], 2020, max_workers=args.workers, backoff_s=0.01)
+    return {'count': int((~np.isnan(values).any(axis=1)).sum()), 'elapsed_s': time.perf_counter() - start, 'unit': 'points'}
+
+
+def bench_pipeline(args) -> dict:
+    from mangroves.collection import Collection
+    from mangroves.pipeline import build_dataset
+    workdir = tempfile.mkdtemp()
+    synthetic_sites(args.n).to_csv(os.path.join(workdir, 'metadata.csv'), index=False)
+    collection = Collection('bench', requests_per_second=1e6)
+    start = time.perf_counter()
+    store = build_dataset(os.path.join(workdir, 'metadata.csv'), workdir, collection, max_workers=args.workers)
+    return {'count': len(store), 'elapsed_s': time.perf_counter() - start}
+
+
+def bench_save_load(args) -> dict:
+    from mangroves.embeddings import Embeddings
+    output_dir = tempfile.mkdtemp()
+    data = synthetic_patch(244)
+    start = time.perf_counter()
+    for i in range(args.n):
+        embeddings = Embeddings()
+        embeddings.from_patch(1.4, 103.9, 2020, 244, 10, data)
+        path = os.path.join(output_dir, f'{i}')
+        embeddings.save(path, i, args.dtype)
+        Embeddings().from_file(path + ('.npz' if args.dtype is None else '.emb'))
+    return {'count': args.n, 'elapsed_s': time.perf_counter() - start}
+
+
+def bench_label(args) -> dict:
+    import shapely
+    from mangroves.geometry import Region
+    from mangroves.labels import LabelEngine
+    sites = synthetic_sites(args.n)
+    rng = np.random.default_rng(1)
+    # Mangrove stands of a few hundred meters around random points of the coasts
+    stands = synthetic_sites(args.n * 50, seed=2)
+    polygons = shapely.buffer(shapely.points(stands['lon'], stands['lat']), rng.uniform(0.001, 0.005, size=len(stands)))
+    engine = LabelEngine(polygons)
+    start = time.perf_counter()
+    for lat, lon in zip(sites['lat'], sites['lon']):
+        engine.label(Region(lat, lon, 244))
+    return {'count': len(sites), 'elapsed_s': time.perf_counter() - start}
+
+
+def bench_dataloader(args) -> dict:
+    from torch.utils.data import DataLoader
+    from mangroves.store import EmbeddingStore
+    from mangroves.scripts.data import MangroveDataset
+    output_dir = tempfile.mkdtemp()
+    index = synthetic_sites(args.n)
+    index['train'] = 1
+    index['offset'] = np.arange(len(index))
+    data = np.lib.format.open_memmap(os.path.join(output_dir, EmbeddingStore.DATA_FILE), mode='w+',
+                                     dtype=np.float32, shape=(len(index), 64, 244, 244))
+    data[:] = synthetic_patch(244)
+    data.flush()
+    del data
+    index.to_csv(os.path.join(output_dir, EmbeddingStore.INDEX_FILE), index=False)
+
+    loader = DataLoader(MangroveDataset(output_dir), batch_size=16, num_workers=args.workers, shuffle=True)
+    start = time.perf_counter()
+    count = sum(len(batch['embeddings']) for batch in loader)
+    return {'count': count, 'elapsed_s': time.perf_counter() - start}
+
+
+CASES = {
+    'region': bench_region,
+    'extract': bench_extract,
+    'points': bench_points,
+    'pipeline': bench_pipeline,
+    'save_load': bench_save_load,
+    'label': bench_label,
+    'dataloader': bench_dataloader,
+}
+
+
+def run_case(args) -> None:
+    fake_ee.install(latency_s=args.latency, jitter_s=args.jitter, failure_rate=args.failure_rate, seed=args.seed)
+    import logging
+    logging.disable(logging.WARNING)  # Keep the per-patch logs of the pipeline out of the timings
+    result = CASES[args.case](args)
+    result.setdefault('unit', 'patches')
+    result['per_s'] = fake_ee.throughput(result['count'], result['elapsed_s'])
+    result['peak_rss_mb'] = fake_ee.peak_rss_mb()
+    result['requests'] = fake_ee.STATS['requests']
+    result['failures'] = fake_ee.STATS['failures']
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark suite')
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--n', type=int, default=64, help='Number of patches per case.')
+    parser.add_argument('--workers', type=int, default=8, help='Request threads, or DataLoader workers.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latency of the fake requests in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Maximum extra latency in seconds.')
+    parser.add_argument('--failure_rate', type=float, default=0.05, help='Probability of a fake request failing.')
+    parser.add_argument('--dtype', default=None, help='Storage dtype of save_load, npz if not set.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Save the results to this JSON file.')
+    parser.add_argument('--baseline', default=None, help='Compare with the results of a previous run.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown against the baseline.')
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)  # Run a single case in this process
+    args = parser.parse_args()
+
+    if args.case is not None:
+        run_case(args)
+        return
+
+    options = sys.argv[1:]
+    results = {}
+    print(f'  {"case":<12} {"count":>7} {"time (s)":>9} {"per second":>16} {"peak RSS (MB)":>14} {"failures":>9}')
+    for case in args.cases:
+        output = subprocess.run([sys.executable, __file__, '--case', case] + options,
+                                capture_output=True, text=True, check=True).stdout
+        result = results[case] = json.loads(output.strip().splitlines()[-1])
+        print(f'  {case:<12} {result["count"]:>7} {result["elapsed_s"]:9.2f} '
+              f'{result["per_s"]:>8.1f} {result["unit"]:<7} {result["peak_rss_mb"]:14.0f} {result["failures"]:>9}')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = [case for case in results if case in baseline
+                       and results[case]['per_s'] < (1 - args.tolerance) * baseline[case]['per_s']]
+        for case in regressions:
+            print(f'Regression of {case}: {results[case]["per_s"]:.1f} against {baseline[case]["per_s"]:.1f} per second')
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark of the batched parametric transforms against per-sample transforms on CPU.
+
+    $ python benchmarks/bench_transforms.py --batch_size 32 --size 244 --crop 224
+"""
+import argparse
+import time
+import torch
+from torchvision.transforms import functional as F
+from mangroves.scripts.transforms import BatchCompose, RandomFlip, RandomRot90, RandomCrop, Normalize
+
+
+def per_sample(batch: torch.Tensor, crop: int, mean: torch.Tensor, std: torch.Tensor) -> torch.Tensor:
+    """
+    Same augmentations, applied one image at a time with torchvision functional ops.
+    """
+    outputs = []
+    for img in batch:
+        if torch.rand(1) < 0.5:
+            img = F.hflip(img)
+        if torch.rand(1) < 0.5:
+            img = F.vflip(img)
+        img = torch.rot90(img, int(torch.randint(0, 4, (1,))), dims=(-2, -1))
+        top, left = torch.randint(0, img.shape[-2] - crop + 1, (2,)).tolist()
+        img = F.crop(img, top, left, crop, crop)
+        outputs.append(F.normalize(img, mean.tolist(), std.tolist()))
+    return torch.stack(outputs)
+
+
+def throughput(run, batch: torch.Tensor, repeat: int) -> float:
+    run(batch)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run(batch)
+    return repeat * batch.shape[0] / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batched transforms benchmark')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--bands', type=int, default=64)
+    parser.add_argument('--size', type=int, default=244)
+    parser.add_argument('--crop', type=int, default=224)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=None, help='Number of CPU threads used by torch.')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    batch = torch.randn(args.batch_size, args.bands, args.size, args.size)
+    mean, std = batch.mean(dim=(0, 2, 3)), batch.std(dim=(0, 2, 3))
+
+    batched = BatchCompose([
+        RandomFlip(), RandomFlip(vertical=True), RandomRot90(), RandomCrop(args.crop), Normalize(mean, std, inplace=True)
+    ])
+
+    print(f'Batches of {args.batch_size}x{args.bands}x{args.size}x{args.size}, '
+          f'crop {args.crop}, {torch.get_num_threads()} threads')
+    for name, run in {
+        'per-sample': lambda b: per_sample(b, args.crop, mean, std),
+        'batched': lambda b: batched(b),
+    }.items():
+        print(f'  {name:<12} {throughput(run, batch, args.repeat):8.1f} samples/s')
+
+
+if __name__ == '__main__':
+    main()
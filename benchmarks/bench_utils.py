@@ -0,0 +1,94 @@
+"""
+Benchmark of the array-native geodesic helpers of mangroves.utils against the former
+scalar implementations, called site by site as in the earth-sampling notebook. Their results
+are checked against each other in tests/test_utils.py.
+
+    $ python benchmarks/bench_utils.py --sites 1000 --points 360
+"""
+import argparse
+import math
+import timeit
+import numpy as np
+from mangroves.constants import RADIUS_EARTH_M
+from mangroves.utils import (
+    haversine, geodesic_circles, planar_approx_circles, nearest_neighbours
+)
+
+
+def legacy_geodesic_circle(lat0_deg, lon0_deg, distance_m, n_points=360, R=RADIUS_EARTH_M):
+    lat0_rad = math.radians(lat0_deg)
+    lon0_rad = math.radians(lon0_deg)
+    delta = distance_m / R
+    pts = []
+    for k in range(n_points):
+        theta = 2 * math.pi * k / n_points
+        sin_lat = math.sin(lat0_rad) * math.cos(delta) + math.cos(lat0_rad) * math.sin(delta) * math.cos(theta)
+        lat_rad = math.asin(sin_lat)
+        y = math.sin(theta) * math.sin(delta) * math.cos(lat0_rad)
+        x = math.cos(delta) - math.sin(lat0_rad) * sin_lat
+        lon_rad = lon0_rad + math.atan2(y, x)
+        lon_rad = (lon_rad + math.pi) % (2 * math.pi) - math.pi
+        pts.append((math.degrees(lat_rad), math.degrees(lon_rad)))
+    return pts
+
+
+def legacy_planar_approx_circle(lat0_deg, lon0_deg, distance_m, n_points=360, R=RADIUS_EARTH_M):
+    K = R * (math.pi / 180)
+    pts = []
+    for k in range(n_points):
+        theta = 2 * math.pi * k / n_points
+        dlat_deg = (distance_m * math.cos(theta)) / K
+        dlon_deg = (distance_m * math.sin(theta)) / (K * math.cos(lat0_deg * (math.pi / 180)))
+        pts.append((lat0_deg + dlat_deg, lon0_deg + dlon_deg))
+    return pts
+
+
+def legacy_nearest_neighbour(lats, lons):
+    indices = []
+    for i in range(len(lats)):
+        distances = [haversine(lats[i], lats[j], lons[i], lons[j]) if i != j else np.inf for j in range(len(lats))]
+        indices.append(int(np.argmin(distances)))
+    return np.array(indices)
+
+
+def best_of(run, repeat):
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Geodesic helpers benchmark')
+    parser.add_argument('--sites', type=int, default=1000, help='Number of circle centers.')
+    parser.add_argument('--points', type=int, default=360, help='Number of points per circle.')
+    parser.add_argument('--pairs', type=int, default=300, help='Number of sites of the scalar nearest-neighbour run.')
+    parser.add_argument('--large', type=int, default=20000, help='Number of sites of the blocked nearest-neighbour run.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(-30, 30, args.sites), rng.uniform(-180, 180, args.sites)
+    distance_m = 1220.
+
+    print(f'Circles of {args.points} points around {args.sites} sites')
+    for name, run in {
+        'legacy geodesic_circle': lambda: [legacy_geodesic_circle(lat, lon, distance_m, args.points) for lat, lon in zip(lats, lons)],
+        'geodesic_circles': lambda: geodesic_circles(lats, lons, distance_m, args.points),
+        'legacy planar_approx_circle': lambda: [legacy_planar_approx_circle(lat, lon, distance_m, args.points) for lat, lon in zip(lats, lons)],
+        'planar_approx_circles': lambda: planar_approx_circles(lats, lons, distance_m, args.points),
+    }.items():
+        print(f'  {name:<28} {best_of(run, args.repeat) * 1e3:9.1f} ms')
+
+    small_lats, small_lons = lats[:args.pairs], lons[:args.pairs]
+    print(f'Nearest neighbour among {args.pairs} sites')
+    for name, run in {
+        'legacy haversine loop': lambda: legacy_nearest_neighbour(small_lats, small_lons),
+        'nearest_neighbours': lambda: nearest_neighbours(small_lats, small_lons, small_lats, small_lons, exclude_self=True),
+    }.items():
+        print(f'  {name:<28} {best_of(run, args.repeat) * 1e3:9.1f} ms')
+
+    large_lats, large_lons = rng.uniform(-30, 30, args.large), rng.uniform(-180, 180, args.large)
+    elapsed = best_of(lambda: nearest_neighbours(large_lats, large_lons, large_lats, large_lons, k=5, exclude_self=True), 1)
+    print(f'5 nearest neighbours among {args.large} sites (blocked): {elapsed:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,571 @@
+"""
+Deterministic stand-in for the `ee` module, serving synthetic AlphaEarth payloads so that the
+pipeline can be benchmarked offline.
+
+Every blocking `getInfo()` sleeps for the configured latency and fails with the configured rate,
+failures being drawn from a seeded generator. `sampleRectangle` returns nested lists of floats
+shaped like the JSON decoded by the real client, so that band assembly is measured on realistic
+inputs. Bands are sampled in their projection, and mosaics default to WGS84 at 1 degree as in
+Earth Engine, so that a mosaic sampled without a 10 m projection comes back as a single pixel.
+Install it before importing `mangroves`:
+
+    import fake_ee
+    fake_ee.install(latency_s=0.2, failure_rate=0.05)
+    from mangroves.collection import Collection
+
+Computed objects are built as the real client builds them: invocations of the algorithms of the
+Earth Engine API, under their names and with their argument names, encoded as the expression
+graphs sent to the `value:compute` endpoint. `evaluate` computes such graphs, from this module or
+from the real client, for the algorithms listed in FUNCTIONS. They are evaluated in process by
+default. Once initialized with `ee.Initialize(url=...)`, e.g. by `Collection(..., url=server.url)`,
+`getInfo()` posts them to the `value:compute` endpoint of that server instead, such as the one of
+fake_server.py. The graphs match those recorded from the real client by record_expressions.py.
+"""
+import sys
+import json
+import math
+import time
+import random
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+from typing import Callable, Dict, List
+
+N_BANDS = 64
+SCALE_M = 10
+UTM = 'EPSG:32648'
+WGS84 = 'EPSG:4326'
+DEGREE_M = 111319.49    # Length of a degree at the equator, the scale of the default WGS84 projection
+IMAGE_INDEX = 'fake'    # system:index of the images of the collections
+
+_config = {'latency_s': 0., 'jitter_s': 0., 'failure_rate': 0., 'size': 246, 'url': None, 'project': None}
+_random = random.Random(0)
+_lock = threading.Lock()
+_payload_lock = threading.Lock()
+_payloads: Dict[int, Dict[str, List]] = {}
+
+STATS = {'requests': 0, 'failures': 0, 'pixels': 0}
+
+
+class EEException(Exception):
+    pass
+
+
+def configure(
+        latency_s: float = 0.,
+        jitter_s: float = 0.,
+        failure_rate: float = 0.,
+        size: int = 246,
+        seed: int = 0) -> None:
+    """
+    Args:
+        latency_s (float, optional): Latency of every request in seconds.
+        jitter_s (float, optional): Maximum extra latency, drawn uniformly.
+        failure_rate (float, optional): Probability of a request failing with EEException.
+        size (int, optional): Side in pixels of the rectangles sampled by sampleRectangle.
+        seed (int, optional): Seed of the failures and jitter.
+    """
+    _config.update(latency_s=latency_s, jitter_s=jitter_s, failure_rate=failure_rate, size=size, url=None, project=None)
+    _random.seed(seed)
+    _payloads.clear()
+    for key in STATS:
+        STATS[key] = 0
+
+
+def install(**kwargs) -> None:
+    """
+    Configure the fake module and register it as `ee`.
+    """
+    configure(**kwargs)
+    sys.modules['ee'] = sys.modules[__name__]
+
+
+def _request() -> None:
+    with _lock:
+        STATS['requests'] += 1
+        jitter = _random.random() * _config['jitter_s']
+        failed = _random.random() < _config['failure_rate']
+        if failed:
+            STATS['failures'] += 1
+    time.sleep(_config['latency_s'] + jitter)
+    if failed:
+        raise EEException('Too many concurrent aggregations.')
+
+
+def _payload(size: int) -> Dict[str, List]:
+    """
+    Properties of a sampleRectangle result: smooth unit-length fields as nested lists of floats.
+    They are built once per size and shared by all the requests, so that the decoding done by
+    the real client is left out of the measures (see bench_band_assembly.py for that cost).
+    """
+    payload = _payloads.get(size)
+    if payload is not None:
+        return payload
+    # Built by a single thread, the others waiting for it instead of building their own copy
+    with _payload_lock:
+        if size not in _payloads:
+            rng = np.random.default_rng(size)
+            coarse = rng.normal(size=(N_BANDS, size // 8 + 1, size // 8 + 1))
+            data = np.repeat(np.repeat(coarse, 8, axis=1), 8, axis=2)[:, :size, :size]
+            data = data / np.linalg.norm(data, axis=0, keepdims=True)
+            _payloads[size] = {f'A{i:02d}': data[i].tolist() for i in range(N_BANDS)}
+        return _payloads[size]
+
+
+# Server side: values of the algorithms, and evaluation of the expression graphs
+
+class _Projection:
+
+    def __init__(self, crs: str = WGS84, scale: float = DEGREE_M) -> None:
+        self.crs = crs
+        self.scale = scale
+
+    def info(self) -> dict:
+        return {'type': 'Projection', 'crs': self.crs, 'transform': [self.scale, 0, 0, 0, -self.scale, 0]}
+
+
+class _Image:
+    """
+    Image whose bands each have a projection, the 10 m UTM projection of the AlphaEarth tiles by default.
+    """
+
+    def __init__(self, image_id: str = None, bands: List[str] = None, masked: bool = False, projections=None) -> None:
+        self.image_id = image_id
+        self.bands = [f'A{i:02d}' for i in range(N_BANDS)] if bands is None else list(bands)
+        self.masked = masked
+        self.projections = list(projections) if projections is not None else [_Projection(UTM, SCALE_M)] * len(self.bands)
+
+    def derive(self, bands=None, masked=None, projections=None) -> '_Image':
+        return _Image(self.image_id, self.bands if bands is None else bands, self.masked if masked is None else masked,
+                      self.projections if projections is None else projections)
+
+    def info(self) -> dict:
+        return {'type': 'Image', 'id': self.image_id,
+                'bands': [{'id': band, 'data_type': {'type': 'PixelType', 'precision': 'float'}, **projection.info()}
+                          for band, projection in zip(self.bands, self.projections)],
+                'properties': {'system:index': IMAGE_INDEX}}
+
+
+def _info(value):
+    """
+    JSON value of a result, as returned by the `value:compute` endpoint.
+    """
+    if isinstance(value, (_Image, _Projection)):
+        return value.info()
+    if isinstance(value, list):
+        return [_info(item) for item in value]
+    return value
+
+
+def _projection(crs, scale=None) -> _Projection:
+    projection = crs if isinstance(crs, _Projection) else _Projection(crs)
+    return _Projection(projection.crs, scale) if scale is not None else projection
+
+
+def _pixel(lon: float, lat: float, crs: str, scale: float):
+    """
+    Column and row of the pixel of a point on the grid of a projection, with edges on multiples of
+    the scale in the units of the CRS, degrees for WGS84.
+    """
+    if crs == WGS84:
+        return math.floor(lon / (scale / DEGREE_M)), math.floor(lat / (scale / DEGREE_M))
+    from pyproj import Transformer
+    x, y = Transformer.from_crs(WGS84, crs, always_xy=True).transform(lon, lat)
+    return math.floor(x / scale), math.floor(y / scale)
+
+
+def _mosaic(collection: List[_Image]) -> _Image:
+    # Mosaics drop the projection of their images for the default one, WGS84 at 1 degree
+    unmasked = [image for image in collection if not image.masked]
+    image = unmasked[-1] if unmasked else collection[-1]
+    return _Image(None, image.bands, image.masked, [_Projection()] * len(image.bands))
+
+
+def _sample_rectangle(image: _Image, region=None, properties=None, defaultValue=None, defaultArrayValue=None) -> dict:
+    if image is None:
+        raise EEException('Image.sampleRectangle: Parameter \'image\' is required.')
+    size = _config['size']
+    payload = _payload(size)
+    # Bands are sampled on the grid of their projection: a patch of 10 m pixels shrinks to a
+    # single pixel in a projection at 1 degree, such as the default one of mosaics
+    sides = [max(1, math.ceil(size * SCALE_M / p.scale)) if p.scale > SCALE_M else size for p in image.projections]
+    with _lock:
+        STATS['pixels'] += sum(side * side for side in sides) // N_BANDS
+    # Renamed bands share the payload of the band of the same index
+    values = {}
+    for i, (band, side) in enumerate(zip(image.bands, sides)):
+        rows = payload[f'A{i % N_BANDS:02d}']
+        values[band] = rows if side == size else [row[:side] for row in rows[:side]]
+    return {'type': 'Feature', 'geometry': None, 'properties': values}
+
+
+def _sample_regions(image: _Image, collection, properties=None, scale=None, projection=None, tileScale=None,
+                    geometries=None) -> dict:
+    # Values of the pixel of the payload under each point, on the grid of the projection, WGS84
+    # if none is given, wrapping the coordinates over the payload. Points beyond 80 degrees of
+    # latitude have no data and are left out, as masked pixels are.
+    size = _config['size']
+    payload = _payload(size)
+    projection = projection if projection is not None else _Projection()
+    scale = scale if scale is not None else projection.scale
+    features = []
+    for feature in collection:
+        lon, lat = feature['geometry']['coordinates']
+        if abs(lat) > 80:
+            continue
+        col, row = _pixel(lon, lat, projection.crs, scale)
+        row, col = row % size, col % size
+        values = {band: payload[f'A{i % N_BANDS:02d}'][row][col] for i, band in enumerate(image.bands)}
+        features.append({'type': 'Feature', 'geometry': None,
+                         'properties': {**{key: feature['properties'][key] for key in properties or []}, **values}})
+    with _lock:
+        STATS['pixels'] += len(features)
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+# Features of images cover the whole globe
+_GLOBE = {'type': 'Polygon', 'coordinates': [[[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]]]}
+
+# Algorithms of the Earth Engine API, under their names and with their argument names. Filters
+# keep every image, and collections hold a single image.
+FUNCTIONS: Dict[str, Callable] = {
+    'ImageCollection.load': lambda id: [_Image(f'{id}/{IMAGE_INDEX}')],
+    'ImageCollection.fromImages': lambda images: list(images),
+    'ImageCollection.merge': lambda collection1, collection2: collection1 + collection2,
+    'ImageCollection.mosaic': _mosaic,
+    'Collection': lambda features: list(features),
+    'Collection.filter': lambda collection, filter: collection,
+    'Collection.size': lambda collection: len(collection),
+    'Collection.first': lambda collection: collection[0] if collection else None,
+    'Collection.map': lambda collection, baseAlgorithm, dropNulls=None: [baseAlgorithm(item) for item in collection],
+    'Collection.toList': lambda collection, count, offset=0: collection[offset:offset + count],
+    'Collection.geometry': lambda collection, maxError=None: {
+        'type': 'MultiPoint', 'coordinates': [feature['geometry']['coordinates'] for feature in collection]},
+    'Filter.dateRangeContains': lambda **kwargs: None,
+    'Filter.intersects': lambda **kwargs: None,
+    'DateRange': lambda **kwargs: None,
+    'Feature': lambda geometry=None, metadata=None: {'type': 'Feature', 'geometry': geometry, 'properties': metadata or {}},
+    'Element.get': lambda object, property: object.info()['properties'].get(property)
+        if isinstance(object, _Image) else object['properties'].get(property),
+    'GeometryConstructors.Polygon': lambda coordinates, crs=None, geodesic=None, maxError=None, evenOdd=None: {
+        'type': 'Polygon', 'coordinates': coordinates},
+    'GeometryConstructors.Point': lambda coordinates, crs=None: {'type': 'Point', 'coordinates': coordinates},
+    'Geometry.bounds': lambda geometry, maxError=None, proj=None: geometry,
+    'Image.load': lambda id, version=None: _Image(id),
+    'Image.constant': lambda value: _Image(
+        None, [f'constant_{i}' for i in range(len(value))] if isinstance(value, list) else ['constant'],
+        projections=[_Projection()] * (len(value) if isinstance(value, list) else 1)),
+    'Image.toFloat': lambda value: value,
+    'Image.rename': lambda input, names: input.derive(bands=names),
+    'Image.updateMask': lambda image, mask: image.derive(masked=True),
+    'Image.addBands': lambda dstImg, srcImg, names=None, overwrite=None: _Image(
+        dstImg.image_id, dstImg.bands + srcImg.bands, dstImg.masked, dstImg.projections + srcImg.projections),
+    'Image.projection': lambda image: image.projections[0],
+    'Image.setDefaultProjection': lambda image, crs, crsTransform=None, scale=None: image.derive(
+        projections=[_projection(crs, scale)] * len(image.bands)),
+    'Image.reproject': lambda image, crs, crsTransform=None, scale=None: image.derive(
+        projections=[_projection(crs, scale)] * len(image.bands)),
+    'Image.geometry': lambda feature, maxError=None, proj=None, geodesics=None: _GLOBE,
+    'Image.sampleRectangle': _sample_rectangle,
+    'Image.sampleRegions': _sample_regions,
+    'Projection': lambda crs, transform=None, transformWkt=None: _Projection(crs, DEGREE_M if crs == WGS84 else 1.),
+    'Projection.atScale': lambda projection, meters: _Projection(projection.crs, meters),
+}
+
+
+def evaluate(expression: dict):
+    """
+    Client-side value of an expression graph, as sent by the real client to `value:compute`:
+    `{'result': <reference>, 'values': {<reference>: <ValueNode>}}`.
+    """
+    values = expression['values']
+    computed = {}
+
+    def value(node: dict, scope: dict):
+        if 'valueReference' in node:
+            reference = node['valueReference']
+            # Nodes depending on the arguments of a function are computed again for every call
+            if scope:
+                return value(values[reference], scope)
+            if reference not in computed:
+                computed[reference] = value(values[reference], scope)
+            return computed[reference]
+        if 'constantValue' in node:
+            return node['constantValue']
+        if 'integerValue' in node:
+            return int(node['integerValue'])
+        if 'nullValue' in node:
+            return None
+        if 'arrayValue' in node:
+            return [value(item, scope) for item in node['arrayValue'].get('values', [])]
+        if 'dictionaryValue' in node:
+            return {key: value(item, scope) for key, item in node['dictionaryValue'].get('values', {}).items()}
+        if 'argumentReference' in node:
+            return scope[node['argumentReference']]
+        if 'functionDefinitionValue' in node:
+            definition = node['functionDefinitionValue']
+            return lambda *args: value(values[definition['body']], {**scope, **dict(zip(definition['argumentNames'], args))})
+        if 'functionInvocationValue' in node:
+            invocation = node['functionInvocationValue']
+            function = FUNCTIONS.get(invocation.get('functionName'))
+            if function is None:
+                raise EEException(f'Unknown algorithm: {invocation.get("functionName")}')
+            return function(**{key: value(item, scope) for key, item in invocation.get('arguments', {}).items()})
+        raise EEException(f'Invalid value node: {list(node)}')
+
+    return _info(value(values[expression['result']], {}))
+
+
+def _post(expression: dict):
+    request = urllib.request.Request(
+        f"{_config['url']}/v1/projects/{_config['project']}/value:compute?prettyPrint=false&alt=json",
+        data=json.dumps({'expression': expression}).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)['result']
+    except urllib.error.HTTPError as e:
+        raise EEException(json.load(e)['error']['message']) from None
+
+
+# Client side: computed objects as invocations of the algorithms, encoded as expression graphs
+
+def Authenticate(*args, **kwargs) -> None:
+    pass
+
+
+def Initialize(project=None, url=None, *args, **kwargs) -> None:
+    _config.update(project=project, url=url)
+
+
+class ComputedObject:
+
+    def __init__(self, function: str = None, arguments: dict = None, reference: str = None) -> None:
+        self.function = function
+        self.arguments = arguments or {}
+        self.reference = reference
+
+    @classmethod
+    def _invoke(cls, function: str, **arguments) -> 'ComputedObject':
+        """
+        Invocation of an algorithm, leaving out the arguments not given, as the real client does.
+        """
+        obj = cls.__new__(cls)
+        ComputedObject.__init__(obj, function, {key: value for key, value in arguments.items() if value is not None})
+        return obj
+
+    @classmethod
+    def _argument(cls, name: str) -> 'ComputedObject':
+        obj = cls.__new__(cls)
+        ComputedObject.__init__(obj, reference=name)
+        return obj
+
+    def encode(self) -> dict:
+        """
+        Expression graph of the object, in the format of the `value:compute` requests.
+        """
+        values = {'0': None}
+
+        def node(value) -> dict:
+            if isinstance(value, ComputedObject):
+                if value.reference is not None:
+                    return {'argumentReference': value.reference}
+                return {'functionInvocationValue': {
+                    'functionName': value.function,
+                    'arguments': {key: node(argument) for key, argument in value.arguments.items()}}}
+            if isinstance(value, _Function):
+                key = str(len(values))
+                values[key] = None
+                values[key] = node(value.body)
+                return {'functionDefinitionValue': {'argumentNames': [value.name], 'body': key}}
+            if isinstance(value, (list, tuple)) and any(_computed(item) for item in value):
+                return {'arrayValue': {'values': [node(item) for item in value]}}
+            if isinstance(value, dict) and any(_computed(item) for item in value.values()):
+                return {'dictionaryValue': {'values': {key: node(item) for key, item in value.items()}}}
+            return {'constantValue': value}
+
+        values['0'] = node(self)
+        return {'result': '0', 'values': values}
+
+    def getInfo(self):
+        expression = self.encode()
+        if _config['url'] is not None:
+            return _post(expression)
+        _request()
+        return evaluate(expression)
+
+
+def _computed(value) -> bool:
+    if isinstance(value, (list, tuple)):
+        return any(_computed(item) for item in value)
+    if isinstance(value, dict):
+        return any(_computed(item) for item in value.values())
+    return isinstance(value, (ComputedObject, _Function))
+
+
+class _Function:
+    """
+    Function mapped over a collection, called once with a placeholder argument to build its body.
+    """
+
+    def __init__(self, function: Callable, argument_class) -> None:
+        self.name = '_MAPPING_VAR_0_0'
+        self.body = function(argument_class._argument(self.name))
+
+
+class Projection(ComputedObject):
+
+    def __init__(self, crs: str) -> None:
+        super().__init__('Projection', {'crs': crs})
+
+    def atScale(self, meters: float) -> 'Projection':
+        return Projection._invoke('Projection.atScale', projection=self, meters=meters)
+
+
+def _as_projection(crs) -> Projection:
+    # Strings are promoted to projections, as by the real client
+    return Projection(crs) if isinstance(crs, str) else crs
+
+
+class Geometry(ComputedObject):
+
+    @staticmethod
+    def Rectangle(coords, *args, **kwargs) -> 'Geometry':
+        xMin, yMin, xMax, yMax = coords
+        return Geometry._invoke('GeometryConstructors.Polygon',
+                                coordinates=[[[xMin, yMax], [xMin, yMin], [xMax, yMin], [xMax, yMax]]], evenOdd=True)
+
+    @staticmethod
+    def Point(coords, *args, **kwargs) -> 'Geometry':
+        return Geometry._invoke('GeometryConstructors.Point', coordinates=list(coords))
+
+    def bounds(self) -> 'Geometry':
+        return Geometry._invoke('Geometry.bounds', geometry=self)
+
+
+class Element(ComputedObject):
+
+    def get(self, property: str) -> ComputedObject:
+        return ComputedObject._invoke('Element.get', object=self, property=property)
+
+
+class Image(Element):
+
+    def __init__(self, image_id: str) -> None:
+        super().__init__('Image.load', {'id': image_id})
+
+    @staticmethod
+    def constant(value) -> 'Image':
+        return Image._invoke('Image.constant', value=value)
+
+    @staticmethod
+    def cat(images) -> 'Image':
+        images = list(images)
+        result = images[0]
+        for image in images[1:]:
+            result = result.addBands(image)
+        return result
+
+    def addBands(self, srcImg: 'Image') -> 'Image':
+        return Image._invoke('Image.addBands', dstImg=self, srcImg=srcImg)
+
+    def geometry(self) -> Geometry:
+        return Geometry._invoke('Image.geometry', feature=self)
+
+    def projection(self) -> Projection:
+        return Projection._invoke('Image.projection', image=self)
+
+    def toFloat(self) -> 'Image':
+        return Image._invoke('Image.toFloat', value=self)
+
+    def rename(self, names) -> 'Image':
+        return Image._invoke('Image.rename', input=self, names=list(names))
+
+    def updateMask(self, mask) -> 'Image':
+        return Image._invoke('Image.updateMask', image=self, mask=mask if isinstance(mask, Image) else Image.constant(mask))
+
+    def setDefaultProjection(self, crs, crsTransform=None, scale=None) -> 'Image':
+        return Image._invoke('Image.setDefaultProjection', image=self, crs=_as_projection(crs),
+                             crsTransform=crsTransform, scale=scale)
+
+    def reproject(self, crs, crsTransform=None, scale=None) -> 'Image':
+        return Image._invoke('Image.reproject', image=self, crs=_as_projection(crs), crsTransform=crsTransform, scale=scale)
+
+    def sampleRectangle(self, region=None, properties=None, defaultValue=None, defaultArrayValue=None) -> 'Feature':
+        return Feature._invoke('Image.sampleRectangle', image=self, region=region, properties=properties,
+                               defaultValue=defaultValue, defaultArrayValue=defaultArrayValue)
+
+    def sampleRegions(self, collection, properties=None, scale=None, projection=None, tileScale=None,
+                      geometries=None) -> 'FeatureCollection':
+        return FeatureCollection._invoke('Image.sampleRegions', image=self, collection=collection, properties=properties,
+                                         scale=scale, projection=projection, tileScale=tileScale, geometries=geometries)
+
+
+class Feature(Element):
+
+    def __init__(self, geometry: Geometry, properties: dict = None) -> None:
+        super().__init__('Feature', {'geometry': geometry, **({'metadata': properties} if properties else {})})
+
+
+class Collection(ComputedObject):
+
+    def size(self) -> ComputedObject:
+        return ComputedObject._invoke('Collection.size', collection=self)
+
+    def toList(self, count: int, offset: int = 0) -> ComputedObject:
+        return ComputedObject._invoke('Collection.toList', collection=self, count=count, offset=offset)
+
+    def geometry(self) -> Geometry:
+        return Geometry._invoke('Collection.geometry', collection=self)
+
+
+class FeatureCollection(Collection):
+
+    def __init__(self, features) -> None:
+        super().__init__('Collection', {'features': list(features)})
+
+
+class ImageCollection(Collection):
+
+    def __init__(self, args) -> None:
+        if isinstance(args, str):
+            super().__init__('ImageCollection.load', {'id': args})
+        else:
+            super().__init__('ImageCollection.fromImages', {'images': list(args)})
+
+    def filterDate(self, start, end) -> 'ImageCollection':
+        date_range = ComputedObject._invoke('DateRange', start=start, end=end)
+        return ImageCollection._invoke('Collection.filter', collection=self, filter=ComputedObject._invoke(
+            'Filter.dateRangeContains', leftValue=date_range, rightField='system:time_start'))
+
+    def filterBounds(self, geometry) -> 'ImageCollection':
+        return ImageCollection._invoke('Collection.filter', collection=self, filter=ComputedObject._invoke(
+            'Filter.intersects', leftField='.all', rightValue=Feature(geometry)))
+
+    def merge(self, other: 'ImageCollection') -> 'ImageCollection':
+        return ImageCollection._invoke('ImageCollection.merge', collection1=self, collection2=other)
+
+    def map(self, function) -> FeatureCollection:
+        return FeatureCollection._invoke('Collection.map', collection=self, baseAlgorithm=_Function(function, Image))
+
+    def mosaic(self) -> Image:
+        return Image._invoke('ImageCollection.mosaic', collection=self)
+
+    def first(self) -> Image:
+        return Image._invoke('Collection.first', collection=self)
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of the process in MB.
+    """
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+def throughput(count: int, elapsed_s: float) -> float:
+    return count / elapsed_s if elapsed_s > 0 else math.inf
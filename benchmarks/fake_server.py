@@ -0,0 +1,109 @@
+"""
+Local HTTP server answering the `value:compute` requests of the Earth Engine REST API with the
+synthetic payloads of fake_ee.py, its latency and its failures, the latter as the 429 errors of
+the real API. Requests carry the expression graphs built by the real client, which fake_ee.py
+builds as well, and are computed for the algorithms listed in `fake_ee.FUNCTIONS`; other
+algorithms, and the other endpoints of the API, are not served. Point a collection to it to
+exercise the HTTP path of the clients offline:
+
+    import fake_ee
+    from fake_server import FakeEarthEngineServer
+    fake_ee.install(latency_s=0.05, failure_rate=0.1)
+    with FakeEarthEngineServer() as server:
+        collection = Collection('project', url=server.url)
+
+Or run it on its own:
+
+    $ python benchmarks/fake_server.py --port 8080 --latency 0.05 --failure_rate 0.1
+"""
+import re
+import json
+import argparse
+import threading
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import fake_ee
+
+COMPUTE_PATH = re.compile(r'/v1(alpha|beta)?/projects/[^/]+/value:compute')
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        path = urlsplit(self.path).path
+        if not COMPUTE_PATH.fullmatch(path):
+            self._reply(404, {'error': {'code': 404, 'message': f'Unknown path {path}', 'status': 'NOT_FOUND'}})
+            return
+        # {'expression': ..., 'workloadTag': ...}, the tag being ignored
+        expression = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['expression']
+        try:
+            fake_ee._request()
+        except fake_ee.EEException as e:
+            self._reply(429, {'error': {'code': 429, 'message': str(e), 'status': 'RESOURCE_EXHAUSTED'}})
+            return
+        try:
+            result = fake_ee.evaluate(expression)
+        except Exception as e:
+            self._reply(400, {'error': {'code': 400, 'message': str(e), 'status': 'INVALID_ARGUMENT'}})
+            return
+        self._reply(200, {'result': result})
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class FakeEarthEngineServer:
+    """
+    Threaded server answering on a free local port, from a background thread.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeEarthEngineServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'FakeEarthEngineServer':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Earth Engine API')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.05, help='Latency of the requests in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Maximum extra latency in seconds.')
+    parser.add_argument('--failure_rate', type=float, default=0.05, help='Probability of a request failing.')
+    parser.add_argument('--size', type=int, default=246, help='Side in pixels of the sampled rectangles.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    fake_ee.configure(args.latency, args.jitter, args.failure_rate, args.size, args.seed)
+    server = FakeEarthEngineServer(port=args.port)
+    print(f'Serving on {server.url}')
+    server.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Record the `value:compute` requests sent by the real earthengine-api client for the requests of
+the pipeline, answered offline by the local server of fake_server.py. The client is initialized
+with the algorithm list and discovery document bundled with earthengine-api for its own tests,
+so that neither credentials nor network are needed:
+
+    $ python benchmarks/record_expressions.py tests/data/ee_expressions.json
+
+tests/test_fake_server.py replays the recorded requests against the server, and checks that
+fake_ee.py sends the same ones.
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZE = 16   # Side of the sampled rectangles, that of the regions of the cases
+
+
+def inline(expression: dict) -> dict:
+    """
+    Expression graph with its references replaced by the nodes they point to, so that graphs
+    sharing their subexpressions differently compare equal.
+    """
+    values = expression['values']
+
+    def node(value):
+        if isinstance(value, list):
+            return [node(item) for item in value]
+        if not isinstance(value, dict) or 'constantValue' in value:
+            return value
+        if 'valueReference' in value:
+            return node(values[value['valueReference']])
+        if 'functionDefinitionValue' in value:
+            definition = value['functionDefinitionValue']
+            return {'functionDefinitionValue': {'argumentNames': definition['argumentNames'],
+                                                'body': node(values[definition['body']])}}
+        return {key: node(item) for key, item in value.items()}
+
+    return node(values[expression['result']])
+
+
+def run_cases(payloads: List[dict]) -> Dict[str, List[dict]]:
+    """
+    Run the requests of the pipeline with the installed `ee` module, its requests being appended
+    to `payloads` by the caller.
+
+    Returns:
+        Dict[str, List[dict]]: The requests of each case, in order.
+    """
+    from mangroves.collection import Collection
+    from mangroves.geometry import Region
+
+    region = Region(1.3, 103.9, SIZE)
+    collection = Collection('test', requests_per_second=1e6)
+    cases = {}
+
+    def case(name: str, run):
+        del payloads[:]
+        result = run()
+        cases[name] = list(payloads)
+        return result
+
+    patch = case('extract', lambda: collection.extract(region, 2020))
+    assert patch.shape == (64, SIZE, SIZE) and (np.linalg.norm(patch, axis=0) > 0.99).all()
+    assert case('is_available', lambda: collection.is_available(region, 2020))
+    stack, available = case('extract_years', lambda: collection.extract_years(region, [2019, 2020]))
+    assert available.all() and (np.linalg.norm(stack, axis=1) > 0.99).all()
+    values = case('sample_points', lambda: collection.sample_points([1.3, 1.3001, 85.], [103.9] * 3, 2020, max_workers=1))
+    assert not np.isnan(values[:2]).any() and np.isnan(values[2]).all()
+    index = case('build_footprints', lambda: collection.build_footprints([2020], page_size=10))
+    assert len(index.ids[2020]) == 1
+    # Two overlapping candidates, mosaicked
+    c = region.coords
+    index.add(2020, ['west', 'east'], [[c['xMin'] - 0.1, c['yMin'] - 0.1, c['xMax'] + 0.1, c['yMax'] + 0.1],
+                                       [c['xMax'] - 1e-4, c['yMin'] - 0.1, c['xMax'] + 0.2, c['yMax'] + 0.1]])
+    patch = case('extract_footprints', lambda: collection.extract(region, 2020))
+    assert (np.linalg.norm(patch, axis=0) > 0.99).all()
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record the requests of the real Earth Engine client')
+    parser.add_argument('output', help='JSON file of the recorded requests.')
+    args = parser.parse_args()
+
+    import ee
+    import httplib2
+    from ee import apitestcase, serializer, _cloud_api_utils, _state
+    import fake_ee
+    from fake_server import FakeEarthEngineServer
+
+    fake_ee.configure(size=SIZE)
+    with FakeEarthEngineServer() as server:
+        # Offline initialization, as done by the tests of earthengine-api, then requests sent to the server
+        ee.data._install_cloud_api_resource = lambda: None
+        ee.data.getAlgorithms = apitestcase.GetAlgorithms
+        ee.Initialize(None, '', project='test')
+        with open(os.path.join(os.path.dirname(apitestcase.__file__), 'tests', 'cloud_api_discovery_document.json')) as f:
+            document = json.load(f)
+        document['rootUrl'] = server.url + '/'
+        state = _state.get_state()
+        state.cloud_api_resource = _cloud_api_utils.build_cloud_resource_from_document(
+            document, http_transport=httplib2.Http())
+        ee.Authenticate = ee.Initialize = lambda *args, **kwargs: None
+
+        payloads = []
+        compute_value = ee.data.computeValue
+
+        def record(obj):
+            payloads.append(serializer.encode(obj, for_cloud_api=True))
+            return compute_value(obj)
+
+        ee.data.computeValue = record
+        cases = run_cases(payloads)
+
+    with open(args.output, 'w') as f:
+        json.dump(cases, f, indent=1)
+    print(f'Recorded {sum(len(requests) for requests in cases.values())} requests of {len(cases)} cases '
+          f'from earthengine-api {ee.__version__} into {args.output}')
+
+
+if __name__ == '__main__':
+    main()
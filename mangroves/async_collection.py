@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, Optional, Tuple
+import numpy as np
+from mangroves.geometry import Region
+from mangroves.collection import Collection
+from mangroves.embeddings import Embeddings
+from mangroves.constants import GEE_MAX_WORKERS, GEE_MAX_RETRIES, GEE_BACKOFF_S, REGION_DIAMETER_P, SPATIAL_RESOLUTION_M
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class AsyncCollection:
+    """
+    asyncio counterpart of a Collection.
+
+    The blocking Earth Engine requests of the collection run on a thread pool, awaited from the
+    event loop, and a semaphore caps the number of requests in flight. Each site goes through two
+    requests, the lookup of its image then the download of its pixels, and sites are processed
+    concurrently so that the lookups of the next sites overlap the downloads of the previous ones.
+
+    The rate limiter and footprint index of the wrapped collection still apply. For tests,
+    build the collection with `url` pointing to the server of benchmarks/fake_server.py, which
+    computes the `value:compute` requests of the few algorithms used here.
+    """
+
+    def __init__(
+            self,
+            collection: Collection,
+            max_in_flight: int = GEE_MAX_WORKERS,
+            max_retries: int = GEE_MAX_RETRIES,
+            backoff_s: float = GEE_BACKOFF_S,
+            executor: Optional[ThreadPoolExecutor] = None) -> None:
+        """
+        Args:
+            collection (Collection): The collection issuing the requests.
+            max_in_flight (int, optional): Maximum number of requests in flight.
+            max_retries (int, optional): Number of retries of a failed request.
+            backoff_s (float, optional): Delay before the first retry, doubled on every retry.
+            executor (ThreadPoolExecutor, optional): Pool running the requests, one of `max_in_flight`
+                threads is created by default.
+        """
+        self.collection = collection
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=max_in_flight)
+        self._loop = None
+        self._semaphore = None
+
+    def __getattr__(self, name: str):
+        return getattr(self.collection, name)
+
+    async def _run(self, func, *args):
+        """
+        Run a blocking request on the thread pool, retrying with exponential backoff and jitter.
+        The slot of a request is released while it waits for a retry.
+        """
+        # The semaphore is bound to the event loop that uses it
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.max_in_flight)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    return await loop.run_in_executor(self.executor, func, *args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_s * 2 ** attempt * (1 + random.random())
+                logger.warning(f'Attempt {attempt + 1} of {func.__name__} failed, retrying in {delay:.1f}s: {e}')
+                await asyncio.sleep(delay)
+
+    async def fetch_image_from_region_in_collection(
+            self,
+            region: Region,
+            year: int):
+        return await self._run(self.collection.fetch_image_from_region_in_collection, region, year)
+
+    async def sample_image(
+            self,
+            image,
+            region: Region,
+            year: int) -> Optional[np.ndarray]:
+        return await self._run(self.collection.sample_image, image, region, year)
+
+    async def extract(
+            self,
+            region: Region,
+            year: int) -> Optional[np.ndarray]:
+        """
+        Extract the embedding patch for the specified region and year.
+
+        Returns:
+            np.ndarray or None: The extracted patch, or None if extraction fails.
+        """
+        try:
+            image = await self.fetch_image_from_region_in_collection(region, year)
+            if image is None:
+                logger.warning('No image found for the specified region')
+                return None
+            return await self.sample_image(image, region, year)
+        except Exception as e:
+            logger.error(f'Error extracting patch for ({region.lat0_deg:.4f}, {region.lon0_deg:.4f}) '
+                         f'in year {year}: {e}')
+            return None
+
+    async def _embeddings(
+            self,
+            latitude_deg: float,
+            longitude_deg: float,
+            year: int,
+            regionDiameter_p: int,
+            spatialResolution_m: float) -> Embeddings:
+        embeddings = Embeddings()
+        embeddings.from_patch(latitude_deg, longitude_deg, year, regionDiameter_p, spatialResolution_m, None)
+        embeddings.data = await self.extract(embeddings.region, year)
+        return embeddings
+
+    async def embeddings(
+            self,
+            sites: Iterable[Tuple[float, float, int]],
+            regionDiameter_p: int = REGION_DIAMETER_P,
+            spatialResolution_m: float = SPATIAL_RESOLUTION_M) -> AsyncIterator[Embeddings]:
+        """
+        Extract the embeddings of many sites concurrently.
+
+        Sites are consumed lazily, so that at most twice `max_in_flight` of them are pending.
+
+        Args:
+            sites (Iterable[Tuple[float, float, int]]): The latitude, longitude and year of each site.
+            regionDiameter_p (int, optional): Size of the patches in pixels.
+            spatialResolution_m (float, optional): Size of the pixels in meters.
+        Yields:
+            Embeddings: The embeddings of each site in completion order, with `data` None if extraction failed.
+        """
+        sites = iter(sites)
+        pending = set()
+
+        def submit(n: int) -> None:
+            while len(pending) < n:
+                site = next(sites, None)
+                if site is None:
+                    return
+                latitude_deg, longitude_deg, year = site
+                pending.add(asyncio.ensure_future(
+                    self._embeddings(latitude_deg, longitude_deg, int(year), regionDiameter_p, spatialResolution_m)
+                ))
+
+        try:
+            submit(2 * self.max_in_flight)
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    yield task.result()
+                submit(2 * self.max_in_flight)
+        finally:
+            for task in pending:
+                task.cancel()
+            # Let the cancelled tasks finish, or they are destroyed pending when the loop closes
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
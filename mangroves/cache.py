@@ -0,0 +1,289 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from mangroves import profiling, quantization
+from mangroves.geometry import Region
+from mangroves.collection import Collection
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class PatchCache:
+    """
+    Content-addressed on-disk cache of embedding patches.
+
+    Each patch is stored once as a compressed `.npz` file named after the hash of its bounding
+    box, year, band list and data type, quantized band by band as in the `.emb` format. Regions
+    without data are stored as well, as empty files, so that they are not requested again. The
+    cache is bounded in size and evicts the least recently used patches first, using file
+    modification times to persist the recency across runs.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            max_bytes: int = 64 * 1024 ** 3,
+            dtype: str = 'float16') -> None:
+        """
+        Args:
+            path (str): Directory where the patches are stored.
+            max_bytes (int, optional): Maximum size of the cache on disk, in bytes.
+            dtype (str, optional): 'int8', 'float16' or 'float32', the data type of the stored patches.
+        """
+        assert dtype in quantization.DTYPES, f'dtype must be one of {list(quantization.DTYPES)}.'
+        self.path = Path(os.path.expanduser(path))
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._size = 0
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._scan()
+
+    def _scan(self) -> None:
+        """
+        Rebuild the LRU order from the files already present in the cache directory.
+        """
+        files = [(f.stat().st_mtime, f.stem, f.stat().st_size) for f in self.path.glob('*/*.npz')]
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+        logger.info(f'Patch cache at {self.path}: {len(self._entries)} patches, {self._size / 1024 ** 2:.1f} MB')
+
+    @staticmethod
+    def key(
+            region: Region,
+            year: int,
+            band_names: List[str],
+            dtype: np.dtype = np.float32) -> str:
+        """
+        Compute the content address of a patch.
+
+        Args:
+            region (Region): The region of the patch.
+            year (int): The year of the patch.
+            band_names (List[str]): The bands of the patch.
+            dtype (np.dtype, optional): The data type of the patch.
+        Returns:
+            str: The hexadecimal SHA-1 digest identifying the patch.
+        """
+        payload = {
+            'bbox': [round(float(region.coords[k]), 7) for k in ('xMin', 'yMin', 'xMax', 'yMax')],
+            'nPixels': int(region.nPixels),
+            'year': int(year),
+            'bands': list(band_names),
+            'dtype': np.dtype(dtype).name,
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f'{key}.npz'
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Load a patch from the cache.
+
+        Args:
+            key (str): The content address of the patch.
+        Returns:
+            np.ndarray or None: The float32 patch, or None on a cache miss or for a region without data.
+        """
+        return self.lookup(key)[1]
+
+    def lookup(self, key: str) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Load a patch from the cache, telling cache misses from regions without data.
+
+        Args:
+            key (str): The content address of the patch.
+        Returns:
+            Tuple[bool, np.ndarray or None]: Whether the key is cached, and its float32 patch, None
+                for a region without data.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                profiling.count('cache.misses')
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        profiling.count('cache.hits')
+
+        file = self._file(key)
+        try:
+            with np.load(file) as data:
+                patch = quantization.dequantize(data['q'], data['scale'], data['offset']) if 'q' in data else None
+            os.utime(file)
+            return True, patch
+        except Exception as e:
+            logger.warning(f'Corrupted cache entry {file}, discarding it: {e}')
+            self._remove(key)
+            return False, None
+
+    def put(
+            self,
+            key: str,
+            patch: Optional[np.ndarray]) -> None:
+        """
+        Store a patch in the cache, evicting the least recently used patches if needed.
+
+        Args:
+            key (str): The content address of the patch.
+            patch (np.ndarray or None): The (D, H, W) patch to store, or None for a region without data.
+        """
+        file = self._file(key)
+        file.parent.mkdir(exist_ok=True)
+        tmp = file.with_name(f'{file.stem}.{threading.get_ident()}.tmp')
+        with open(tmp, 'wb') as f:
+            if patch is None:
+                np.savez(f)
+            else:
+                q, scale, offset = quantization.quantize(np.asarray(patch), self.dtype)
+                np.savez_compressed(f, q=q, scale=scale, offset=offset)
+        os.replace(tmp, file)  # Atomic, a crash never leaves a truncated patch behind
+        size = file.stat().st_size
+
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            evicted = []
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            self._file(old_key).unlink(missing_ok=True)
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+        self._file(key).unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: The hit, miss and eviction counters, and the current size of the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'patches': len(self._entries),
+            'bytes': self._size,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CachedCollection:
+    """
+    Wrapper around a Collection that serves patches from a PatchCache when possible and
+    only contacts Google Earth Engine on cache misses. Regions without data are cached too,
+    requests that fail are not.
+    """
+
+    def __init__(
+            self,
+            collection: Collection,
+            cache: PatchCache) -> None:
+        """
+        Args:
+            collection (Collection): The collection used on cache misses.
+            cache (PatchCache): The cache of patches.
+        """
+        self.collection = collection
+        self.cache = cache
+
+    def __getattr__(self, name: str):
+        return getattr(self.collection, name)
+
+    def extract(
+            self,
+            region: Region,
+            year: int) -> Optional[np.ndarray]:
+        """
+        Extract the embedding patch for the specified region and year, from the cache if possible.
+
+        Args:
+            region (Region): The region to extract the patch from.
+            year (int): The year for which to extract the patch.
+        Returns:
+            np.ndarray or None: The extracted patch, or None if extraction fails.
+        """
+        key = self.cache.key(region, year, self.collection.band_names, self.collection.dtype)
+        cached, patch = self.cache.lookup(key)
+        if cached:
+            return self._cast(patch)
+        try:
+            patch = self.collection._extract(region, year)
+        except Exception as e:
+            logger.error(f'Error extracting patch for \
+                         ({region.lat0_deg:.4f}, {region.lon0_deg:.4f}) in year {year}: {e}')
+            return None
+        self.cache.put(key, patch)
+        return patch
+
+    def _cast(self, patch: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        return None if patch is None else patch.astype(self.collection.dtype, copy=False)
+
+    def extract_many(
+            self,
+            regions: Iterable[Region],
+            year: int,
+            batch_size: int = 256,
+            **kwargs) -> Iterator[Tuple[Region, Optional[np.ndarray]]]:
+        """
+        Extract the embedding patches of many regions. Regions are consumed lazily in batches:
+        the cache hits of a batch are yielded first, its misses are then fetched concurrently
+        with Collection.extract_many.
+
+        Args:
+            regions (Iterable[Region]): The regions to extract the patches from.
+            year (int): The year for which to extract the patches.
+            batch_size (int, optional): Number of regions looked up in the cache at once, bounding
+                the regions held in memory.
+            **kwargs: Additional arguments of Collection.extract_many.
+        Yields:
+            Tuple[Region, np.ndarray or None]: Each region with its patch.
+        """
+        regions = iter(regions)
+        while True:
+            batch = list(islice(regions, batch_size))
+            if len(batch) == 0:
+                return
+            misses = []
+            for region in batch:
+                key = self.cache.key(region, year, self.collection.band_names, self.collection.dtype)
+                cached, patch = self.cache.lookup(key)
+                if cached:
+                    yield region, self._cast(patch)
+                else:
+                    misses.append((region, key))
+
+            if len(misses) == 0:
+                continue
+            logger.info(f'Fetching {len(misses)} patches missing from the cache')
+            keys = {id(region): key for region, key in misses}
+            failed = object()
+            for region, patch in self.collection.extract_many([region for region, _ in misses], year,
+                                                              on_failure=failed, **kwargs):
+                if patch is failed:
+                    yield region, None
+                    continue
+                self.cache.put(keys[id(region)], patch)
+                yield region, patch
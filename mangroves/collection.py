@@ -1,19 +1,132 @@
 import ee
 import numpy as np
 import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from mangroves import profiling
 from mangroves.geometry import Region
+from mangroves.footprints import FootprintIndex
+from mangroves.utils import utm_epsg, get_transformer
+from mangroves.constants import (EMBEDDING_COLLECTION, GEE_MAX_WORKERS, GEE_REQUESTS_PER_SECOND, GEE_MAX_RETRIES,
+                                 GEE_BACKOFF_S, GEE_POINTS_PER_REQUEST, SPATIAL_RESOLUTION_M)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+def assemble_patch(
+        properties: Dict[str, List[List[float]]],
+        band_names: List[str],
+        target_size: int,
+        dtype: np.dtype = np.float32) -> Optional[np.ndarray]:
+    """
+    Assemble the bands returned by sampleRectangle into a single D×H×W patch.
+
+    Each band is center cropped if larger than the target size, zero padded at the bottom
+    and right if smaller, then flipped upside down for correct display. Bands are written
+    in place into one preallocated buffer, missing bands are left to zero.
+
+    Args:
+        properties (Dict[str, List[List[float]]]): The band arrays returned by sampleRectangle.
+        band_names (List[str]): The bands to assemble, in order.
+        target_size (int): The height and width of the patch in pixels.
+        dtype (np.dtype, optional): The data type of the patch.
+    Returns:
+        np.ndarray or None: The patch, or None if none of the bands is available.
+    Raises:
+        ValueError: If a band is not a 2-D array of at least half the target size, e.g. an image
+            sampled in its default projection instead of the 10 m one.
+    """
+    patch = None
+    for i, band_name in enumerate(band_names):
+        if band_name not in properties:
+            continue
+        band_array = np.asarray(properties[band_name], dtype=dtype)
+        if band_array.ndim != 2 or min(band_array.shape) < target_size / 2:
+            raise ValueError(f'Band {band_name} of shape {band_array.shape} does not fit a '
+                             f'{target_size}x{target_size} patch.')
+        if patch is None:
+            patch = np.zeros((len(band_names), target_size, target_size), dtype=dtype)
+
+        # Center crop if larger, the remaining rows and columns are left to zero
+        h, w = band_array.shape
+        start_h, start_w = max(0, (h - target_size) // 2), max(0, (w - target_size) // 2)
+        h, w = min(h, target_size), min(w, target_size)
+
+        # Flipud for correct display, so padding ends up at the top
+        patch[i, target_size - h:, :w] = band_array[start_h:start_h + h, start_w:start_w + w][::-1]
+    return patch
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by all the threads issuing GEE requests.
+    """
+
+    def __init__(
+            self, 
+            rate: float, 
+            burst: int = 1) -> None:
+        """
+        Args:
+            rate (float): Number of tokens added to the bucket per second.
+            burst (int, optional): Capacity of the bucket, i.e. the number of requests
+                that can be issued back to back after an idle period.
+        """
+        assert rate > 0, 'The rate must be strictly positive.'
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Block until a token is available, then consume it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
 class Collection:
 
     def __init__(
             self, 
-            project: str) -> None:
+            project: str,
+            requests_per_second: float = GEE_REQUESTS_PER_SECOND,
+            burst: int = GEE_MAX_WORKERS,
+            footprint_index: Optional[FootprintIndex] = None,
+            dtype: np.dtype = np.float32,
+            url: Optional[str] = None) -> None:
+        """
+        Args:
+            project (str): The GEE project ID.
+            requests_per_second (float, optional): Maximum sustained rate of GEE requests.
+            burst (int, optional): Maximum number of requests issued back to back.
+            footprint_index (FootprintIndex, optional): Local index of the image footprints. The years
+                it covers are resolved without any availability request to GEE.
+            dtype (np.dtype, optional): The data type of the extracted patches.
+            url (str, optional): Base URL of the Earth Engine API, e.g. a local stand-in server for tests.
+        """
         self.project = project
+        self.url = url
         self.band_names = [f'A{i:02d}' for i in range(64)]
+        self.rate_limiter = RateLimiter(requests_per_second, burst)
+        self.footprint_index = footprint_index
+        self.dtype = dtype
+        self._year_collections = {}
         self._initialize_gee()
 
     def _initialize_gee(self) -> bool:
@@ -27,13 +140,45 @@ class Collection:
         """
         try:
             ee.Authenticate()
-            ee.Initialize(project=self.project)
+            ee.Initialize(project=self.project, url=self.url)
             logger.info('Google Earth Engine initialized successfully with service account')
             return True
         except Exception as e:
             logger.error(f'Failed to initialize GEE: {e}')
             return False
 
+    def _get_info(self, obj):
+        """
+        Run a blocking getInfo() request once the rate limiter allows it.
+
+        Args:
+            obj: Any Earth Engine computed object.
+        Returns:
+            The client-side value of the object.
+        """
+        with profiling.timer('gee.rate_limit_wait'):
+            self.rate_limiter.acquire()
+        profiling.count('gee.requests')
+        with profiling.timer('gee.get_info'):
+            return obj.getInfo()
+
+    def build_footprints(
+            self,
+            years: Iterable[int],
+            page_size: int = 1000) -> FootprintIndex:
+        """
+        List the image footprints of years into the footprint index of the collection, created if
+        needed, with requests paced by the rate limiter.
+
+        Returns:
+            FootprintIndex: The footprint index of the collection.
+        """
+        if self.footprint_index is None:
+            self.footprint_index = FootprintIndex()
+        for year in years:
+            self.footprint_index.build(year, page_size, self._get_info)
+        return self.footprint_index
+
     def fetch_image_from_region_in_collection(
             self, 
             region: Region, 
@@ -46,14 +191,27 @@ class Collection:
             region (Region): The region to fetch the image from.
             year (int): The year for which to fetch the image.
         Returns:
-            ee.Image or None: The first image if available, else None.
+            ee.Image or None: The first image if available, or the mosaic of the images of the
+                footprint index intersecting the region, else None.
         """
-        embedding_collection = ee.ImageCollection('GOOGLE/SATELLITE_EMBEDDING/V1/ANNUAL')
-        filtered_collection = embedding_collection.filterBounds(region.region).filterDate(
-            f'{year}-01-01', f'{year+1}-01-01'
-        )
+        if self.footprint_index is not None and self.footprint_index.has_year(year):
+            image_ids = self.footprint_index.lookup(region, year)
+            if len(image_ids) == 0:
+                return None
+            images = [ee.Image(f'{EMBEDDING_COLLECTION}/{image_id}') for image_id in image_ids]
+            if len(images) == 1:
+                return images[0]
+            # The bounding boxes of neighbouring UTM tiles overlap, so the best candidate may not cover
+            # the whole region. All are mosaicked, the best on top, in the projection of the latter
+            return ee.ImageCollection(images[::-1]).mosaic().setDefaultProjection(images[0].projection())
+
+        if year not in self._year_collections:
+            self._year_collections[year] = ee.ImageCollection(EMBEDDING_COLLECTION).filterDate(
+                f'{year}-01-01', f'{year+1}-01-01'
+            )
+        filtered_collection = self._year_collections[year].filterBounds(region.region)
 
-        count = filtered_collection.size().getInfo()
+        count = self._get_info(filtered_collection.size())
         logger.info(f'Filtered images for {year}: {count}')
             
         if count > 0:
@@ -74,11 +232,14 @@ class Collection:
         Returns:
             bool: True if data is available, False otherwise.
         """
+        if self.footprint_index is not None and self.footprint_index.has_year(year):
+            return len(self.footprint_index.lookup(region, year)) > 0
+
         try:
-            image = self.fetch_image_from_region_in_collection(region.region, year)
+            image = self.fetch_image_from_region_in_collection(region, year)
             
             if image is not None:
-                image_info = image.getInfo()
+                image_info = self._get_info(image)
                 logger.info(f'Image properties: {list(image_info.keys())}')
                 
                 # Check band names
@@ -109,86 +270,359 @@ class Collection:
             np.ndarray or None: The extracted patch, or None if extraction fails.
         """
         try:
-            image = self.fetch_image_from_region_in_collection(region, year)
-            if image is None:
-                logger.warning('No image found for the specified region')
-                return None
-            
-            # Sample the image using sampleRectangle with timeout
-            pixel_data = image.sampleRectangle(
-                region=region.region,
-                defaultValue=0,
-                properties=[]
-            )
-            
-            # Get the values with timeout
-            pixel_dict = pixel_data.getInfo()
-            if not pixel_dict or 'properties' not in pixel_dict:
-                logger.warning(f'No data found for point \
-                               ({region.latitude_deg:.4f}, {region.longitude_deg:.4f}) in year {year}')
-                return None
-            
-            # Extract embedding bands data
-            properties = pixel_dict['properties']
-            bands_data = {}
-            target_size = int(region.nPixels)
-
-            for i in range(64):
-                band_name = f'A{i:02d}'
-                if band_name in properties:
-                    band_array = np.array(properties[band_name])
-                    
-                    # Crop or pad to target size
-                    h, w = band_array.shape
-                    
-                    # Center crop if larger
-                    if h > target_size:
-                        start_h = (h - target_size) // 2
-                        band_array = band_array[start_h:start_h+target_size, :]
-                    if w > target_size:
-                        start_w = (w - target_size) // 2
-                        band_array = band_array[:, start_w:start_w+target_size]
-                        
-                    # Pad if smaller
-                    h, w = band_array.shape
-                    if h < target_size or w < target_size:
-                        pad_h = max(0, target_size - h)
-                        pad_w = max(0, target_size - w)
-                        band_array = np.pad(band_array, ((0, pad_h), (0, pad_w)), mode='constant', constant_values=0)
-
-                    # Apply flipud for correct display
-                    band_array = np.flipud(band_array)
-                    bands_data[band_name] = band_array
-            
-            if len(bands_data) == 0:
-                logger.warning(f'No embedding bands found for point \
-                               ({region.latitude_deg:.4f}, {region.longitude_deg:.4f}) in year {year}')
-                return None
-            
-            logger.info(f'Successfully extracted {len(bands_data)} bands')
-            
-            # Stack all 64 bands into a 64×H×W array
-            image_stack = []
-            
-            for band_name in self.band_names:
-                if band_name in bands_data:
-                    image_stack.append(bands_data[band_name])
-                else:
-                    # Fill missing bands with zeros
-                    if bands_data:
-                        image_shape = list(bands_data.values())[0].shape
-                        image_stack.append(np.zeros(image_shape))
-                    else:
-                        return None
-            
-            # Stack to create D*H*W array
-            patch = np.stack(image_stack, axis=0)
-            
-            logger.info(f'Successfully created patch with shape: {patch.shape}')
-            return patch
-        
+            return self._extract(region, year)
         except Exception as e:
             logger.error(f'Error extracting patch for \
-                         ({region.latitude_deg:.4f}, {region.longitude_deg:.4f}) in year {year}: {e}')
+                         ({region.lat0_deg:.4f}, {region.lon0_deg:.4f}) in year {year}: {e}')
             return None
-        
\ No newline at end of file
+
+    def extract_many(
+            self,
+            regions: Iterable[Region],
+            year: int,
+            max_workers: int = GEE_MAX_WORKERS,
+            max_retries: int = GEE_MAX_RETRIES,
+            backoff_s: float = GEE_BACKOFF_S,
+            on_failure=None) -> Iterator[Tuple[Region, Optional[np.ndarray]]]:
+        """
+        Extract the embedding patches of many regions concurrently.
+
+        Requests run on a pool of worker threads and are paced by the rate limiter of
+        the collection. Failed requests are retried with exponential backoff. Regions
+        are consumed lazily, so that at most twice `max_workers` of them are in flight.
+
+        Args:
+            regions (Iterable[Region]): The regions to extract the patches from.
+            year (int): The year for which to extract the patches.
+            max_workers (int, optional): Number of worker threads.
+            max_retries (int, optional): Number of retries of a failed request.
+            backoff_s (float, optional): Delay before the first retry, doubled on every retry.
+            on_failure (optional): Value yielded for the regions whose requests still fail after all
+                the retries, None by default like the regions without data.
+        Yields:
+            Tuple[Region, np.ndarray or None]: Each region with its patch, in completion order.
+        """
+        regions = iter(regions)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = {}
+
+        def submit(batch: Iterable[Region]) -> None:
+            for region in batch:
+                future = executor.submit(self._extract_with_retry, region, year, max_retries, backoff_s, on_failure)
+                pending[future] = region
+
+        try:
+            submit(islice(regions, 2 * max_workers))
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    region = pending.pop(future)
+                    submit(islice(regions, 1))
+                    yield region, future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _extract_with_retry(
+            self,
+            region: Region,
+            year: int,
+            max_retries: int,
+            backoff_s: float,
+            on_failure=None) -> Optional[np.ndarray]:
+        """
+        Extract a patch, retrying with exponential backoff and jitter on failure.
+
+        Args:
+            region (Region): The region to extract the patch from.
+            year (int): The year for which to extract the patch.
+            max_retries (int): Number of retries of a failed request.
+            backoff_s (float): Delay before the first retry, doubled on every retry.
+            on_failure (optional): Value returned if all attempts fail.
+        Returns:
+            np.ndarray or None: The extracted patch, None if no data is available, or `on_failure`
+                if all attempts fail.
+        """
+        return self._retry(lambda: self._extract(region, year),
+                           f'patch for ({region.lat0_deg:.4f}, {region.lon0_deg:.4f}) in year {year}',
+                           max_retries, backoff_s, on_failure)
+
+    def _retry(
+            self,
+            request,
+            description: str,
+            max_retries: int,
+            backoff_s: float,
+            default=None):
+        """
+        Run a request, retrying with exponential backoff and jitter on failure.
+
+        Args:
+            request: Function running the request.
+            description (str): Description of the request for the logs.
+            max_retries (int): Number of retries of a failed request.
+            backoff_s (float): Delay before the first retry, doubled on every retry.
+            default (optional): Value returned if all attempts fail.
+        Returns:
+            The result of the request, or `default` if all attempts fail.
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return request()
+            except Exception as e:
+                profiling.count('gee.errors')
+                if attempt == max_retries:
+                    logger.error(f'Error extracting {description} after {attempt + 1} attempts: {e}')
+                    return default
+                delay = backoff_s * 2 ** attempt * (1 + random.random())
+                logger.warning(f'Attempt {attempt + 1} failed for {description}, retrying in {delay:.1f}s: {e}')
+                time.sleep(delay)
+
+    def _extract(
+            self, 
+            region: Region,
+            year: int) -> np.ndarray:
+        """
+        Extract the embedding patch for the specified region and year, letting
+        request errors propagate to the caller.
+
+        Args:
+            region (Region): The region to extract the patch from.
+            year (int): The year for which to extract the patch.
+        Returns:
+            np.ndarray or None: The extracted patch, or None if no data is available.
+        """
+        image = self.fetch_image_from_region_in_collection(region, year)
+        if image is None:
+            logger.warning('No image found for the specified region')
+            return None
+        return self.sample_image(image, region, year)
+
+    def sample_image(
+            self,
+            image: ee.Image,
+            region: Region,
+            year: int) -> np.ndarray:
+        """
+        Download the pixels of an image over a region and assemble them into a patch.
+
+        Args:
+            image (ee.Image): The image returned by fetch_image_from_region_in_collection.
+            region (Region): The region to extract the patch from.
+            year (int): The year of the image.
+        Returns:
+            np.ndarray or None: The extracted patch, or None if no data is available.
+        """
+        # Sample the image using sampleRectangle with timeout
+        pixel_data = image.sampleRectangle(
+            region=region.region,
+            defaultValue=0,
+            properties=[]
+        )
+        
+        # Get the values with timeout
+        pixel_dict = self._get_info(pixel_data)
+        if not pixel_dict or 'properties' not in pixel_dict:
+            logger.warning(f'No data found for point \
+                           ({region.lat0_deg:.4f}, {region.lon0_deg:.4f}) in year {year}')
+            return None
+        
+        with profiling.timer('collection.assemble_patch'):
+            patch = assemble_patch(pixel_dict['properties'], self.band_names, int(region.nPixels), self.dtype)
+        if patch is None:
+            logger.warning(f'No embedding bands found for point \
+                           ({region.lat0_deg:.4f}, {region.lon0_deg:.4f}) in year {year}')
+            return None
+
+        profiling.count('collection.patch_bytes', patch.nbytes)
+        logger.info(f'Successfully created patch with shape: {patch.shape}')
+        return patch
+
+    def year_mosaic(
+            self,
+            region: Region,
+            year: int) -> ee.Image:
+        """
+        Mosaic of the images of a year over a region, with bands renamed `<year>_<band>`.
+        Years without any image give a fully masked image instead of an error.
+        """
+        epsg = utm_epsg(region.lat0_deg, region.lon0_deg)
+        return self._mosaic(region.region, year, epsg).rename([f'{year}_{band}' for band in self.band_names])
+
+    @staticmethod
+    def utm_projection(epsg: int) -> ee.Projection:
+        """
+        Projection of the AlphaEarth images of a UTM zone: 10 m pixels with edges on multiples of 10 m.
+        """
+        return ee.Projection(f'EPSG:{epsg}').atScale(SPATIAL_RESOLUTION_M)
+
+    def _mosaic(
+            self,
+            geometry,
+            year: int,
+            epsg: int) -> ee.Image:
+        """
+        Mosaic of the images of a year over a geometry, in the 10 m projection of a UTM zone. Mosaics
+        default to WGS84 at 1 degree, in which a patch would be sampled as a single pixel.
+        """
+        empty = ee.Image.constant([0] * len(self.band_names)).toFloat().rename(self.band_names).updateMask(0)
+        images = ee.ImageCollection(EMBEDDING_COLLECTION).filterDate(
+            f'{year}-01-01', f'{year+1}-01-01'
+        ).filterBounds(geometry)
+        return ee.ImageCollection([empty]).merge(images).mosaic().setDefaultProjection(self.utm_projection(epsg))
+
+    def extract_years(
+            self,
+            region: Region,
+            years: Iterable[int],
+            years_per_request: Optional[int] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Extract the embedding patches of a region for several years at once, as a T×D×H×W stack.
+
+        The mosaics of all the years are concatenated into a single image sampled in one request,
+        instead of one availability request and one download per year. Payloads grow with the
+        number of years, `years_per_request` bounds them if GEE rejects the request.
+
+        Args:
+            region (Region): The region to extract the patches from.
+            years (Iterable[int]): The years to extract, in the order of the stack.
+            years_per_request (int, optional): Maximum number of years sampled per request, all by default.
+        Returns:
+            Tuple[np.ndarray, np.ndarray] or None: The stack, zero for years without data, and the
+                boolean availability of each year, or None if extraction fails.
+        """
+        try:
+            return self._extract_years(region, list(years), years_per_request)
+        except Exception as e:
+            logger.error(f'Error extracting the patches of ({region.lat0_deg:.4f}, {region.lon0_deg:.4f}) '
+                         f'for years {list(years)}: {e}')
+            return None
+
+    def _extract_years(
+            self,
+            region: Region,
+            years: List[int],
+            years_per_request: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Extract a stack of patches, letting request errors propagate to the caller.
+        """
+        size = int(region.nPixels)
+        stack = np.zeros((len(years), len(self.band_names), size, size), dtype=self.dtype)
+        step = years_per_request or len(years)
+        for start in range(0, len(years), step):
+            batch = years[start:start + step]
+            image = ee.Image.cat([self.year_mosaic(region, year) for year in batch])
+            pixel_dict = self._get_info(image.sampleRectangle(region=region.region, defaultValue=0, properties=[]))
+            if not pixel_dict or 'properties' not in pixel_dict:
+                continue
+            band_names = [f'{year}_{band}' for year in batch for band in self.band_names]
+            with profiling.timer('collection.assemble_patch'):
+                patch = assemble_patch(pixel_dict['properties'], band_names, size, self.dtype)
+            if patch is not None:
+                stack[start:start + len(batch)] = patch.reshape(len(batch), len(self.band_names), size, size)
+        profiling.count('collection.patch_bytes', stack.nbytes)
+        # Masked pixels are sampled as zeros, unit-length embeddings never are
+        available = stack.reshape(len(years), -1).any(axis=1)
+        logger.info(f'Extracted a stack of {available.sum()}/{len(years)} years with shape {stack.shape}')
+        return stack, available
+
+    def sample_points(
+            self,
+            lats: Iterable[float],
+            lons: Iterable[float],
+            year: int,
+            points_per_request: int = GEE_POINTS_PER_REQUEST,
+            max_workers: int = GEE_MAX_WORKERS,
+            max_retries: int = GEE_MAX_RETRIES,
+            backoff_s: float = GEE_BACKOFF_S) -> np.ndarray:
+        """
+        Sample the embeddings of single pixels, without downloading whole patches.
+
+        Points falling in the same 10 m pixel are sampled once. The remaining points are sent as
+        FeatureCollections to sampleRegions on the mosaic of the year, in concurrent chunks of
+        `points_per_request` points paced by the rate limiter and retried on failure.
+
+        Args:
+            lats (Iterable[float]): Latitudes of the points in degrees.
+            lons (Iterable[float]): Longitudes of the points in degrees.
+            year (int): The year of the embeddings.
+            points_per_request (int, optional): Number of points per request.
+            max_workers (int, optional): Number of concurrent requests.
+            max_retries (int, optional): Number of retries of a failed request.
+            backoff_s (float, optional): Delay before the first retry, doubled on every retry.
+        Returns:
+            np.ndarray: The N×64 embeddings of the points, NaN where there is no data or the request failed.
+        """
+        lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+        pixels = self._utm_pixels(lats, lons)
+        # Sorted by UTM zone first, so that every chunk is sampled in the projection of a single zone
+        _, first, inverse = np.unique(pixels, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        logger.info(f'Sampling {len(first)} distinct pixels for {len(lats)} points in year {year}')
+
+        values = np.full((len(first), len(self.band_names)), np.nan, dtype=np.float32)
+        epsg = pixels[first, 0]
+        zones = np.flatnonzero(np.r_[True, epsg[1:] != epsg[:-1], True])
+        chunks = [np.arange(start, min(start + points_per_request, stop))
+                  for zone_start, stop in zip(zones[:-1], zones[1:])
+                  for start in range(zone_start, stop, points_per_request)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self._retry,
+                    lambda c=chunk: self._sample_chunk(lats[first[c]], lons[first[c]], year, int(epsg[c[0]])),
+                    f'{len(chunk)} points in year {year}', max_retries, backoff_s)
+                for chunk in chunks
+            ]
+            for chunk, future in zip(chunks, futures):
+                result = future.result()
+                if result is not None:
+                    values[chunk] = result
+        return values[inverse]
+
+    @staticmethod
+    def _utm_pixels(
+            lats: np.ndarray,
+            lons: np.ndarray) -> np.ndarray:
+        """
+        N×3 UTM zone, column and row of the 10 m pixel of each point, on the grid of the images,
+        which are in the UTM zone of their tile with pixel edges on multiples of 10 m.
+        """
+        epsg = utm_epsg(lats, lons)
+        pixels = np.empty((len(lats), 3), dtype=np.int64)
+        pixels[:, 0] = epsg
+        for code in np.unique(epsg):
+            points = epsg == code
+            x, y = get_transformer('EPSG:4326', f'EPSG:{code}').transform(lons[points], lats[points])
+            pixels[points, 1] = np.floor(np.asarray(x) / SPATIAL_RESOLUTION_M)
+            pixels[points, 2] = np.floor(np.asarray(y) / SPATIAL_RESOLUTION_M)
+        return pixels
+
+    def _sample_chunk(
+            self,
+            lats: np.ndarray,
+            lons: np.ndarray,
+            year: int,
+            epsg: int) -> np.ndarray:
+        """
+        Sample a chunk of points of a UTM zone in one sampleRegions request, letting request errors
+        propagate. Pixels are those of the 10 m grid of the zone, as deduplicated by `_utm_pixels`.
+
+        Returns:
+            np.ndarray: The embeddings of the points, NaN for the points without data, which
+                sampleRegions leaves out.
+        """
+        points = ee.FeatureCollection([
+            ee.Feature(ee.Geometry.Point([float(lon), float(lat)]), {'i': i})
+            for i, (lat, lon) in enumerate(zip(lats, lons))
+        ])
+        samples = self._mosaic(points.geometry(), year, epsg).sampleRegions(
+            collection=points, properties=['i'], scale=SPATIAL_RESOLUTION_M,
+            projection=self.utm_projection(epsg), geometries=False)
+        features = self._get_info(samples)['features']
+
+        values = np.full((len(lats), len(self.band_names)), np.nan, dtype=np.float32)
+        for feature in features:
+            properties = feature['properties']
+            values[properties['i']] = [properties.get(band, np.nan) for band in self.band_names]
+        profiling.count('gee.sampled_points', len(features))
+        return values
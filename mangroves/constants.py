@@ -6,8 +6,20 @@ REGION_DIAMETER_P = 244.    # 244x244 pixels
 
 N_BANDS = 64
 
+EMBEDDING_COLLECTION = 'GOOGLE/SATELLITE_EMBEDDING/V1/ANNUAL'
+
 BANDS = [f'A{i:02d}' for i in range(N_BANDS)]
 
 S2_BANDS = ['B1', 'B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B8', 'B8A', 'B9', 'B11', 'B12', 'AOT', 'WVP', 'SCL', 'TCI_R', 'TCI_G', 'TCI_B', 'MSK_CLDPRB', 'MSK_SNWPRB', 'QA10', 'QA20', 'QA60', 'MSK_CLASSI_OPAQUE', 'MSK_CLASSI_CIRRUS', 'MSK_CLASSI_SNOW_ICE']
 
 RGB_BANDS = ['B4', 'B3', 'B2']  # Red, Green, Blue
+
+GEE_MAX_WORKERS = 20    # Concurrent requests per client, half of the default GEE quota of 40
+
+GEE_REQUESTS_PER_SECOND = 10.   # Sustained request rate shared by all workers
+
+GEE_MAX_RETRIES = 3
+
+GEE_BACKOFF_S = 1.  # Initial backoff, doubled on every retry
+
+GEE_POINTS_PER_REQUEST = 1000  # Points sampled per sampleRegions request, well below the 5000 elements of getInfo
@@ -1,7 +1,11 @@
 import os
 import numpy as np
+import pandas as pd
 import logging
 from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from mangroves import profiling, quantization
 from mangroves.geometry import Region
 from mangroves.collection import Collection
 
@@ -18,7 +22,8 @@ class Embeddings:
         self.regionDiameter_p = None
         self.spatialResolution_m = None
         self.region = None
-        self.data = None
+        self._data = None
+        self._source = None
         self.band_names = None
 
     def _verify_year(self) -> bool:
@@ -46,6 +51,25 @@ class Embeddings:
         Returns:
             None
         """
+        self.from_patch(latitude_deg, longitude_deg, year, regionDiameter_p, spatialResolution_m, None)
+        self.data = collection.extract(self.region, self.year)
+
+    def from_patch(
+            self,
+            latitude_deg: float,
+            longitude_deg: float,
+            year: int,
+            regionDiameter_p: int,
+            spatialResolution_m: int,
+            data: np.ndarray) -> None:
+        """
+        Set the embedding patch of a region from an already extracted array.
+
+        Args:
+            data (np.ndarray): The patch, or None if the extraction failed.
+        Returns:
+            None
+        """
         self.latitude_deg = latitude_deg
         self.longitude_deg = longitude_deg
         self.year = year
@@ -58,34 +82,113 @@ class Embeddings:
             regionDiameter_p
         )
 
-        self.data = collection.extract(self.region, self.year)
+        self.data = data
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        The embedding patch. Files opened with `lazy=True` are only read on first access.
+        """
+        if self._data is None and self._source is not None:
+            self._data = self._read_data(self._source)
+            self._source = None
+        return self._data
+
+    @data.setter
+    def data(self, data: np.ndarray) -> None:
+        self._data = data
+        self._source = None
+
+    @staticmethod
+    def read_metadata(input_path: str) -> dict:
+        """
+        Read the metadata of a patch file without reading its data. Members of an npz archive are
+        compressed separately, so only the small metadata members are decompressed.
+
+        Args:
+            input_path (str): Path to a `.npz` or `.emb` file.
+        Returns:
+            dict: feature_id, latitude_deg, longitude_deg, year, regionDiameter_p and spatialResolution_m.
+        """
+        keys = ['feature_id', 'latitude_deg', 'longitude_deg', 'year', 'regionDiameter_p', 'spatialResolution_m']
+        if quantization.is_compact(input_path):
+            header = quantization.read_header(input_path)
+            return {key: header[key] for key in keys}
+        with np.load(input_path) as npzfile:
+            return {key: npzfile[key].item() if key in npzfile else None for key in keys}
+
+    @staticmethod
+    def _read_data(input_path: str) -> np.ndarray:
+        if quantization.is_compact(input_path):
+            return quantization.read(input_path)
+        with np.load(input_path) as npzfile:
+            return npzfile['data']
 
     def from_file(
             self, 
-            input_path: str) -> None:
+            input_path: str,
+            lazy: bool = False) -> None:
+        """
+        Load a patch saved by `save`, in the npz or the compact `.emb` format.
+
+        Args:
+            input_path (str): Path of the file.
+            lazy (bool, optional): Only read the metadata, the data being read on first access
+                to `data`, memory-mapped for `.emb` files and decompressed once for `.npz` files.
+        Returns:
+            None
+        """
         try:
-            with np.load(input_path) as npzfile:
-                self.latitude_deg = npzfile['latitude_deg']
-                self.longitude_deg = npzfile['longitude_deg']
-                self.year = npzfile['year']
-                self.regionDiameter_p = npzfile['regionDiameter_p']
-                self.spatialResolution_m = npzfile['spatialResolution_m']
-                self.region = Region(
-                    self.latitude_deg, 
-                    self.longitude_deg, 
-                    self.regionDiameter_p, 
-                    self.spatialResolution_m
-                )
-                self.data = npzfile['data']
+            metadata = self.read_metadata(input_path)
+            self.latitude_deg = metadata['latitude_deg']
+            self.longitude_deg = metadata['longitude_deg']
+            self.year = metadata['year']
+            self.regionDiameter_p = metadata['regionDiameter_p']
+            self.spatialResolution_m = metadata['spatialResolution_m']
+            self.region = Region(
+                self.latitude_deg, 
+                self.longitude_deg, 
+                self.regionDiameter_p
+            )
+            if lazy:
+                self._data, self._source = None, input_path
+            else:
+                self.data = self._read_data(input_path)
         except Exception as e:
             logger.error(f'Error loading patch from {input_path}: {e}')
     
+    @profiling.timed('embeddings.save')
     def save(
             self, 
             output_path: str, 
-            feature_id: int) -> bool:
+            feature_id: int,
+            dtype: Optional[str] = None) -> bool:
+        """
+        Save the patch and its metadata.
+
+        Args:
+            output_path (str): Path of the file.
+            feature_id (int): Identifier of the sample.
+            dtype (str, optional): 'int8', 'float16' or 'float32' to write the compact `.emb` format,
+                with int8 quantized per band, instead of a compressed `.npz` file.
+        Returns:
+            bool: True if the patch is saved, False otherwise.
+        """
         try:
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+            if dtype is not None:
+                if not output_path.endswith(quantization.EXTENSION):
+                    output_path += quantization.EXTENSION
+                quantization.write(output_path, self.data, {
+                    'feature_id': feature_id,
+                    'latitude_deg': self.latitude_deg,
+                    'longitude_deg': self.longitude_deg,
+                    'regionDiameter_p': self.regionDiameter_p,
+                    'spatialResolution_m': self.spatialResolution_m,
+                    'year': self.year,
+                }, dtype)
+                return True
             
             # Create band names array (matching original format)
             band_names = [f'A{i:02d}' for i in range(64)]
@@ -107,4 +210,27 @@ class Embeddings:
         except Exception as e:
             logger.error(f'Error saving patch to {output_path}: {e}')
             return False
-        
\ No newline at end of file
+        
+
+def index_directory(
+        path: str,
+        pattern: str = '**/*') -> pd.DataFrame:
+    """
+    Build an index of the patch files of a directory from their metadata only.
+
+    Args:
+        path (str): Directory containing `.npz` and `.emb` files.
+        pattern (str, optional): Glob pattern of the files, relative to the directory.
+    Returns:
+        pd.DataFrame: The path and metadata of each file, unreadable files being skipped.
+    """
+    index = []
+    for file in sorted(Path(os.path.expanduser(path)).glob(pattern)):
+        if file.suffix not in ('.npz', quantization.EXTENSION):
+            continue
+        try:
+            index.append({'path': str(file), **Embeddings.read_metadata(file)})
+        except Exception as e:
+            logger.error(f'Error reading metadata of {file}: {e}')
+    logger.info(f'Indexed {len(index)} patch files in {path}')
+    return pd.DataFrame(index)
@@ -0,0 +1,127 @@
+import ee
+import os
+import logging
+import numpy as np
+from typing import Callable, List, Optional, Sequence
+from mangroves.geometry import Region
+from mangroves.constants import EMBEDDING_COLLECTION
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class FootprintIndex:
+    """
+    Local spatial index mapping a year and a bounding box to the IDs of the images of the
+    AlphaEarth collection covering it. Once built, availability checks need no GEE request.
+    """
+
+    def __init__(self) -> None:
+        self.ids = {}       # year -> (N,) array of image IDs
+        self.bounds = {}    # year -> (N, 4) array of xMin, yMin, xMax, yMax in degrees
+
+    def add(
+            self,
+            year: int,
+            ids: Sequence[str],
+            bounds: np.ndarray) -> None:
+        """
+        Register the footprints of the images of a year, e.g. from a prefetched listing.
+
+        Args:
+            year (int): The year of the images.
+            ids (Sequence[str]): The `system:index` of the images.
+            bounds (np.ndarray): The (N, 4) bounding boxes of the images as xMin, yMin, xMax, yMax.
+        """
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        assert len(ids) == len(bounds), 'There must be one bounding box per image ID.'
+        self.ids[int(year)] = np.asarray(ids, dtype=str)
+        self.bounds[int(year)] = bounds
+
+    def build(
+            self,
+            year: int,
+            page_size: int = 1000,
+            get_info: Optional[Callable] = None) -> None:
+        """
+        List the footprints of all the images of a year from Google Earth Engine.
+        This is done once per year, with one request per page of images.
+
+        Args:
+            year (int): The year of the images.
+            page_size (int, optional): Number of images listed per request.
+            get_info (Callable, optional): Function running the getInfo() requests, that of the
+                collection with Collection.build_footprints so that they go through its rate
+                limiter and profiling counters. A plain getInfo() by default.
+        """
+        get_info = get_info if get_info is not None else (lambda obj: obj.getInfo())
+        collection = ee.ImageCollection(EMBEDDING_COLLECTION).filterDate(f'{year}-01-01', f'{year+1}-01-01')
+        features = collection.map(
+            lambda image: ee.Feature(image.geometry().bounds(), {'id': image.get('system:index')})
+        )
+        count = get_info(collection.size())
+
+        ids, bounds = [], []
+        for offset in range(0, count, page_size):
+            for feature in get_info(features.toList(page_size, offset)):
+                ring = np.asarray(feature['geometry']['coordinates'][0])
+                ids.append(feature['properties']['id'])
+                bounds.append([ring[:, 0].min(), ring[:, 1].min(), ring[:, 0].max(), ring[:, 1].max()])
+
+        self.add(year, ids, np.asarray(bounds))
+        logger.info(f'Indexed {len(ids)} image footprints for {year}')
+
+    def has_year(self, year: int) -> bool:
+        return int(year) in self.ids
+
+    def lookup(
+            self,
+            region: Region,
+            year: int) -> List[str]:
+        """
+        Find the images of a year intersecting a region. Images whose bounding box fully
+        contains the region come first. The bounding boxes of UTM tiles overlap those of their
+        neighbours, so such an image may still not cover the region: Collection mosaics all of them.
+
+        Args:
+            region (Region): The region to look up.
+            year (int): The year of the images.
+        Returns:
+            List[str]: The IDs of the intersecting images, empty if there is none.
+        """
+        if not self.has_year(year):
+            return []
+        c = region.coords
+        bounds = self.bounds[int(year)]
+        intersects = (
+            (bounds[:, 0] <= c['xMax']) & (bounds[:, 2] >= c['xMin']) &
+            (bounds[:, 1] <= c['yMax']) & (bounds[:, 3] >= c['yMin'])
+        )
+        contains = (
+            (bounds[:, 0] <= c['xMin']) & (bounds[:, 2] >= c['xMax']) &
+            (bounds[:, 1] <= c['yMin']) & (bounds[:, 3] >= c['yMax'])
+        )
+        candidates = np.flatnonzero(intersects)
+        candidates = candidates[np.argsort(~contains[candidates], kind='stable')]
+        return self.ids[int(year)][candidates].tolist()
+
+    def save(self, output_path: str) -> None:
+        """
+        Save the index to a `.npz` file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        arrays = {}
+        for year in self.ids:
+            arrays[f'ids_{year}'] = self.ids[year]
+            arrays[f'bounds_{year}'] = self.bounds[year]
+        np.savez(output_path, **arrays)
+
+    def from_file(self, input_path: str) -> None:
+        """
+        Load the footprints saved with FootprintIndex.save.
+        """
+        with np.load(input_path) as npzfile:
+            for name in npzfile.files:
+                if name.startswith('ids_'):
+                    year = int(name[len('ids_'):])
+                    self.add(year, npzfile[name], npzfile[f'bounds_{year}'])
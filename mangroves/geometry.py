@@ -1,7 +1,7 @@
-import math
 import numpy as np
 import ee
 import logging
+from typing import Iterator, List, Tuple, Union
 
 from mangroves.constants import RADIUS_EARTH_M, SPATIAL_RESOLUTION_M
 
@@ -9,6 +9,42 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 
+def bounding_boxes(
+        lat_deg: np.ndarray,
+        lon_deg: np.ndarray,
+        nPixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the North, East, South and West points of the regions centered on the given
+    coordinates, following great circles from the centers.
+
+    Args:
+        lat_deg (np.ndarray): Latitudes of the centers in degrees, shape (N,).
+        lon_deg (np.ndarray): Longitudes of the centers in degrees, shape (N,).
+        nPixels (np.ndarray): Sizes of the regions in pixels, shape (N,).
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Latitudes and longitudes of the points in degrees, shape (N, 4).
+    """
+    # Add a buffer to ensure we get at least nPixels
+    buffer_pixels = 2
+    distance_m = (np.asarray(nPixels, dtype=np.float64) + buffer_pixels) / 2 * SPATIAL_RESOLUTION_M
+
+    # thetas_deg = [45, 135, 225, 315]
+    thetas_deg = np.array([0, 90, 180, 270])  # BBox are defined with North, East, South, West
+    theta_rad = np.radians(thetas_deg)[None, :]
+
+    lat0_rad = np.radians(np.asarray(lat_deg, dtype=np.float64))[:, None]
+    lon0_rad = np.radians(np.asarray(lon_deg, dtype=np.float64))[:, None]
+    delta = (distance_m / RADIUS_EARTH_M)[:, None]
+
+    sin_lat = np.sin(lat0_rad) * np.cos(delta) + np.cos(lat0_rad) * np.sin(delta) * np.cos(theta_rad)
+    lat_rad = np.arcsin(sin_lat)
+    y = np.sin(theta_rad) * np.sin(delta) * np.cos(lat0_rad)
+    x = np.cos(delta) - np.sin(lat0_rad) * sin_lat
+    lon_rad = lon0_rad + np.arctan2(y, x)
+    lon_rad = (lon_rad + np.pi) % (2 * np.pi) - np.pi  # Normalize lon to [-pi, pi]
+    return np.degrees(lat_rad), np.degrees(lon_rad)
+
+
 class Region:
 
     def __init__(
@@ -21,9 +57,10 @@ class Region:
         self.nPixels = nPixels
         self.pts = []
         self.coords = {}
+        self._region = None
 
         assert self._verify_coordinates()
-        self.region = self._get_region()
+        self._get_bbox()
 
     def _verify_coordinates(self) -> bool:
         """
@@ -36,41 +73,27 @@ class Region:
             logger.error(f'Invalid longitude: {self.lon0_deg}. Must be between -180 and 180.')
             return False
         return True
-    
-    def _get_region(self) -> ee.Geometry.Rectangle:
-        # Add a buffer to ensure we get at least nPixels
-        buffer_pixels = 2
-        distance_m = (self.nPixels + buffer_pixels) / 2 * SPATIAL_RESOLUTION_M
-
-        # thetas_deg = [45, 135, 225, 315]
-        thetas_deg = [0, 90, 180, 270]  # BBox are defined with North, East, South, West
-
-        lat0_rad = math.radians(self.lat0_deg)
-        lon0_rad = math.radians(self.lon0_deg)
-        delta = distance_m / RADIUS_EARTH_M
-        self.pts = []
-        for theta_deg in thetas_deg:
-            theta_rad = math.radians(theta_deg)  
-            sin_lat = math.sin(lat0_rad) * math.cos(delta) + math.cos(lat0_rad) * math.sin(delta) * math.cos(theta_rad)
-            lat_rad = math.asin(sin_lat)
-            y = math.sin(theta_rad) * math.sin(delta) * math.cos(lat0_rad)
-            x = math.cos(delta) - math.sin(lat0_rad) * sin_lat
-            lon_rad = lon0_rad + math.atan2(y, x)
-            lon_rad = (lon_rad + math.pi) % (2 * math.pi) - math.pi  # Normalize lon to [-pi, pi]
-            lat_deg = math.degrees(lat_rad)
-            lon_deg = math.degrees(lon_rad)
-            self.pts.append((lat_deg, lon_deg))
-
-        xMin, xMax, yMin, yMax = (
-            min(lon for _, lon in self.pts), max(lon for _, lon in self.pts),
-            min(lat for lat, _ in self.pts), max(lat for lat, _ in self.pts)
-        )
-        self.coords = {'xMin': xMin, 'xMax': xMax, 'yMin': yMin, 'yMax': yMax}
-
-        region = ee.Geometry.Rectangle([xMin, yMin, xMax, yMax])
-        return region
-
 
+    def _get_bbox(self) -> None:
+        """
+        Compute the bounding box of the region, without contacting Google Earth Engine.
+        """
+        lats_deg, lons_deg = bounding_boxes([self.lat0_deg], [self.lon0_deg], [self.nPixels])
+        self.pts = [(float(lat), float(lon)) for lat, lon in zip(lats_deg[0], lons_deg[0])]
+        self.coords = {
+            'xMin': float(lons_deg.min()), 'xMax': float(lons_deg.max()),
+            'yMin': float(lats_deg.min()), 'yMax': float(lats_deg.max())
+        }
+
+    @property
+    def region(self) -> ee.Geometry.Rectangle:
+        """
+        The Google Earth Engine geometry of the region, built on first access.
+        """
+        if self._region is None:
+            c = self.coords
+            self._region = ee.Geometry.Rectangle([c['xMin'], c['yMin'], c['xMax'], c['yMax']])
+        return self._region
 
 
     # def _get_region(self) -> ee.Geometry.Rectangle:
@@ -100,4 +123,79 @@ class Region:
         
     #     region = ee.Geometry.Rectangle([self.west, self.south, self.east, self.north])
     #     return region
-    
\ No newline at end of file
+    
+
+
+class RegionBatch:
+    """
+    Structure-of-arrays counterpart of Region, computing the bounding boxes of many
+    regions at once. Google Earth Engine geometries are only built when accessed.
+    """
+
+    def __init__(
+            self,
+            lat_deg: Union[np.ndarray, List[float]],
+            lon_deg: Union[np.ndarray, List[float]],
+            nPixels: Union[np.ndarray, List[int], int]) -> None:
+        """
+        Args:
+            lat_deg (np.ndarray): Latitudes of the centers in degrees.
+            lon_deg (np.ndarray): Longitudes of the centers in degrees.
+            nPixels (np.ndarray or int): Sizes of the regions in pixels, shared if scalar.
+        """
+        self.lat0_deg = np.asarray(lat_deg, dtype=np.float64).ravel()
+        self.lon0_deg = np.asarray(lon_deg, dtype=np.float64).ravel()
+        self.nPixels = np.broadcast_to(np.asarray(nPixels), self.lat0_deg.shape)
+        assert len(self.lat0_deg) == len(self.lon0_deg), 'Latitudes and longitudes must have the same length.'
+
+        assert self._verify_coordinates()
+        lats_deg, lons_deg = bounding_boxes(self.lat0_deg, self.lon0_deg, self.nPixels)
+        self.pts = np.stack([lats_deg, lons_deg], axis=-1)  # (N, 4, 2)
+        self.coords = {
+            'xMin': lons_deg.min(axis=1), 'xMax': lons_deg.max(axis=1),
+            'yMin': lats_deg.min(axis=1), 'yMax': lats_deg.max(axis=1)
+        }
+
+    def _verify_coordinates(self) -> bool:
+        """
+        Verify if all the coordinates are within valid ranges.
+        """
+        invalid = np.flatnonzero(~((-90 <= self.lat0_deg) & (self.lat0_deg <= 90)))
+        if len(invalid) > 0:
+            logger.error(f'Invalid latitudes at {invalid[:10].tolist()}. Must be between -90 and 90.')
+            return False
+        invalid = np.flatnonzero(~((-180 <= self.lon0_deg) & (self.lon0_deg <= 180)))
+        if len(invalid) > 0:
+            logger.error(f'Invalid longitudes at {invalid[:10].tolist()}. Must be between -180 and 180.')
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self.lat0_deg)
+
+    def __getitem__(self, index: int) -> Region:
+        """
+        Build the Region of a single site. Its bounding box is copied from the batch.
+        """
+        region = Region.__new__(Region)
+        region.lat0_deg = float(self.lat0_deg[index])
+        region.lon0_deg = float(self.lon0_deg[index])
+        region.nPixels = self.nPixels[index].item()
+        region.pts = [tuple(pt) for pt in self.pts[index].tolist()]
+        region.coords = {k: float(v[index]) for k, v in self.coords.items()}
+        region._region = None
+        return region
+
+    def __iter__(self) -> Iterator[Region]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def geometries(self) -> List[ee.Geometry.Rectangle]:
+        """
+        Build the Google Earth Engine geometries of all the regions.
+        """
+        c = self.coords
+        return [
+            ee.Geometry.Rectangle([float(xMin), float(yMin), float(xMax), float(yMax)])
+            for xMin, yMin, xMax, yMax in zip(c['xMin'], c['yMin'], c['xMax'], c['yMax'])
+        ]
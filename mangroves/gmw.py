@@ -0,0 +1,304 @@
+import os
+import argparse
+import tempfile
+import logging
+import numpy as np
+import pandas as pd
+import pyogrio
+import shapely
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from affine import Affine
+from typing import Dict, Iterable, List, Optional, Tuple
+from mangroves.geometry import Region
+from mangroves.constants import SPATIAL_RESOLUTION_M
+from mangroves.labels import project, chip_grid, rasterize_mask, get_category
+from mangroves.utils import utm_epsg
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+INDEX_FILE = 'index.npz'
+
+
+def tile_name(row: int, col: int) -> str:
+    return f'{row:+04d}{col:+05d}'
+
+
+def _spill_tile(
+        spill_path: Path,
+        row: int,
+        col: int,
+        geometries: np.ndarray,
+        tile_size_deg: float) -> int:
+    """
+    Clip polygons to a tile, project them into its UTM zone, and append their WKB and lengths
+    to the spill files of the tile.
+
+    Returns:
+        int: The EPSG code of the tile.
+    """
+    xMin, yMin = col * tile_size_deg, row * tile_size_deg
+    geometries = shapely.clip_by_rect(geometries, xMin, yMin, xMin + tile_size_deg, yMin + tile_size_deg)
+    geometries = geometries[~shapely.is_empty(geometries)]
+    epsg = utm_epsg(yMin + tile_size_deg / 2, xMin + tile_size_deg / 2)
+    wkb = shapely.to_wkb(project(geometries, 'EPSG:4326', f'EPSG:{epsg}'))
+    name = tile_name(row, col)
+    with open(spill_path / f'{name}.wkb', 'ab') as f:
+        f.write(b''.join(wkb))
+    with open(spill_path / f'{name}.len', 'ab') as f:
+        np.array([len(b) for b in wkb], dtype=np.int64).tofile(f)
+    return epsg
+
+
+def build_tiles(
+        path: str,
+        output_path: str,
+        tile_size_deg: float = 1.,
+        chunk_size: int = 50000) -> pd.DataFrame:
+    """
+    Split a GMW vector layer (e.g. `gmw_v3_2020_vec.shp`) into a grid of tiles, done once.
+
+    Polygons are clipped to tiles of `tile_size_deg` degrees and each tile is projected into
+    its UTM zone, then stored as WKB in `<output_path>/tiles/<name>.npz`. The bounding boxes,
+    CRS and number of polygons of the tiles are listed in `<output_path>/index.npz`.
+
+    Args:
+        path (str): Path to the vector file.
+        output_path (str): Directory of the tiles.
+        tile_size_deg (float, optional): Size of the tiles in degrees, dividing the 6 degrees of a UTM zone
+            so that no tile spans two zones.
+        chunk_size (int, optional): Number of polygons read from the vector file at once.
+    Returns:
+        pd.DataFrame: The index of the tiles.
+    """
+    assert (6 / tile_size_deg).is_integer(), 'tile_size_deg must divide the 6 degrees of a UTM zone.'
+    output_path = Path(os.path.expanduser(output_path))
+    (output_path / 'tiles').mkdir(parents=True, exist_ok=True)
+
+    # Polygons are clipped and projected chunk by chunk, and their WKB appended to per-tile
+    # spill files, so that memory holds a single chunk rather than the whole layer. Chunks are
+    # read with pyogrio, which seeks to their first polygon instead of reading the layer from
+    # its start for every chunk
+    path = os.path.expanduser(path)
+    n_polygons = pyogrio.read_info(path, force_feature_count=True)['features']
+    index = []
+    with tempfile.TemporaryDirectory(dir=output_path) as spill_path:
+        spill_path = Path(spill_path)
+        tiles: Dict[Tuple[int, int], int] = {}
+        for start in range(0, n_polygons, chunk_size):
+            gdf = pyogrio.read_dataframe(path, columns=[], skip_features=start, max_features=chunk_size)
+            if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+                gdf = gdf.to_crs(epsg=4326)
+            geometries = gdf.geometry.values
+            bounds = shapely.bounds(geometries)
+            rows = np.floor(bounds[:, [1, 3]] / tile_size_deg).astype(int)
+            cols = np.floor(bounds[:, [0, 2]] / tile_size_deg).astype(int)
+            # Most polygons fall into a single tile, the others are clipped to each tile they cross
+            parts: Dict[Tuple[int, int], List[int]] = {}
+            for i in range(len(geometries)):
+                for row in range(rows[i, 0], rows[i, 1] + 1):
+                    for col in range(cols[i, 0], cols[i, 1] + 1):
+                        parts.setdefault((row, col), []).append(i)
+            for (row, col), members in parts.items():
+                tiles[(row, col)] = _spill_tile(spill_path, row, col, geometries[members], tile_size_deg)
+            logger.info(f'Read {start + len(gdf)} polygons from {path}')
+
+        for (row, col), epsg in tiles.items():
+            name = tile_name(row, col)
+            with open(spill_path / f'{name}.wkb', 'rb') as f:
+                wkb = np.frombuffer(f.read(), dtype=np.uint8)
+            lengths = np.fromfile(spill_path / f'{name}.len', dtype=np.int64)
+            if len(lengths) == 0:
+                continue
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(lengths)
+            np.savez(output_path / 'tiles' / f'{name}.npz', wkb=wkb, offsets=offsets)
+            xMin, yMin = col * tile_size_deg, row * tile_size_deg
+            index.append({'name': name, 'xMin': xMin, 'yMin': yMin, 'xMax': xMin + tile_size_deg,
+                          'yMax': yMin + tile_size_deg, 'epsg': epsg, 'count': len(lengths)})
+
+    if len(index) == 0:
+        logger.warning(f'No polygon found in {path}')
+    index = pd.DataFrame(index, columns=['name', 'xMin', 'yMin', 'xMax', 'yMax', 'epsg', 'count'])
+    index = index.sort_values('name', ignore_index=True)
+    np.savez(output_path / INDEX_FILE,
+             name=index['name'].to_numpy(dtype=str),
+             bounds=index[['xMin', 'yMin', 'xMax', 'yMax']].to_numpy(dtype=np.float64),
+             epsg=index['epsg'].to_numpy(dtype=np.int32),
+             count=index['count'].to_numpy(dtype=np.int64),
+             tile_size_deg=tile_size_deg)
+    logger.info(f'Wrote {len(index)} tiles of {tile_size_deg} degrees into {output_path}')
+    return index
+
+
+class GMWTileStore:
+    """
+    Read-only access to the GMW polygons tiled by build_tiles.
+
+    Only the index of the tiles is loaded at startup. Tiles are loaded on demand when a chip
+    overlaps them, together with an STRtree of their polygons, and kept in a small LRU cache so
+    that neighbouring chips reuse them. Polygons are already in the UTM zone of their tile,
+    and are only reprojected for chips centered in another zone.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            cache_size: int = 32,
+            spatialResolution_m: float = SPATIAL_RESOLUTION_M,
+            all_touched: bool = False) -> None:
+        """
+        Args:
+            path (str): Directory of the tiles.
+            cache_size (int, optional): Maximum number of tiles held in memory.
+            spatialResolution_m (float, optional): Size of the pixels in meters.
+            all_touched (bool, optional): Whether all the pixels touched by a polygon are inside.
+        """
+        self.path = Path(os.path.expanduser(path))
+        with np.load(self.path / INDEX_FILE) as index:
+            self.names = index['name']
+            self.bounds = index['bounds']
+            self.epsg = index['epsg']
+            self.tile_size_deg = float(index['tile_size_deg'])
+        self.tree = shapely.STRtree(shapely.box(*self.bounds.T))
+        self.cache_size = cache_size
+        self.spatialResolution_m = spatialResolution_m
+        self.all_touched = all_touched
+        self._tiles: 'OrderedDict[int, Tuple[np.ndarray, shapely.STRtree]]' = OrderedDict()
+
+    def __getstate__(self) -> dict:
+        # Loaded tiles are not sent to worker processes
+        state = self.__dict__.copy()
+        state['_tiles'] = OrderedDict()
+        return state
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def tile(self, i: int) -> Tuple[np.ndarray, shapely.STRtree]:
+        """
+        Polygons of a tile in its UTM zone, with their STRtree.
+        """
+        if i in self._tiles:
+            self._tiles.move_to_end(i)
+            return self._tiles[i]
+        with np.load(self.path / 'tiles' / f'{self.names[i]}.npz') as f:
+            wkb, offsets = f['wkb'].tobytes(), f['offsets']
+        geometries = shapely.from_wkb([wkb[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])])
+        self._tiles[i] = (geometries, shapely.STRtree(geometries))
+        if len(self._tiles) > self.cache_size:
+            self._tiles.popitem(last=False)
+        return self._tiles[i]
+
+    def tiles(
+            self,
+            region: Region,
+            margin: float = 0.1) -> np.ndarray:
+        """
+        Indices of the tiles overlapping a region, with a margin covering the rotation of the UTM grid.
+        """
+        c = region.coords
+        dx, dy = (c['xMax'] - c['xMin']) * margin, (c['yMax'] - c['yMin']) * margin
+        return self.tree.query(shapely.box(c['xMin'] - dx, c['yMin'] - dy, c['xMax'] + dx, c['yMax'] + dy))
+
+    def query(self, region: Region) -> Tuple[np.ndarray, str, Affine]:
+        """
+        Polygons intersecting the pixel grid of a chip, in the UTM zone of the chip.
+
+        Returns:
+            Tuple[np.ndarray, str, Affine]: The geometries clipped to the chip, its CRS and its transform.
+        """
+        target_crs, transform = chip_grid(region.lat0_deg, region.lon0_deg, region.nPixels, self.spatialResolution_m)
+        size_m = int(region.nPixels) * self.spatialResolution_m
+        xMin, yMax = transform.c, transform.f
+        chip = (xMin, yMax - size_m, xMin + size_m, yMax)
+
+        geometries = []
+        for i in self.tiles(region):
+            tile_geometries, tile_tree = self.tile(i)
+            tile_crs = f'EPSG:{self.epsg[i]}'
+            if tile_crs == target_crs:
+                hits = tile_tree.query(shapely.box(*chip), predicate='intersects')
+                geometries.append(tile_geometries[hits])
+            else:
+                # Chip centered in another UTM zone: look up its footprint in the zone of the tile
+                footprint = project(np.array([shapely.box(*chip)]), target_crs, tile_crs)[0]
+                hits = tile_tree.query(footprint, predicate='intersects')
+                geometries.append(project(tile_geometries[hits], tile_crs, target_crs))
+        if len(geometries) == 0:
+            return np.array([], dtype=object), target_crs, transform
+        geometries = shapely.clip_by_rect(np.concatenate(geometries), *chip)
+        return geometries[~shapely.is_empty(geometries)], target_crs, transform
+
+    def label(self, region: Region) -> Tuple[float, np.ndarray]:
+        """
+        Compute the coverage of a single chip.
+
+        Returns:
+            Tuple[float, np.ndarray]: The ratio of mangrove pixels, and the mask of the chip.
+        """
+        geometries, _, transform = self.query(region)
+        mask = rasterize_mask(geometries, transform, region.nPixels, self.all_touched)
+        return float(mask.mean()), mask
+
+    def label_many(
+            self,
+            regions: Iterable[Region],
+            max_workers: Optional[int] = None,
+            chunksize: int = 64) -> pd.DataFrame:
+        """
+        Compute the coverage of many chips in a pool of processes, each loading its own tiles.
+        Chips are sorted by tile so that consecutive chips of a process share their tiles.
+
+        Returns:
+            pd.DataFrame: The latitude, longitude, ratio and category of each chip.
+        """
+        regions: List[Region] = list(regions)
+        order = np.lexsort((
+            [np.floor(region.lon0_deg / self.tile_size_deg) for region in regions],
+            [np.floor(region.lat0_deg / self.tile_size_deg) for region in regions],
+        ))
+        ratios = np.zeros(len(regions))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(self,)) as executor:
+            tasks = [(int(i), regions[i].lat0_deg, regions[i].lon0_deg, regions[i].nPixels) for i in order]
+            for index, ratio in executor.map(_label_chip, tasks, chunksize=chunksize):
+                ratios[index] = ratio
+        return pd.DataFrame({
+            'lat': [region.lat0_deg for region in regions],
+            'lon': [region.lon0_deg for region in regions],
+            'ratio': ratios,
+            'category': get_category(ratios),
+        })
+
+
+_worker_store: Optional[GMWTileStore] = None
+
+
+def _init_worker(store: GMWTileStore) -> None:
+    global _worker_store
+    _worker_store = store
+
+
+def _label_chip(task: Tuple[int, float, float, int]) -> Tuple[int, float]:
+    """
+    Worker of the process pool, computing the coverage of a single chip from the tiles of the process.
+    """
+    index, lat_deg, lon_deg, nPixels = task
+    ratio, _ = _worker_store.label(Region(lat_deg, lon_deg, nPixels))
+    return index, ratio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Split a GMW vector layer into pre-projected tiles.')
+    parser.add_argument('path', help='Path to the GMW vector file, e.g. gmw_v3_2020_vec.shp.')
+    parser.add_argument('output', help='Directory of the tiles.')
+    parser.add_argument('--tile_size', type=float, default=1., help='(Optional) Size of the tiles in degrees.')
+    args = parser.parse_args()
+    build_tiles(args.path, args.output, args.tile_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import os
+import json
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import List, Sequence, Tuple
+from mangroves.embeddings import Embeddings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _squared_distances(
+        x: np.ndarray,
+        centroids: np.ndarray) -> np.ndarray:
+    """
+    Squared L2 distances between the rows of x and the centroids.
+    """
+    return (x ** 2).sum(axis=1)[:, None] - 2 * x @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+
+
+def assign(
+        x: np.ndarray,
+        centroids: np.ndarray,
+        block_size: int = 65536) -> np.ndarray:
+    """
+    Index of the nearest centroid of each row of x, computed by blocks of rows.
+    """
+    labels = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), block_size):
+        labels[start:start + block_size] = _squared_distances(x[start:start + block_size], centroids).argmin(axis=1)
+    return labels
+
+
+def kmeans(
+        x: np.ndarray,
+        k: int,
+        n_iter: int = 20,
+        seed: int = 42) -> np.ndarray:
+    """
+    Lloyd's k-means, initialized on random rows. Empty clusters are reseeded on random rows.
+
+    Returns:
+        np.ndarray: The (k, d) centroids.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].astype(np.float32)
+    for _ in range(n_iter):
+        labels = assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.add.reduceat(x[order], starts[~empty], axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        centroids[empty] = x[rng.choice(len(x), empty.sum(), replace=False)]
+    return centroids
+
+
+class PixelIndex:
+    """
+    Approximate nearest-neighbour index of the pixels of many embedding patches (IVF-PQ).
+
+    Pixels are partitioned by a coarse k-means into `n_lists` inverted lists, and the residual
+    of each pixel to its list centroid is compressed by product quantization into `n_subvectors`
+    bytes. A query only scans the `n_probe` lists closest to it, computing distances from lookup
+    tables instead of the original vectors.
+
+    The index is a directory of `.npy` files: the codes and pixel ids sorted by list, the offsets
+    of the lists, the centroids and the codebooks, opened as memory maps. Pixel ids are
+    (patch, row, col), patch indexing the files listed in `patches.csv`.
+    AlphaEarth embeddings are unit-length, so L2 ranking is also cosine ranking, with
+    cosine similarity = 1 - d² / 2.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Directory of the index, written by `PixelIndex.build`.
+        """
+        self.path = Path(os.path.expanduser(path))
+        with open(self.path / 'index.json', 'r') as f:
+            self.config = json.load(f)
+        self.centroids = np.load(self.path / 'centroids.npy')
+        self.codebooks = np.load(self.path / 'codebooks.npy')
+        self.offsets = np.load(self.path / 'offsets.npy')
+        self.codes = np.load(self.path / 'codes.npy', mmap_mode='r')
+        self.ids = np.load(self.path / 'ids.npy', mmap_mode='r')
+        self.patches = pd.read_csv(self.path / 'patches.csv')
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @staticmethod
+    def _pixels(
+            data: np.ndarray,
+            stride: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pixels of a (D, H, W) patch as (N, D) float32 rows, with their rows and columns.
+        """
+        data = np.asarray(data)[:, ::stride, ::stride]
+        rows, cols = np.meshgrid(np.arange(data.shape[1]) * stride, np.arange(data.shape[2]) * stride, indexing='ij')
+        return data.reshape(data.shape[0], -1).T.astype(np.float32), rows.ravel(), cols.ravel()
+
+    @staticmethod
+    def _encode(
+            residuals: np.ndarray,
+            codebooks: np.ndarray) -> np.ndarray:
+        n_subvectors, _, d_sub = codebooks.shape
+        codes = np.empty((len(residuals), n_subvectors), dtype=np.uint8)
+        for j in range(n_subvectors):
+            codes[:, j] = assign(residuals[:, j * d_sub:(j + 1) * d_sub], codebooks[j])
+        return codes
+
+    @classmethod
+    def build(
+            cls,
+            files: Sequence[str],
+            output_path: str,
+            n_lists: int = 1024,
+            n_subvectors: int = 8,
+            stride: int = 1,
+            n_train: int = 200000,
+            n_iter: int = 20,
+            seed: int = 42) -> 'PixelIndex':
+        """
+        Build an index over the pixels of patch files saved by `Embeddings.save`.
+
+        The quantizers are trained on a random sample of pixels, then all the patches are read
+        once more and encoded, one at a time.
+
+        Args:
+            files (Sequence[str]): Paths of the patch files, e.g. the `path` column of `index_directory`.
+            output_path (str): Directory of the index.
+            n_lists (int, optional): Number of inverted lists.
+            n_subvectors (int, optional): Number of bytes per pixel, dividing the number of bands.
+            stride (int, optional): Only index one pixel every `stride` rows and columns.
+            n_train (int, optional): Number of pixels the quantizers are trained on.
+            n_iter (int, optional): Number of k-means iterations.
+            seed (int, optional): Seed of the sampling and of the k-means.
+        Returns:
+            PixelIndex: The index.
+        """
+        output_path = Path(os.path.expanduser(output_path))
+        output_path.mkdir(parents=True, exist_ok=True)
+        files = [str(file) for file in files]
+        rng = np.random.default_rng(seed)
+
+        def load(file: str) -> np.ndarray:
+            embeddings = Embeddings()
+            embeddings.from_file(file, lazy=True)
+            return embeddings.data
+
+        # Training sample, drawn evenly from a random subset of the patches
+        train_files = rng.permutation(len(files))[:max(1, min(len(files), n_train // 1000))]
+        per_file = int(np.ceil(n_train / len(train_files)))
+        sample = []
+        for i in train_files:
+            pixels, _, _ = cls._pixels(load(files[i]), stride)
+            sample.append(pixels[rng.choice(len(pixels), min(per_file, len(pixels)), replace=False)])
+        sample = np.concatenate(sample)
+        n_bands = sample.shape[1]
+        assert n_bands % n_subvectors == 0, f'n_subvectors must divide the {n_bands} bands.'
+        n_lists = min(n_lists, len(sample))
+        logger.info(f'Training {n_lists} lists and {n_subvectors} sub-quantizers on {len(sample)} pixels')
+
+        centroids = kmeans(sample, n_lists, n_iter, seed)
+        residuals = sample - centroids[assign(sample, centroids)]
+        d_sub = n_bands // n_subvectors
+        codebooks = np.stack([
+            kmeans(residuals[:, j * d_sub:(j + 1) * d_sub], min(256, len(sample)), n_iter, seed)
+            for j in range(n_subvectors)
+        ])
+
+        # Encoding in the order of the patches, into temporary files
+        with tempfile.TemporaryDirectory(dir=output_path) as tmp:
+            tmp = Path(tmp)
+            n_pixels = 0
+            with open(tmp / 'codes', 'wb') as f_codes, open(tmp / 'ids', 'wb') as f_ids, \
+                    open(tmp / 'lists', 'wb') as f_lists:
+                for patch, file in enumerate(files):
+                    pixels, rows, cols = cls._pixels(load(file), stride)
+                    lists = assign(pixels, centroids)
+                    f_codes.write(cls._encode(pixels - centroids[lists], codebooks).tobytes())
+                    f_ids.write(np.column_stack([np.full(len(pixels), patch), rows, cols]).astype(np.int32).tobytes())
+                    f_lists.write(lists.tobytes())
+                    n_pixels += len(pixels)
+
+            # Sorted by list, so that each list is contiguous in the memory-mapped files
+            lists = np.fromfile(tmp / 'lists', dtype=np.int32)
+            order = np.argsort(lists, kind='stable')
+            offsets = np.zeros(n_lists + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(lists, minlength=n_lists))
+            for name, width, dtype in [('codes', n_subvectors, np.uint8), ('ids', 3, np.int32)]:
+                unsorted = np.memmap(tmp / name, dtype=dtype, mode='r', shape=(n_pixels, width))
+                output = np.lib.format.open_memmap(output_path / f'{name}.npy', mode='w+', dtype=dtype, shape=(n_pixels, width))
+                for start in range(0, n_pixels, 1 << 20):
+                    output[start:start + (1 << 20)] = unsorted[order[start:start + (1 << 20)]]
+                output.flush()
+                del output, unsorted
+
+        np.save(output_path / 'centroids.npy', centroids)
+        np.save(output_path / 'codebooks.npy', codebooks)
+        np.save(output_path / 'offsets.npy', offsets)
+        pd.DataFrame({'path': files}).to_csv(output_path / 'patches.csv', index=False)
+        with open(output_path / 'index.json', 'w') as f:
+            json.dump({'n_lists': n_lists, 'n_subvectors': n_subvectors, 'stride': stride, 'n_pixels': n_pixels}, f)
+        logger.info(f'Indexed {n_pixels} pixels of {len(files)} patches into {output_path}')
+        return cls(output_path)
+
+    def search(
+            self,
+            query: np.ndarray,
+            k: int = 10,
+            n_probe: int = 16,
+            refine: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the approximate k nearest pixels of one or several query vectors.
+
+        Args:
+            query (np.ndarray): The (D,) or (Q, D) query embeddings.
+            k (int, optional): Number of neighbours.
+            n_probe (int, optional): Number of inverted lists scanned per query.
+            refine (int, optional): If positive, the `refine * k` best candidates are re-ranked with their
+                exact distances, read from the patch files.
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The (Q, k) approximate, or exact if refined, squared L2 distances, and the (Q, k, 3)
+                (patch, row, col) ids of the neighbours, sorted by distance. Missing neighbours have an
+                infinite distance and ids -1.
+        """
+        queries = np.atleast_2d(np.asarray(query, dtype=np.float32))
+        n_subvectors, _, d_sub = self.codebooks.shape
+        n_probe = min(n_probe, len(self.centroids))
+        probes = np.argsort(_squared_distances(queries, self.centroids), axis=1)[:, :n_probe]
+
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k, 3), -1, dtype=np.int32)
+        for q, (query, lists) in enumerate(zip(queries, probes)):
+            candidates: List[np.ndarray] = []
+            positions: List[np.ndarray] = []
+            for list_id in lists:
+                start, stop = self.offsets[list_id], self.offsets[list_id + 1]
+                if start == stop:
+                    continue
+                # Lookup table of the distances between the residual sub-vectors and the codewords
+                residual = (query - self.centroids[list_id]).reshape(n_subvectors, 1, d_sub)
+                table = ((residual - self.codebooks) ** 2).sum(axis=2)
+                codes = np.asarray(self.codes[start:stop])
+                candidates.append(table[np.arange(n_subvectors), codes].sum(axis=1))
+                positions.append(np.arange(start, stop))
+            if len(candidates) == 0:
+                continue
+            candidates, positions = np.concatenate(candidates), np.concatenate(positions)
+            if refine > 0:
+                n = min(refine * k, len(candidates))
+                best = np.argpartition(candidates, n - 1)[:n]
+                positions = positions[best]
+                candidates = ((self.vectors(self.ids[positions]) - query) ** 2).sum(axis=1)
+            n = min(k, len(candidates))
+            best = np.argpartition(candidates, n - 1)[:n]
+            best = best[np.argsort(candidates[best])]
+            distances[q, :n] = candidates[best]
+            ids[q, :n] = self.ids[positions[best]]
+        return distances, ids
+
+    def vectors(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Exact embeddings of pixels, read from their patch files (memory-mapped for `.emb` files).
+
+        Args:
+            ids (np.ndarray): The (N, 3) (patch, row, col) ids of the pixels.
+        Returns:
+            np.ndarray: The (N, D) float32 embeddings.
+        """
+        vectors = np.empty((len(ids), self.centroids.shape[1]), dtype=np.float32)
+        for patch in np.unique(ids[:, 0]):
+            rows = ids[:, 0] == patch
+            embeddings = Embeddings()
+            embeddings.from_file(self.patches['path'].iloc[patch], lazy=True)
+            vectors[rows] = embeddings.data[:, ids[rows, 1], ids[rows, 2]].T
+        return vectors
+
+    def neighbours(
+            self,
+            query: np.ndarray,
+            k: int = 10,
+            n_probe: int = 16,
+            refine: int = 0) -> pd.DataFrame:
+        """
+        Nearest pixels of a single query, with the coordinates of their patches.
+
+        Returns:
+            pd.DataFrame: The path of the patch, row, column, distance and cosine similarity of each neighbour.
+        """
+        distances, ids = self.search(query, k, n_probe, refine)
+        found = np.isfinite(distances[0])
+        ids = ids[0, found]
+        return pd.DataFrame({
+            'path': self.patches['path'].to_numpy()[ids[:, 0]],
+            'row': ids[:, 1],
+            'col': ids[:, 2],
+            'distance': np.sqrt(np.maximum(distances[0, found], 0)),
+            'similarity': 1 - distances[0, found] / 2,
+        })
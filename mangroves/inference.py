@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+import numpy as np
+import torch
+import torch.nn.functional as F
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+from mangroves.stats import Normalization
+from mangroves.constants import REGION_DIAMETER_P
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def window_starts(
+        size: int,
+        window: int,
+        stride: int) -> List[int]:
+    """
+    Start offsets of the windows along one axis, the last window being aligned on the end.
+    """
+    if size <= window:
+        return [0]
+    starts = list(range(0, size - window, stride))
+    return starts + [size - window]
+
+
+def blending_weights(
+        window: int,
+        overlap: int) -> np.ndarray:
+    """
+    (window, window) weights of the pixels of a window when stitching, ramping up linearly over
+    the overlap so that overlapping predictions blend smoothly instead of showing seams.
+    """
+    ramp = np.ones(window, dtype=np.float32)
+    if overlap > 0:
+        edge = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap
+        ramp[:overlap] = np.minimum(ramp[:overlap], edge)
+        ramp[-overlap:] = np.minimum(ramp[-overlap:], edge[::-1])
+    return np.outer(ramp, ramp)
+
+
+class SlidingWindowPredictor:
+    """
+    Whole-scene inference of a network trained on chips.
+
+    The D×H×W embedding mosaic (e.g. written by TiledExtractor) is read window by window from its
+    memory map, the windows are normalized as the training samples and batched through the network
+    in inference mode, and the predictions are accumulated with blending weights into memory-mapped
+    output and weight arrays. Only a batch of windows is held in memory, whatever the size of the scene.
+
+    The network may return one value per window, (B,) or (B, C), spread over the window, or
+    dense (B, C, h, w) maps, resized to the window if needed. The output is the raw network output.
+    """
+
+    def __init__(
+            self,
+            net: torch.nn.Module,
+            window: int = int(REGION_DIAMETER_P),
+            overlap: int = int(REGION_DIAMETER_P) // 4,
+            batch_size: int = 16,
+            device: Union[str, torch.device] = 'cpu',
+            normalization: Optional[Normalization] = None) -> None:
+        """
+        Args:
+            net (torch.nn.Module): The network, e.g. `litmodule.net`.
+            window (int, optional): Side of the windows in pixels, the size of the training chips.
+            overlap (int, optional): Overlap between neighbouring windows in pixels.
+            batch_size (int, optional): Number of windows per forward pass.
+            device (str or torch.device, optional): Device of the forward passes.
+            normalization (Normalization, optional): Normalization of the training samples, applied to
+                each window. Required if the network was trained with `normalize: true`.
+        """
+        assert 0 <= overlap < window, 'The overlap must be smaller than the window.'
+        self.net = net.to(device).eval()
+        self.window = window
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.weights = blending_weights(window, overlap)
+        self.normalization = normalization
+
+    def windows(
+            self,
+            height: int,
+            width: int) -> Iterator[Tuple[int, int]]:
+        stride = self.window - self.overlap
+        for row in window_starts(height, self.window, stride):
+            for col in window_starts(width, self.window, stride):
+                yield row, col
+
+    def _batches(self, mosaic: np.ndarray) -> Iterator[Tuple[torch.Tensor, List[Tuple[int, int, int, int]]]]:
+        """
+        Batches of windows read from the mosaic, normalized, and zero-padded where the scene is
+        smaller than a window.
+        """
+        n_bands, height, width = mosaic.shape
+        batch = np.zeros((self.batch_size, n_bands, self.window, self.window), dtype=np.float32)
+        positions = []
+        for row, col in self.windows(height, width):
+            h, w = min(self.window, height - row), min(self.window, width - col)
+            batch[len(positions)] = 0
+            window = mosaic[:, row:row + h, col:col + w]
+            batch[len(positions), :, :h, :w] = window if self.normalization is None else self.normalization(window)
+            positions.append((row, col, h, w))
+            if len(positions) == self.batch_size:
+                yield torch.from_numpy(batch), positions
+                positions = []
+        if len(positions) > 0:
+            yield torch.from_numpy(batch[:len(positions)]), positions
+
+    def _as_maps(self, output: torch.Tensor) -> torch.Tensor:
+        """
+        Network output as (B, C, window, window) maps.
+        """
+        output = output.float()
+        if output.ndim == 1:
+            output = output[:, None]
+        if output.ndim == 2:
+            return output[:, :, None, None].expand(-1, -1, self.window, self.window)
+        if output.shape[-2:] != (self.window, self.window):
+            output = F.interpolate(output, size=(self.window, self.window), mode='bilinear', align_corners=False)
+        return output
+
+    def predict(
+            self,
+            mosaic: Union[str, np.ndarray],
+            output_path: str,
+            row_block: int = 1024) -> np.ndarray:
+        """
+        Predict a whole scene into a memory-mapped `.npy` raster.
+
+        Args:
+            mosaic (str or np.ndarray): The D×H×W mosaic, or the path of its `.npy` file.
+            output_path (str): Path of the C×H×W float32 output raster.
+            row_block (int, optional): Number of rows normalized at once in the final pass.
+        Returns:
+            np.ndarray: The memory-mapped output raster.
+        """
+        if isinstance(mosaic, str):
+            mosaic = np.load(os.path.expanduser(mosaic), mmap_mode='r')
+        _, height, width = mosaic.shape
+        output_path = Path(os.path.expanduser(output_path))
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        weights_path = output_path.with_suffix('.weights.npy')
+        weight = np.lib.format.open_memmap(weights_path, mode='w+', dtype=np.float32, shape=(height, width))
+        output = None
+
+        n_windows = len(list(self.windows(height, width)))
+        logger.info(f'Predicting a {height}x{width} scene with {n_windows} windows of {self.window} pixels')
+        start = time.perf_counter()
+        with torch.inference_mode():
+            for i, (batch, positions) in enumerate(self._batches(mosaic)):
+                maps = self._as_maps(self.net(batch.to(self.device))).cpu().numpy()
+                if output is None:
+                    output = np.lib.format.open_memmap(
+                        output_path, mode='w+', dtype=np.float32, shape=(maps.shape[1], height, width))
+                for (row, col, h, w), prediction in zip(positions, maps):
+                    weights = self.weights[:h, :w]
+                    output[:, row:row + h, col:col + w] += prediction[:, :h, :w] * weights
+                    weight[row:row + h, col:col + w] += weights
+                if (i + 1) % 100 == 0:
+                    done = (i + 1) * self.batch_size
+                    logger.info(f'{done}/{n_windows} windows, '
+                                f'{done * self.window ** 2 / (time.perf_counter() - start):.0f} window pixels/s')
+
+        for row in range(0, height, row_block):
+            output[:, row:row + row_block] /= np.maximum(weight[row:row + row_block], 1e-6)
+        output.flush()
+        del weight
+        os.remove(weights_path)
+
+        elapsed = time.perf_counter() - start
+        logger.info(f'Predicted {height * width} pixels in {elapsed:.1f}s ({height * width / elapsed:.0f} pixels/s)')
+        return output
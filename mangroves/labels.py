@@ -0,0 +1,242 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from concurrent.futures import ProcessPoolExecutor
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+from affine import Affine
+from typing import Iterable, List, Optional, Tuple
+from mangroves.geometry import Region
+from mangroves.utils import utm_epsg, get_transformer
+from mangroves.constants import SPATIAL_RESOLUTION_M
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+CATEGORY_BINS = [0., 0.2, 0.4, 0.6, 0.8]    # Upper bounds of the coverage categories 0 to 4, above is 5
+
+
+def get_category(ratio: np.ndarray) -> np.ndarray:
+    """
+    Map coverage ratios to the 6 categories used to stratify the samples:
+    0 for no mangrove, then one category per 20% of coverage.
+    """
+    return np.searchsorted(CATEGORY_BINS, ratio, side='left')
+
+
+def project(
+        geometries: np.ndarray,
+        source_crs: str,
+        target_crs: str) -> np.ndarray:
+    """
+    Reproject an array of shapely geometries, transforming all their coordinates in one call.
+    """
+    transformer = get_transformer(source_crs, target_crs)
+    return shapely.transform(geometries, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+
+
+def chip_grid(
+        lat_deg: float,
+        lon_deg: float,
+        nPixels: int,
+        spatialResolution_m: float = SPATIAL_RESOLUTION_M) -> Tuple[str, Affine]:
+    """
+    Pixel grid of a chip, centered on a point in the UTM zone of this point.
+
+    Returns:
+        Tuple[str, Affine]: The CRS of the grid and its affine transform, row 0 being the North.
+    """
+    target_crs = f'EPSG:{utm_epsg(lat_deg, lon_deg)}'
+    x0, y0 = get_transformer('EPSG:4326', target_crs).transform(lon_deg, lat_deg)
+    half_m = int(nPixels) * spatialResolution_m / 2
+    return target_crs, from_origin(x0 - half_m, y0 + half_m, spatialResolution_m, spatialResolution_m)
+
+
+def rasterize_mask(
+        geometries: np.ndarray,
+        transform: Affine,
+        nPixels: int,
+        all_touched: bool = False) -> np.ndarray:
+    """
+    Rasterize geometries, already in the CRS of the grid, into a (nPixels, nPixels) uint8 mask.
+    """
+    if len(geometries) == 0:
+        return np.zeros((int(nPixels), int(nPixels)), dtype=np.uint8)
+    return rasterize(
+        [(geometry, 1) for geometry in geometries],
+        out_shape=(int(nPixels), int(nPixels)),
+        transform=transform,
+        fill=0,
+        all_touched=all_touched,
+        dtype=np.uint8
+    )
+
+
+def chip_mask(
+        geometries: np.ndarray,
+        lat_deg: float,
+        lon_deg: float,
+        nPixels: int,
+        spatialResolution_m: float = SPATIAL_RESOLUTION_M,
+        all_touched: bool = False) -> np.ndarray:
+    """
+    Rasterize mangrove polygons on the pixel grid of a chip, in the UTM zone of its center.
+
+    Args:
+        geometries (np.ndarray): Shapely geometries in EPSG:4326.
+        lat_deg (float): Latitude of the center of the chip in degrees.
+        lon_deg (float): Longitude of the center of the chip in degrees.
+        nPixels (int): Size of the chip in pixels.
+        spatialResolution_m (float, optional): Size of the pixels in meters.
+        all_touched (bool, optional): Whether all the pixels touched by a polygon are inside,
+            instead of the ones whose center is inside.
+    Returns:
+        np.ndarray: The (nPixels, nPixels) uint8 mask, row 0 being the North.
+    """
+    target_crs, transform = chip_grid(lat_deg, lon_deg, nPixels, spatialResolution_m)
+    if len(geometries) > 0:
+        geometries = project(np.asarray(geometries), 'EPSG:4326', target_crs)
+    return rasterize_mask(geometries, transform, nPixels, all_touched)
+
+
+def _label_chip(task: Tuple[int, np.ndarray, float, float, int, float, bool]) -> Tuple[int, float, np.ndarray]:
+    """
+    Worker of the process pool, rasterizing the mask of a single chip.
+    """
+    index, geometries, lat_deg, lon_deg, nPixels, spatialResolution_m, all_touched = task
+    mask = chip_mask(geometries, lat_deg, lon_deg, nPixels, spatialResolution_m, all_touched)
+    return index, float(mask.mean()), mask
+
+
+class LabelEngine:
+    """
+    Compute the mangrove coverage of many chips from a Global Mangrove Watch vector layer.
+
+    Polygons are held in an STRtree so that each chip only considers the polygons intersecting
+    it, clipped to its bounding box before being sent to a pool of processes for rasterization.
+    """
+
+    def __init__(
+            self,
+            geometries: np.ndarray,
+            spatialResolution_m: float = SPATIAL_RESOLUTION_M,
+            all_touched: bool = False) -> None:
+        """
+        Args:
+            geometries (np.ndarray): The mangrove polygons, as shapely geometries in EPSG:4326.
+            spatialResolution_m (float, optional): Size of the pixels in meters.
+            all_touched (bool, optional): Whether all the pixels touched by a polygon are inside.
+        """
+        self.geometries = np.asarray(geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.spatialResolution_m = spatialResolution_m
+        self.all_touched = all_touched
+
+    @classmethod
+    def from_file(
+            cls,
+            path: str,
+            bbox: Optional[Tuple[float, float, float, float]] = None,
+            **kwargs) -> 'LabelEngine':
+        """
+        Load the polygons of a GMW vector file (e.g. `gmw_v3_2020_vec.shp`).
+
+        Args:
+            path (str): Path to the vector file.
+            bbox (Tuple[float, float, float, float], optional): Only load the polygons intersecting
+                this (xMin, yMin, xMax, yMax) box in degrees.
+            **kwargs: Additional arguments of LabelEngine.
+        """
+        gdf = gpd.read_file(os.path.expanduser(path), bbox=bbox)
+        if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(epsg=4326)
+        logger.info(f'Loaded {len(gdf)} GMW polygons from {path}')
+        return cls(gdf.geometry.values, **kwargs)
+
+    def candidates(
+            self,
+            region: Region,
+            margin: float = 0.1) -> np.ndarray:
+        """
+        Polygons intersecting a region, clipped to its bounding box.
+
+        Args:
+            region (Region): The region of the chip.
+            margin (float, optional): Margin added around the bounding box, as a fraction of its size,
+                covering the rotation of the UTM grid with respect to the meridians.
+        Returns:
+            np.ndarray: The clipped shapely geometries, in EPSG:4326.
+        """
+        c = region.coords
+        dx, dy = (c['xMax'] - c['xMin']) * margin, (c['yMax'] - c['yMin']) * margin
+        bounds = (c['xMin'] - dx, c['yMin'] - dy, c['xMax'] + dx, c['yMax'] + dy)
+        hits = self.tree.query(shapely.box(*bounds), predicate='intersects')
+        if len(hits) == 0:
+            return hits
+        clipped = shapely.clip_by_rect(self.geometries[hits], *bounds)
+        return clipped[~shapely.is_empty(clipped)]
+
+    def label(self, region: Region) -> Tuple[float, np.ndarray]:
+        """
+        Compute the coverage of a single chip in the current process.
+
+        Returns:
+            Tuple[float, np.ndarray]: The ratio of mangrove pixels, and the mask of the chip.
+        """
+        _, ratio, mask = _label_chip((0, self.candidates(region), region.lat0_deg, region.lon0_deg,
+                                      region.nPixels, self.spatialResolution_m, self.all_touched))
+        return ratio, mask
+
+    def label_many(
+            self,
+            regions: Iterable[Region],
+            max_workers: Optional[int] = None,
+            masks_path: Optional[str] = None,
+            chunksize: int = 16) -> pd.DataFrame:
+        """
+        Compute the coverage of many chips in a pool of processes.
+
+        Args:
+            regions (Iterable[Region]): The regions of the chips, e.g. a RegionBatch.
+            max_workers (int, optional): Number of processes, defaults to the number of CPUs.
+            masks_path (str, optional): Path of a `.npy` file where to write the (N, H, W) masks.
+            chunksize (int, optional): Number of chips sent to a process at once.
+        Returns:
+            pd.DataFrame: The latitude, longitude, ratio and category of each chip.
+        """
+        regions: List[Region] = list(regions)
+        if len(regions) == 0:
+            return pd.DataFrame(columns=['lat', 'lon', 'ratio', 'category'])
+        ratios = np.zeros(len(regions))
+        masks = None
+        if masks_path is not None:
+            size = int(regions[0].nPixels)
+            masks = np.lib.format.open_memmap(masks_path, mode='w+', dtype=np.uint8, shape=(len(regions), size, size))
+
+        # Chips without any polygon nearby are not sent to the pool
+        tasks = []
+        for index, region in enumerate(regions):
+            geometries = self.candidates(region)
+            if len(geometries) > 0:
+                tasks.append((index, geometries, region.lat0_deg, region.lon0_deg, region.nPixels,
+                              self.spatialResolution_m, self.all_touched))
+        logger.info(f'Rasterizing {len(tasks)} of {len(regions)} chips intersecting mangroves')
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for index, ratio, mask in executor.map(_label_chip, tasks, chunksize=chunksize):
+                ratios[index] = ratio
+                if masks is not None:
+                    masks[index] = mask
+
+        if masks is not None:
+            masks.flush()
+        return pd.DataFrame({
+            'lat': [region.lat0_deg for region in regions],
+            'lon': [region.lon0_deg for region in regions],
+            'ratio': ratios,
+            'category': get_category(ratios),
+        })
@@ -1,10 +1,13 @@
 import argparse
 import os
 import logging
-from mangroves.scripts.load import load_datamodule_from_config, load_litmodule_from_config, load_trainer_from_config
-from pytorch_lightning import seed_everything
+import time
+from mangroves.scripts.load import (
+    load_datamodule_from_config, load_litmodule_from_config, load_normalization_from_config, load_trainer_from_config,
+    validate_configs, ConfigError
+)
+from mangroves.constants import REGION_DIAMETER_P
 
-seed_everything(42, workers=True)
 logging.basicConfig(level=logging.INFO)
 
 
@@ -13,11 +16,16 @@ def check_args(args):
     Check if the required arguments are provided and valid.
     """
     assert args.litmodule_config is not None, "LightningModule configuration file is required."
-    assert args.datamodule_config is not None, "LightningDataModule configuration file is required."
-    assert args.trainer_config is not None, "Trainer configuration file is required."
     assert os.path.exists(args.litmodule_config), "LightningModule configuration file does not exist."
-    assert os.path.exists(all([f for f in args.datamodule_config])), "LightningDataModule configuration file(s) do(es) not exist."
-    assert os.path.exists(args.trainer_config), "Trainer configuration file does not exist."
+    if args.train or args.test:
+        assert args.datamodule_config, "LightningDataModule configuration file is required."
+        assert args.trainer_config is not None, "Trainer configuration file is required."
+    if args.datamodule_config:
+        assert all(os.path.exists(f) for f in args.datamodule_config), "LightningDataModule configuration file(s) do(es) not exist."
+    if args.trainer_config is not None:
+        assert os.path.exists(args.trainer_config), "Trainer configuration file does not exist."
+    if args.predict is not None:
+        assert os.path.exists(args.predict), "Mosaic to predict does not exist."
 
 
 def build_argparser():
@@ -28,20 +36,62 @@ def build_argparser():
         description="Mangrove Project"
     )
     parser.add_argument("--litmodule_config", required=True, help="(Mandatory) Path to the LightningModule configuration file.")
-    parser.add_argument("--datamodule_config", required=True, nargs="*", help="(Mandatory) Path to the LightningDataModule configuration file(s).")
-    parser.add_argument("--trainer_config", required=True, help="(Mandatory) Path to the Trainer configuration file.")
+    parser.add_argument("--datamodule_config", nargs="*", help="(Mandatory to train or test) Path to the LightningDataModule configuration file(s), the first one giving the normalization of the predicted windows.")
+    parser.add_argument("--trainer_config", help="(Mandatory to train or test) Path to the Trainer configuration file.")
     parser.add_argument("--train", action="store_true", help="(Optional) Train the model.")
     parser.add_argument("--test", action="store_true", help="(Optional) Test the model.")
+    parser.add_argument("--predict", default=None, help="(Optional) Path to an embedding mosaic (.npy) to predict with sliding windows.")
+    parser.add_argument("--output", default="prediction.npy", help="(Optional) Path to the predicted raster.")
+    parser.add_argument("--window", type=int, default=int(REGION_DIAMETER_P), help="(Optional) Side of the prediction windows in pixels.")
+    parser.add_argument("--overlap", type=int, default=int(REGION_DIAMETER_P) // 4, help="(Optional) Overlap of the prediction windows in pixels.")
+    parser.add_argument("--batch_size", type=int, default=16, help="(Optional) Number of prediction windows per batch.")
+    parser.add_argument("--seed", type=int, default=42, help="(Optional) Random seed.")
+    parser.add_argument("--dry-run", action="store_true", help="(Optional) Only validate the configuration files.")
 
     return parser
 
 
+def predict(litmodule, args):
+    """
+    Predict a whole embedding mosaic with sliding windows, normalized as the samples of the
+    first LightningDataModule configuration file.
+    """
+    from mangroves.inference import SlidingWindowPredictor
+
+    if args.datamodule_config:
+        normalization = load_normalization_from_config(args.datamodule_config[0])
+    else:
+        logging.warning("No LightningDataModule configuration file, the windows are predicted without normalization.")
+        normalization = None
+    predictor = SlidingWindowPredictor(litmodule.net, args.window, args.overlap, args.batch_size,
+                                       normalization=normalization)
+    predictor.predict(args.predict, args.output)
+
+
 def main():
     """
     Entry point of the script.
     """
     parser = build_argparser()
     args = parser.parse_args()
+    check_args(args)
+
+    if args.dry_run:
+        start = time.perf_counter()
+        try:
+            configs = validate_configs(args.litmodule_config, args.datamodule_config or [], args.trainer_config)
+        except ConfigError as e:
+            logging.error(e)
+            raise SystemExit(1)
+        logging.info(f"{len(configs)} valid configuration file(s) in {time.perf_counter() - start:.2f}s.")
+        return
+
+    from pytorch_lightning import seed_everything
+    seed_everything(args.seed, workers=True)
+
+    if args.predict is not None and not (args.train or args.test):
+        predict(load_litmodule_from_config(args.litmodule_config), args)
+        return
 
     datamodules = load_datamodule_from_config(args.datamodule_config)
     for datamodule in datamodules:
@@ -65,4 +115,11 @@ def main():
 
     if args.test:
         test_dataloaders = [datamodule.test_dataloader() for datamodule in datamodules]
-        trainer.test(dataloaders=test_dataloaders)
\ No newline at end of file
+        trainer.test(dataloaders=test_dataloaders)
+
+    if args.predict is not None:
+        predict(litmodule, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import os
+import json
+import math
+import logging
+import numpy as np
+from typing import Dict, List, Tuple
+from mangroves.geometry import Region
+from mangroves.collection import Collection
+from mangroves.constants import RADIUS_EARTH_M, SPATIAL_RESOLUTION_M, REGION_DIAMETER_P, N_BANDS, GEE_MAX_WORKERS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TiledExtractor:
+    """
+    Extract the embeddings of an area larger than a single sampleRectangle request.
+
+    The bounding box is split into a grid of square tiles, each one fetched as a Region and
+    written into a memory-mapped D×H×W array on disk, so the mosaic never needs to fit in RAM.
+    The grid uses the local scale at the center latitude of the area, row 0 being the North.
+    A completion mask is kept next to the mosaic so that an interrupted extraction resumes
+    with the missing tiles only.
+    """
+
+    def __init__(
+            self,
+            xMin: float,
+            yMin: float,
+            xMax: float,
+            yMax: float,
+            year: int,
+            output_dir: str,
+            tile_size: int = int(REGION_DIAMETER_P)) -> None:
+        """
+        Args:
+            xMin (float): Western longitude of the area in degrees.
+            yMin (float): Southern latitude of the area in degrees.
+            xMax (float): Eastern longitude of the area in degrees.
+            yMax (float): Northern latitude of the area in degrees.
+            year (int): The year of the embeddings.
+            output_dir (str): Directory where the mosaic and its metadata are stored.
+            tile_size (int, optional): Side of the tiles in pixels.
+        """
+        assert xMin < xMax and yMin < yMax, 'The bounding box is empty.'
+        self.coords = {'xMin': xMin, 'xMax': xMax, 'yMin': yMin, 'yMax': yMax}
+        self.year = year
+        self.output_dir = os.path.expanduser(output_dir)
+        self.tile_size = tile_size
+
+        meters_per_deg = RADIUS_EARTH_M * math.pi / 180
+        self.lat_c_deg = (yMin + yMax) / 2
+        self.deg_per_pixel_lat = SPATIAL_RESOLUTION_M / meters_per_deg
+        self.deg_per_pixel_lon = SPATIAL_RESOLUTION_M / (meters_per_deg * math.cos(math.radians(self.lat_c_deg)))
+
+        self.height = math.ceil((yMax - yMin) / self.deg_per_pixel_lat)
+        self.width = math.ceil((xMax - xMin) / self.deg_per_pixel_lon)
+        self.rows = math.ceil(self.height / tile_size)
+        self.cols = math.ceil(self.width / tile_size)
+
+        self.mosaic_path = os.path.join(self.output_dir, 'mosaic.npy')
+        self.tiles_path = os.path.join(self.output_dir, 'tiles.npy')
+        self.metadata_path = os.path.join(self.output_dir, 'mosaic.json')
+
+    @property
+    def metadata(self) -> Dict:
+        return {
+            'coords': self.coords,
+            'year': self.year,
+            'tile_size': self.tile_size,
+            'shape': [N_BANDS, self.height, self.width],
+            'grid': [self.rows, self.cols],
+            'spatial_resolution_m': SPATIAL_RESOLUTION_M,
+        }
+
+    def tile_region(
+            self,
+            row: int,
+            col: int) -> Region:
+        """
+        Build the Region of a tile of the grid.
+
+        Args:
+            row (int): Row of the tile, from North to South.
+            col (int): Column of the tile, from West to East.
+        Returns:
+            Region: The region centered on the tile.
+        """
+        lat_deg = self.coords['yMax'] - (row + 0.5) * self.tile_size * self.deg_per_pixel_lat
+        lon_deg = self.coords['xMin'] + (col + 0.5) * self.tile_size * self.deg_per_pixel_lon
+        return Region(lat_deg, lon_deg, self.tile_size)
+
+    def _open(self, dtype: np.dtype) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Open the mosaic and the completion mask, creating them unless a compatible
+        extraction already exists in the output directory.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        # A mosaic of another dtype is not resumed, its bytes would be read as the new dtype
+        expected = {**self.metadata, 'dtype': np.dtype(dtype).str}
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path, 'r') as f:
+                metadata = json.load(f)
+            if metadata == json.loads(json.dumps(expected)):
+                mosaic = np.load(self.mosaic_path, mmap_mode='r+')
+                tiles = np.load(self.tiles_path, mmap_mode='r+')
+                logger.info(f'Resuming extraction: {int(tiles.sum())}/{tiles.size} tiles already done')
+                return mosaic, tiles
+            logger.warning(f'Existing mosaic in {self.output_dir} does not match the requested area or dtype, overwriting it')
+
+        mosaic = np.lib.format.open_memmap(
+            self.mosaic_path, mode='w+', dtype=dtype, shape=(N_BANDS, self.height, self.width))
+        tiles = np.lib.format.open_memmap(self.tiles_path, mode='w+', dtype=bool, shape=(self.rows, self.cols))
+        with open(self.metadata_path, 'w') as f:
+            json.dump(expected, f, indent=2)
+        return mosaic, tiles
+
+    def run(
+            self,
+            collection: Collection,
+            max_workers: int = GEE_MAX_WORKERS) -> np.ndarray:
+        """
+        Fetch the missing tiles concurrently and stitch them into the mosaic.
+
+        Args:
+            collection (Collection): The collection to fetch the tiles from.
+            max_workers (int, optional): Number of concurrent requests.
+        Returns:
+            np.ndarray: The memory-mapped D×H×W mosaic. Tiles that could not be fetched are left
+                to zero and are retried on the next run.
+        """
+        mosaic, tiles = self._open(collection.dtype)
+
+        positions = {}
+        regions = []
+        for row, col in zip(*np.nonzero(~tiles)):
+            region = self.tile_region(row, col)
+            positions[id(region)] = (row, col)
+            regions.append(region)
+        logger.info(f'Extracting {len(regions)} tiles of a {self.rows}x{self.cols} grid ({self.height}x{self.width} pixels)')
+
+        failed = []
+        for region, patch in collection.extract_many(regions, self.year, max_workers=max_workers):
+            row, col = positions[id(region)]
+            if patch is None:
+                failed.append((row, col))
+                continue
+            r0, c0 = row * self.tile_size, col * self.tile_size
+            h, w = min(self.tile_size, self.height - r0), min(self.tile_size, self.width - c0)
+            mosaic[:, r0:r0 + h, c0:c0 + w] = patch[:, :h, :w]
+            tiles[row, col] = True
+            tiles.flush()
+
+        mosaic.flush()
+        if len(failed) > 0:
+            logger.warning(f'{len(failed)} tiles failed, run the extraction again to resume: {failed[:10]}')
+        else:
+            logger.info(f'Mosaic complete: {self.mosaic_path}')
+        return mosaic
+
+    def missing_tiles(self) -> List[Tuple[int, int]]:
+        """
+        Returns:
+            List[Tuple[int, int]]: The rows and columns of the tiles not extracted yet.
+        """
+        if not os.path.exists(self.tiles_path):
+            return [(row, col) for row in range(self.rows) for col in range(self.cols)]
+        tiles = np.load(self.tiles_path, mmap_mode='r')
+        return [(int(row), int(col)) for row, col in zip(*np.nonzero(~tiles))]
@@ -0,0 +1,346 @@
+import os
+import queue
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+from mangroves import profiling
+from mangroves.geometry import Region
+from mangroves.labels import get_category
+from mangroves.store import EmbeddingStore, write_shards
+from mangroves.constants import REGION_DIAMETER_P, GEE_MAX_WORKERS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+SAMPLES_FILE = 'samples.csv'
+
+
+class Journal:
+    """
+    Append-only record of the items completed by a stage, one `id<TAB>value` line per item.
+
+    Lines are flushed as soon as an item completes, so that an interrupted run resumes after
+    the last completed item. A truncated last line, left by a crash, is ignored.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.entries: Dict[int, str] = {}
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        item, _, value = line.rstrip('\n').partition('\t')
+                        self.entries[int(item)] = value
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a')
+
+    def record(
+            self,
+            item: int,
+            value: str = '') -> None:
+        with self._lock:
+            self._file.write(f'{item}\t{value}\n')
+            self._file.flush()
+            self.entries[item] = value
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __contains__(self, item: int) -> bool:
+        return item in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def sample(
+        metadata_path: str,
+        workdir: str,
+        max_per_category: Optional[int] = None,
+        test_split: float = 0.2,
+        seed: int = 42) -> pd.DataFrame:
+    """
+    Sample stage: select the sites of the dataset from the metadata CSV (e.g. `mangrove_metadata.csv`,
+    with columns id, lat, lon, year and category) and assign them to the training or test set,
+    stratified by category. The selection is written once to `samples.csv` and reused on resume.
+
+    Args:
+        metadata_path (str): Path to the metadata CSV.
+        workdir (str): Working directory of the pipeline.
+        max_per_category (int, optional): Maximum number of sites per coverage category.
+        test_split (float, optional): Fraction of the sites of each category in the test set.
+        seed (int, optional): Seed of the sampling.
+    Returns:
+        pd.DataFrame: The selected sites.
+    """
+    path = Path(os.path.expanduser(workdir)) / SAMPLES_FILE
+    if path.exists():
+        samples = pd.read_csv(path)
+        logger.info(f'Resuming with the {len(samples)} samples of {path}')
+        return samples
+
+    metadata = pd.read_csv(os.path.expanduser(metadata_path))
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _, group in metadata.groupby('category'):
+        group = group.iloc[rng.permutation(len(group))]
+        if max_per_category is not None:
+            group = group.iloc[:max_per_category]
+        group = group.assign(train=1)
+        group.iloc[:int(len(group) * test_split), group.columns.get_loc('train')] = 0
+        samples.append(group)
+    samples = pd.concat(samples).sort_values('id', ignore_index=True)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    samples.to_csv(path, index=False)
+    logger.info(f'Sampled {len(samples)} of {len(metadata)} sites into {path}')
+    return samples
+
+
+class DatasetBuilder:
+    """
+    Resumable pipeline building a training store from sampled sites.
+
+    The fetch stage downloads the embedding patches and the label stage computes their coverage.
+    They run concurrently, connected by a bounded queue: each fetched patch is labelled while the
+    next ones are downloaded, and fetching pauses when labelling falls behind. Each stage records
+    its completed items in a journal under `<workdir>/journal`, and patches are kept under
+    `<workdir>/patches`, so an interrupted run only processes the remaining items. The pack stage
+    then gathers the patches into an EmbeddingStore, and optionally streaming shards.
+    """
+
+    def __init__(
+            self,
+            workdir: str,
+            collection,
+            labeller=None,
+            regionDiameter_p: int = REGION_DIAMETER_P,
+            max_workers: int = GEE_MAX_WORKERS,
+            queue_size: int = 64) -> None:
+        """
+        Args:
+            workdir (str): Working directory of the pipeline.
+            collection (Collection or CachedCollection): The collection the patches are fetched from.
+            labeller (LabelEngine or GMWTileStore, optional): Source of the labels, the ratios of the metadata are used otherwise.
+            regionDiameter_p (int, optional): Size of the patches in pixels.
+            max_workers (int, optional): Number of concurrent requests of the fetch stage.
+            queue_size (int, optional): Maximum number of fetched patches waiting to be labelled.
+        """
+        self.workdir = Path(os.path.expanduser(workdir))
+        self.collection = collection
+        self.labeller = labeller
+        self.regionDiameter_p = regionDiameter_p
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.patches_dir = self.workdir / 'patches'
+        self.patches_dir.mkdir(parents=True, exist_ok=True)
+        self._labeller: Optional[threading.Thread] = None
+        self._label_error: Optional[BaseException] = None
+
+    def _patch_file(self, item: int) -> Path:
+        return self.patches_dir / f'{item}.npy'
+
+    def _save_patch(
+            self,
+            item: int,
+            patch: np.ndarray) -> None:
+        # Written next to its final name then renamed, so that a patch file is always complete
+        file = self._patch_file(item)
+        tmp = file.with_suffix('.tmp.npy')
+        with profiling.timer('pipeline.save_patch'):
+            np.save(tmp, patch)
+            os.replace(tmp, file)
+
+    def _pending_fetches(
+            self,
+            samples: pd.DataFrame,
+            fetched: Journal) -> Iterator[Tuple[int, pd.DataFrame]]:
+        todo = samples[~samples['id'].isin(list(fetched.entries))]
+        for year, group in todo.groupby('year'):
+            yield int(year), group
+
+    def fetch(
+            self,
+            samples: pd.DataFrame,
+            fetched: Journal,
+            output: queue.Queue) -> None:
+        """
+        Fetch stage: download the missing patches and pass their ids to the label stage.
+        """
+        for year, group in self._pending_fetches(samples, fetched):
+            regions = {}
+            for item, lat, lon in zip(group['id'], group['lat'], group['lon']):
+                region = Region(lat, lon, self.regionDiameter_p)
+                regions[id(region)] = (int(item), region)
+            logger.info(f'Fetching {len(regions)} patches of {year}')
+            for region, patch in self.collection.extract_many(
+                    [region for _, region in regions.values()], year, max_workers=self.max_workers):
+                item = regions[id(region)][0]
+                if patch is None:
+                    continue  # Left out of the journal, retried by the next run
+                self._save_patch(item, patch)
+                fetched.record(item)
+                self._put(output, item)
+
+    def _put(
+            self,
+            output: queue.Queue,
+            item: int) -> None:
+        """
+        Pass an item to the label stage, raising instead of blocking forever once the stage has died.
+        """
+        while True:
+            try:
+                output.put(item, timeout=1.)
+                return
+            except queue.Full:
+                if self._labeller is not None and not self._labeller.is_alive():
+                    raise RuntimeError('The label stage stopped before the end of the run.') from self._label_error
+
+    def label(
+            self,
+            samples: pd.DataFrame,
+            labelled: Journal,
+            fetched_ids: queue.Queue) -> None:
+        """
+        Label stage: compute the coverage of each fetched patch, until the fetch stage sends None.
+        """
+        rows = samples.set_index('id')
+        while True:
+            item = fetched_ids.get()
+            if item is None:
+                return
+            if item in labelled:
+                continue
+            try:
+                row = rows.loc[item]
+                if self.labeller is None:
+                    ratio = float(row['ratio'])
+                else:
+                    with profiling.timer('pipeline.label'):
+                        ratio, _ = self.labeller.label(Region(row['lat'], row['lon'], self.regionDiameter_p))
+                labelled.record(item, repr(ratio))
+            except Exception as e:
+                logger.error(f'Error labelling sample {item}: {e!r}')
+
+    def _label_stage(
+            self,
+            samples: pd.DataFrame,
+            labelled: Journal,
+            fetched_ids: queue.Queue) -> None:
+        # Keeps the error that stopped the stage, raised again by run()
+        try:
+            self.label(samples, labelled, fetched_ids)
+        except BaseException as e:
+            logger.error(f'The label stage failed: {e!r}')
+            self._label_error = e
+
+    def run(self, samples: pd.DataFrame) -> Tuple[Journal, Journal]:
+        """
+        Run the fetch and label stages concurrently, resuming from their journals. An error that
+        stops the label stage is raised again once the completed items are journaled.
+
+        Returns:
+            Tuple[Journal, Journal]: The journals of the fetch and label stages.
+        """
+        fetched = Journal(self.workdir / 'journal' / 'fetch.log')
+        labelled = Journal(self.workdir / 'journal' / 'label.log')
+        logger.info(f'{len(fetched)} patches fetched and {len(labelled)} labelled out of {len(samples)}')
+
+        fetched_ids = queue.Queue(maxsize=self.queue_size)
+        self._label_error = None
+        self._labeller = threading.Thread(
+            target=self._label_stage, args=(samples, labelled, fetched_ids), daemon=True)
+        self._labeller.start()
+        try:
+            # Patches fetched by a previous run but not labelled yet
+            for item in list(fetched.entries):
+                if item not in labelled:
+                    self._put(fetched_ids, item)
+            self.fetch(samples, fetched, fetched_ids)
+        finally:
+            # A dead label stage no longer reads the queue
+            while self._labeller.is_alive():
+                try:
+                    fetched_ids.put(None, timeout=1.)
+                    break
+                except queue.Full:
+                    continue
+            self._labeller.join()
+            fetched.close()
+            labelled.close()
+        if self._label_error is not None:
+            raise RuntimeError('The label stage failed.') from self._label_error
+        logger.info(f'{len(fetched)} patches fetched and {len(labelled)} labelled out of {len(samples)}')
+        return fetched, labelled
+
+    def pack(
+            self,
+            samples: pd.DataFrame,
+            labelled: Journal,
+            output_path: Optional[str] = None,
+            shard_size: Optional[int] = None) -> EmbeddingStore:
+        """
+        Pack stage: gather the fetched and labelled patches into an EmbeddingStore.
+        It only reads local files, and is rebuilt from scratch on every run.
+
+        Args:
+            samples (pd.DataFrame): The sampled sites.
+            labelled (Journal): The journal of the label stage.
+            output_path (str, optional): Directory of the store, defaults to `<workdir>/store`.
+            shard_size (int, optional): Number of patches per shard, if streaming shards are written
+                to `<output_path>/shards`.
+        Returns:
+            EmbeddingStore: The created store.
+        """
+        output_path = self.workdir / 'store' if output_path is None else Path(os.path.expanduser(output_path))
+        output_path.mkdir(parents=True, exist_ok=True)
+
+        index = samples[samples['id'].isin(list(labelled.entries))].reset_index(drop=True)
+        assert len(index) > 0, 'No labelled patch to pack.'
+        index['ratio'] = [float(labelled.entries[item]) for item in index['id']]
+        index['category'] = get_category(index['ratio'].to_numpy())
+        index['offset'] = np.arange(len(index))
+
+        shape = np.load(self._patch_file(index['id'].iloc[0]), mmap_mode='r').shape
+        data = np.lib.format.open_memmap(
+            output_path / EmbeddingStore.DATA_FILE, mode='w+', dtype=np.float32, shape=(len(index),) + shape)
+        for offset, item in enumerate(index['id']):
+            data[offset] = np.load(self._patch_file(item))
+        data.flush()
+        del data
+
+        index.to_csv(output_path / EmbeddingStore.INDEX_FILE, index=False)
+        logger.info(f'Packed {len(index)} patches of shape {shape} into {output_path}')
+        store = EmbeddingStore(output_path)
+        if shard_size is not None:
+            write_shards(store, output_path / 'shards', shard_size)
+        return store
+
+
+def build_dataset(
+        metadata_path: str,
+        workdir: str,
+        collection,
+        labeller=None,
+        max_per_category: Optional[int] = None,
+        test_split: float = 0.2,
+        max_workers: int = GEE_MAX_WORKERS,
+        queue_size: int = 64,
+        output_path: Optional[str] = None,
+        shard_size: Optional[int] = None,
+        seed: int = 42) -> EmbeddingStore:
+    """
+    Run all the stages of the pipeline: sample, fetch and label, then pack.
+    See `sample` and `DatasetBuilder` for the arguments.
+    """
+    samples = sample(metadata_path, workdir, max_per_category, test_split, seed)
+    builder = DatasetBuilder(workdir, collection, labeller, max_workers=max_workers, queue_size=queue_size)
+    _, labelled = builder.run(samples)
+    return builder.pack(samples, labelled, output_path, shard_size)
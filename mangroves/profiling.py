@@ -0,0 +1,224 @@
+import os
+import csv
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+ENV_VAR = 'MANGROVES_PROFILE'  # Set to 1 to profile from the start of the process
+
+
+class Histogram:
+    """
+    Low-overhead histogram of non-negative values with power-of-two buckets, keeping the
+    exact count, total, minimum and maximum. Percentiles are estimated to within a factor of 2.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets: Dict[int, int] = {}
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        exponent = math.frexp(value)[1]  # value < 2 ** exponent
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th percentile, clipped to the observed range.
+        """
+        if self.count == 0:
+            return math.nan
+        rank = q / 100 * self.count
+        seen = 0
+        for exponent in sorted(self.buckets):
+            seen += self.buckets[exponent]
+            if seen >= rank:
+                return min(max(math.ldexp(1., exponent), self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else math.nan,
+            'min': self.min if self.count else math.nan,
+            'max': self.max if self.count else math.nan,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class _Timer:
+    """
+    Context manager adding its duration in seconds to a histogram of the profiler.
+    """
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.profiler.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+_DISABLED = nullcontext()
+
+
+class Profiler:
+    """
+    Thread-safe registry of counters and histograms (timings in seconds, sizes in bytes).
+
+    When disabled, timers are a shared no-op context manager and counters return immediately,
+    so that instrumented code costs a function call at most. Measures taken in other processes
+    (e.g. DataLoader workers or GMWTileStore.label_many) are not gathered.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._start = time.time()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self._start = time.time()
+
+    def count(
+            self,
+            name: str,
+            n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(
+            self,
+            name: str,
+            value: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(value)
+
+    def timer(self, name: str):
+        """
+        Context manager timing its body into the histogram `name`.
+        """
+        return _Timer(self, name) if self.enabled else _DISABLED
+
+    def timed(self, name: Optional[str] = None) -> Callable:
+        """
+        Decorator timing every call of a function, into the histogram `name` or the
+        qualified name of the function.
+        """
+        def decorator(function: Callable) -> Callable:
+            label = name or f'{function.__module__}.{function.__qualname__}'
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Timer(self, label):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self) -> Dict:
+        """
+        Returns:
+            Dict: The counters and the summaries of the histograms, with the elapsed wall time.
+        """
+        with self._lock:
+            return {
+                'elapsed_s': time.time() - self._start,
+                'counters': dict(sorted(self.counters.items())),
+                'histograms': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            }
+
+    def save(self, path: str) -> None:
+        """
+        Write the report as JSON, or as CSV with one row per counter or histogram if the path
+        ends with `.csv`.
+        """
+        path = Path(os.path.expanduser(path))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        report = self.report()
+        if path.suffix == '.csv':
+            fields = ['name', 'kind', 'count', 'total', 'mean', 'min', 'max', 'p50', 'p90', 'p99']
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                for name, value in report['counters'].items():
+                    writer.writerow({'name': name, 'kind': 'counter', 'count': value})
+                for name, summary in report['histograms'].items():
+                    writer.writerow({'name': name, 'kind': 'histogram', **summary})
+        else:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+        logger.info(f'Saved profiling report to {path}')
+
+    def log(self) -> None:
+        """
+        Log a summary of the report, the histograms sorted by total.
+        """
+        report = self.report()
+        lines = [f'Profiling report after {report["elapsed_s"]:.1f}s']
+        for name, summary in sorted(report['histograms'].items(), key=lambda item: -item[1]['total']):
+            lines.append(f'  {name}: {summary["count"]} x {summary["mean"] * 1e3:.3f} ms '
+                         f'(total {summary["total"]:.3f}, p90 {summary["p90"] * 1e3:.3f} ms)')
+        for name, value in report['counters'].items():
+            lines.append(f'  {name}: {value}')
+        logger.info('\n'.join(lines))
+
+
+PROFILER = Profiler(enabled=os.environ.get(ENV_VAR, '0') not in ('', '0'))
+
+enable = PROFILER.enable
+disable = PROFILER.disable
+reset = PROFILER.reset
+count = PROFILER.count
+observe = PROFILER.observe
+timer = PROFILER.timer
+timed = PROFILER.timed
+report = PROFILER.report
+save = PROFILER.save
+
+
+def enabled() -> bool:
+    return PROFILER.enabled
@@ -0,0 +1,153 @@
+import os
+import struct
+import logging
+import numpy as np
+from typing import Dict, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'MGVEMB01'
+EXTENSION = '.emb'
+ALIGNMENT = 64
+
+# magic, data type, bands, height, width, year, feature_id, latitude_deg, longitude_deg,
+# regionDiameter_p, spatialResolution_m, offset of the data
+HEADER = struct.Struct('<8s8sHHHHqddHdQ')
+
+DTYPES = {'int8': np.int8, 'float16': np.float16, 'float32': np.float32}
+
+
+def quantize(
+        data: np.ndarray,
+        dtype: str = 'int8') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Quantize a (D, H, W) patch band by band, so that `data ≈ q * scale + offset`.
+
+    int8 maps the range of each band onto [-127, 127]. float16 and float32 are plain casts,
+    with a unit scale and no offset.
+
+    Args:
+        data (np.ndarray): The (D, H, W) patch.
+        dtype (str, optional): One of 'int8', 'float16' and 'float32'.
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The quantized patch, and the per-band scales and offsets.
+    """
+    assert dtype in DTYPES, f'dtype must be one of {list(DTYPES)}.'
+    n_bands = data.shape[0]
+    if dtype != 'int8':
+        return data.astype(DTYPES[dtype]), np.ones(n_bands, dtype=np.float32), np.zeros(n_bands, dtype=np.float32)
+
+    flat = data.reshape(n_bands, -1)
+    low, high = flat.min(axis=1), flat.max(axis=1)
+    offset = ((high + low) / 2).astype(np.float32)
+    scale = ((high - low) / 254).astype(np.float32)
+    scale[scale == 0] = 1.  # Constant bands
+    q = np.rint((data - offset[:, None, None]) / scale[:, None, None])
+    return np.clip(q, -127, 127).astype(np.int8), scale, offset
+
+
+def dequantize(
+        q: np.ndarray,
+        scale: np.ndarray,
+        offset: np.ndarray) -> np.ndarray:
+    """
+    Inverse of quantize, as a float32 (D, H, W) patch.
+    """
+    data = q.astype(np.float32)
+    data *= scale[:, None, None]
+    data += offset[:, None, None]
+    return data
+
+
+def write(
+        path: str,
+        data: np.ndarray,
+        metadata: Dict,
+        dtype: str = 'int8') -> None:
+    """
+    Write a patch in the compact `.emb` format: a fixed binary header with the metadata, the
+    per-band scales and offsets, then the raw quantized data, aligned so that it can be memory-mapped.
+
+    Args:
+        path (str): Path of the file.
+        data (np.ndarray): The (D, H, W) patch.
+        metadata (Dict): year, feature_id, latitude_deg, longitude_deg, regionDiameter_p and spatialResolution_m.
+        dtype (str, optional): One of 'int8', 'float16' and 'float32'.
+    """
+    q, scale, offset = quantize(np.asarray(data), dtype)
+    n_bands, height, width = q.shape
+    data_offset = HEADER.size + 2 * 4 * n_bands
+    data_offset += -data_offset % ALIGNMENT
+    header = HEADER.pack(
+        MAGIC, dtype.encode(), n_bands, height, width,
+        int(metadata['year']), int(metadata['feature_id']),
+        float(metadata['latitude_deg']), float(metadata['longitude_deg']),
+        int(metadata['regionDiameter_p']), float(metadata['spatialResolution_m']),
+        data_offset
+    )
+    with open(os.path.expanduser(path), 'wb') as f:
+        f.write(header)
+        f.write(scale.astype('<f4').tobytes())
+        f.write(offset.astype('<f4').tobytes())
+        f.write(b'\0' * (data_offset - f.tell()))
+        f.write(np.ascontiguousarray(q).astype(q.dtype.newbyteorder('<')).tobytes())
+
+
+def is_compact(path: str) -> bool:
+    """
+    Whether a file is in the compact `.emb` format.
+    """
+    with open(os.path.expanduser(path), 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(path: str) -> Dict:
+    """
+    Read the metadata, scales and offsets of a `.emb` file, without reading its data.
+    """
+    with open(os.path.expanduser(path), 'rb') as f:
+        buffer = f.read(HEADER.size)
+        (magic, dtype, n_bands, height, width, year, feature_id, latitude_deg, longitude_deg,
+         regionDiameter_p, spatialResolution_m, data_offset) = HEADER.unpack(buffer)
+        assert magic == MAGIC, f'{path} is not an embeddings file.'
+        scale = np.frombuffer(f.read(4 * n_bands), dtype='<f4')
+        offset = np.frombuffer(f.read(4 * n_bands), dtype='<f4')
+    return {
+        'dtype': dtype.rstrip(b'\0').decode(),
+        'shape': (n_bands, height, width),
+        'year': year,
+        'feature_id': feature_id,
+        'latitude_deg': latitude_deg,
+        'longitude_deg': longitude_deg,
+        'regionDiameter_p': regionDiameter_p,
+        'spatialResolution_m': spatialResolution_m,
+        'data_offset': data_offset,
+        'scale': scale,
+        'offset': offset,
+    }
+
+
+def read(
+        path: str,
+        header: Dict = None,
+        raw: bool = False) -> np.ndarray:
+    """
+    Read the patch of a `.emb` file through a memory map.
+
+    Args:
+        path (str): Path of the file.
+        header (Dict, optional): The header of the file, if already read.
+        raw (bool, optional): Return the memory-mapped quantized data, without dequantizing it.
+    Returns:
+        np.ndarray: The float32 (D, H, W) patch, or the read-only quantized memory map if raw.
+    """
+    header = read_header(path) if header is None else header
+    # float32 data is served from the memory map itself, with copy-on-write
+    mode = 'c' if header['dtype'] == 'float32' and not raw else 'r'
+    q = np.memmap(os.path.expanduser(path), dtype=np.dtype(DTYPES[header['dtype']]).newbyteorder('<'),
+                  mode=mode, offset=header['data_offset'], shape=header['shape'])
+    if raw or header['dtype'] == 'float32':
+        return q
+    return dequantize(q, header['scale'], header['offset'])
@@ -1,8 +1,74 @@
+import os
+import argparse
+from mangroves.constants import GEE_MAX_WORKERS
+
+
+def build_dataset(args: argparse.Namespace) -> None:
+    from mangroves.collection import Collection
+    from mangroves.cache import PatchCache, CachedCollection
+    from mangroves.pipeline import build_dataset
+    from mangroves import profiling
+
+    if args.profile is not None:
+        profiling.enable()
+    collection = Collection(project=args.project)
+    if args.cache is not None:
+        collection = CachedCollection(collection, PatchCache(args.cache))
+
+    labeller = None
+    if args.gmw is not None:
+        if os.path.isdir(os.path.expanduser(args.gmw)):
+            from mangroves.gmw import GMWTileStore
+            labeller = GMWTileStore(args.gmw)
+        else:
+            from mangroves.labels import LabelEngine
+            labeller = LabelEngine.from_file(args.gmw)
+
+    build_dataset(
+        args.metadata,
+        args.workdir,
+        collection,
+        labeller,
+        max_per_category=args.max_per_category,
+        test_split=args.test_split,
+        max_workers=args.workers,
+        queue_size=args.queue_size,
+        output_path=args.output,
+        shard_size=args.shard_size,
+        seed=args.seed,
+    )
+
+    if args.profile is not None:
+        profiling.PROFILER.log()
+        profiling.save(args.profile)
 
 
 def main():
-    print("Mangrove Project is running!")
+    parser = argparse.ArgumentParser(description='Mangrove Project')
+    subparsers = parser.add_subparsers(dest='command')
+
+    build = subparsers.add_parser('build-dataset', help='Build a training store from a metadata CSV, resuming interrupted runs.')
+    build.add_argument('metadata', help='Metadata CSV of the sites, e.g. notebooks/mangrove_metadata.csv.')
+    build.add_argument('workdir', help='Working directory holding the journals and the patches.')
+    build.add_argument('--project', default=os.getenv('GEE_PROJECT_KEY'), help='(Optional) GEE project, defaults to $GEE_PROJECT_KEY.')
+    build.add_argument('--gmw', default=None, help='(Optional) GMW tiles directory or vector file, the metadata ratios are used otherwise.')
+    build.add_argument('--cache', default=None, help='(Optional) Directory of a patch cache shared between runs.')
+    build.add_argument('--output', default=None, help='(Optional) Directory of the store, defaults to <workdir>/store.')
+    build.add_argument('--max_per_category', type=int, default=None, help='(Optional) Maximum number of sites per category.')
+    build.add_argument('--test_split', type=float, default=0.2, help='(Optional) Fraction of the sites in the test set.')
+    build.add_argument('--workers', type=int, default=GEE_MAX_WORKERS, help='(Optional) Number of concurrent GEE requests.')
+    build.add_argument('--queue_size', type=int, default=64, help='(Optional) Maximum number of patches waiting to be labelled.')
+    build.add_argument('--shard_size', type=int, default=None, help='(Optional) Also write streaming shards of this size.')
+    build.add_argument('--seed', type=int, default=42, help='(Optional) Seed of the sampling.')
+    build.add_argument('--profile', default=None, help='(Optional) Write a profiling report to this JSON or CSV file.')
+    build.set_defaults(func=build_dataset)
+
+    args = parser.parse_args()
+    if args.command is None:
+        print("Mangrove Project is running!")
+        return
+    args.func(args)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
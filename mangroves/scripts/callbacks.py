@@ -0,0 +1,74 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+from pytorch_lightning import Callback, LightningModule, Trainer
+from mangroves import profiling
+
+
+class ProfilingCallback(Callback):
+    """
+    Enable the profiler during training and time the training loop: `train.data_wait` is the
+    time spent waiting for the DataLoader between two steps, `train.step` the time of a step.
+    The means of each epoch are sent to the logger of the trainer, and the full report is
+    written at the end of the fit. The profiler is disabled again after the fit if it was
+    disabled before.
+    """
+
+    def __init__(
+            self,
+            output_path: Optional[str] = None,
+            log_every_n_epochs: int = 1) -> None:
+        """
+        Args:
+            output_path (str, optional): Path of the report, JSON or CSV after its extension.
+            log_every_n_epochs (int, optional): Frequency of the logged means.
+        """
+        super().__init__()
+        self.output_path = output_path
+        self.log_every_n_epochs = log_every_n_epochs
+        self._batch_end: Optional[float] = None
+        self._batch_start: Optional[float] = None
+        self._was_enabled = False
+        self._epoch_start: Dict[str, Tuple[int, float]] = {}
+
+    def _train_totals(self) -> Dict[str, Tuple[int, float]]:
+        histograms = profiling.report()['histograms']
+        return {name: (summary['count'], summary['total']) for name, summary in histograms.items()
+                if name.startswith('train.')}
+
+    def on_fit_start(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        self._was_enabled = profiling.enabled()
+        profiling.enable()
+
+    def on_train_epoch_start(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        # The histograms are cumulative, the means of the epoch are taken from the differences
+        self._epoch_start = self._train_totals()
+        self._batch_end = time.perf_counter()
+
+    def on_train_batch_start(self, trainer: Trainer, pl_module: LightningModule, batch: Any, batch_idx: int) -> None:
+        self._batch_start = time.perf_counter()
+        if self._batch_end is not None:
+            profiling.observe('train.data_wait', self._batch_start - self._batch_end)
+
+    def on_train_batch_end(self, trainer: Trainer, pl_module: LightningModule, outputs: Any, batch: Any, batch_idx: int) -> None:
+        self._batch_end = time.perf_counter()
+        if self._batch_start is not None:
+            profiling.observe('train.step', self._batch_end - self._batch_start)
+
+    def on_train_epoch_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        self._batch_end = None
+        if trainer.logger is None or trainer.current_epoch % self.log_every_n_epochs != 0:
+            return
+        metrics = {}
+        for name, (count, total) in self._train_totals().items():
+            count_start, total_start = self._epoch_start.get(name, (0, 0.))
+            if count > count_start:
+                metrics[f'profiling/{name}_ms'] = (total - total_start) / (count - count_start) * 1e3
+        if metrics:
+            trainer.logger.log_metrics(metrics, step=trainer.global_step)
+
+    def on_fit_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        profiling.PROFILER.log()
+        if self.output_path is not None and trainer.is_global_zero:
+            profiling.save(self.output_path)
+        if not self._was_enabled:
+            profiling.disable()
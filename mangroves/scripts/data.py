@@ -1,12 +1,17 @@
 import torch
-from torch.utils.data import Dataset, Subset, DataLoader
+import torch.distributed as dist
+from torch.utils.data import Dataset, IterableDataset, Subset, DataLoader, get_worker_info
 from pytorch_lightning import LightningDataModule
 import rasterio
-from typing import Dict
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
 import logging
 import os
 import pandas as pd
+from mangroves import profiling
+from mangroves.store import EmbeddingStore, resolve_path
+from mangroves.stats import Normalization
 
 
 class MangroveDataset(Dataset):
@@ -14,54 +19,255 @@ class MangroveDataset(Dataset):
     def __init__(self, 
                  path: Path, 
                  train: bool = True,
-                 max_samples: int = -1):
+                 max_samples: int = -1,
+                 normalize: bool = False,
+                 clip_percentile: Optional[float] = None):
         """
         Args:
             path (Path): Path to the directory containing the datasets.
             train (bool, optional): Whether to load the training set (True) or the test set (False).
             max_samples (int, optional): Maximum number of samples to load.
+            normalize (bool, optional): Normalize the bands with the statistics saved by `python -m mangroves.stats`.
+            clip_percentile (float, optional): Clip the bands to their [p, 100 - p] percentiles before normalizing.
         """
-        self.path = Path(path)
+        self.path = Path(os.path.expanduser(path))
+        self.normalization = Normalization.from_dataset(self.path, clip_percentile) if normalize else None
 
-        data = pd.read_csv(self.path / 'data.csv')
+        if EmbeddingStore.exists(self.path):
+            self.store = EmbeddingStore(self.path)
+            data = self.store.index
+        else:
+            logging.warning(f'No embedding store in {self.path}, reading one GeoTIFF per sample. '
+                            f'Run `python -m mangroves.store {self.path}` to convert the dataset.')
+            self.store = None
+            data = pd.read_csv(self.path / 'data.csv')
         data = data[data['train'] == train]
         self.data = data.iloc[:max_samples] if max_samples > -1 else data
+        self.ratios = self.data['ratio'].to_numpy(dtype=np.float32)
+        self.offsets = self.data['offset'].to_numpy() if self.store is not None else None
         logging.debug('Number of files: {}'.format(len(self.data)))
 
     def __getitem__(self, index: int) -> Dict:
-        # sample = self.data.iloc[index]
-        # with rasterio.open(sample['embeddings'], 'r') as f:
-        #     embeddings = f.read()
-        # labels = {'ratio': sample['ratio']}
+        with profiling.timer('dataset.read'):
+            if self.store is not None:
+                embeddings = self.store[self.offsets[index]]
+            else:
+                with rasterio.open(resolve_path(self.path, self.data['embeddings'].iloc[index]), 'r') as f:
+                    embeddings = f.read()
+            if self.normalization is not None:
+                embeddings = self.normalization(embeddings)
+        labels = {'ratio': self.ratios[index]}
 
-        # return {'embeddings': embeddings, 'label': labels}
-        return index
+        return {'embeddings': torch.from_numpy(embeddings), 'label': labels}
 
     def __len__(self) -> int:
         return len(self.data)
 
 
+class ShardedMangroveDataset(IterableDataset):
+    """
+    Streaming counterpart of MangroveDataset for datasets larger than RAM, reading the
+    shards written by `mangroves.store.write_shards` sequentially.
+
+    Shards are split across DDP ranks and DataLoader workers so that each one is read by a
+    single consumer, and samples are shuffled within a bounded buffer. Call `set_epoch`
+    before each epoch to draw a new shuffling, as EpochDataLoader does.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 train: bool = True,
+                 buffer_size: int = 64,
+                 shuffle: bool = True,
+                 seed: int = 42,
+                 shards: Optional[List[str]] = None,
+                 normalize: bool = False,
+                 clip_percentile: Optional[float] = None):
+        """
+        Args:
+            path (Path): Path to the directory containing the shards.
+            train (bool, optional): Whether to load the training set (True) or the test set (False).
+            buffer_size (int, optional): Number of samples held in the shuffle buffer.
+            shuffle (bool, optional): Shuffle the shards and the samples.
+            seed (int, optional): Seed of the shuffling, offset by the epoch.
+            shards (List[str], optional): Subset of the shards to read, all of them by default.
+            normalize (bool, optional): Normalize the bands with the statistics saved next to the store.
+            clip_percentile (float, optional): Clip the bands to their [p, 100 - p] percentiles before normalizing.
+        """
+        self.path = Path(os.path.expanduser(path))
+        self.train = train
+        self.buffer_size = buffer_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.normalize = normalize
+        self.clip_percentile = clip_percentile
+        self.normalization = Normalization.from_dataset(self.path, clip_percentile) if normalize else None
+
+        manifest = pd.read_csv(self.path / 'shards.csv')
+        manifest = manifest[manifest['train'] == train]
+        if shards is not None:
+            manifest = manifest[manifest['shard'].isin(shards)]
+        self.shards = manifest['shard'].tolist()
+        self.samples = manifest['samples'].tolist()
+        logging.debug('Number of shards: {}'.format(len(self.shards)))
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def split(self, 
+              val_split: float, 
+              test_split: float) -> Tuple['ShardedMangroveDataset', 'ShardedMangroveDataset', 'ShardedMangroveDataset']:
+        """
+        Split the shards into training, validation and test datasets.
+
+        Returns:
+            Tuple[ShardedMangroveDataset, ...]: The training, validation and test datasets.
+        """
+        order = np.random.default_rng(self.seed).permutation(len(self.shards))
+        test_size = int(len(order) * test_split)
+        val_size = int(len(order) * val_split)
+        train_size = len(order) - test_size - val_size
+        assert train_size > 0, 'Not enough shards for the requested splits.'
+        splits = [order[:train_size], order[train_size:train_size + val_size], order[train_size + val_size:]]
+        return tuple(
+            ShardedMangroveDataset(self.path, self.train, self.buffer_size, self.shuffle and i == 0, self.seed, 
+                                   [self.shards[j] for j in split], self.normalize, self.clip_percentile)
+            for i, split in enumerate(splits)
+        )
+
+    @staticmethod
+    def _rank() -> Tuple[int, int]:
+        if dist.is_available() and dist.is_initialized():
+            return dist.get_rank(), dist.get_world_size()
+        return 0, 1
+
+    def _balance(self, world_size: int) -> Tuple[List[List[int]], int]:
+        """
+        Assign the shards to the ranks, largest first to the rank with the fewest samples so far,
+        ties being broken by the shuffling of the epoch.
+
+        Returns:
+            Tuple[List[List[int]], int]: The shards of each rank, and the number of samples of the
+                largest rank, which does not depend on the epoch.
+        """
+        order = np.arange(len(self.shards))
+        if self.shuffle:
+            np.random.default_rng(self.seed + self.epoch).shuffle(order)
+        order = order[np.argsort(-np.asarray(self.samples)[order], kind='stable')]
+        assigned, totals = [[] for _ in range(world_size)], np.zeros(world_size, dtype=np.int64)
+        for i in order:
+            r = int(np.argmin(totals))
+            assigned[r].append(int(i))
+            totals[r] += self.samples[i]
+        return assigned, int(totals.max())
+
+    def _assigned_shards(self) -> List[Tuple[str, int]]:
+        """
+        Shards read by the current DataLoader worker of the current rank, with the number of
+        samples to read from each.
+
+        Every rank is padded to the samples of the largest one by reading its first shards again,
+        as DistributedSampler does, since DDP ranks that run out of batches early wait for the
+        others forever.
+        """
+        rank, world_size = self._rank()
+        worker_info = get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        assert len(self.shards) >= world_size, f'{len(self.shards)} shards for {world_size} ranks.'
+        if len(self.shards) < world_size * num_workers:
+            logging.warning(f'{len(self.shards)} shards for {world_size * num_workers} consumers, some will stay idle.')
+
+        assigned, remaining = self._balance(world_size)
+        if self.shuffle:
+            np.random.default_rng((self.seed, self.epoch, rank)).shuffle(assigned[rank])
+        shards = []
+        while remaining > 0:
+            for i in assigned[rank]:
+                if remaining <= 0:
+                    break
+                shards.append((self.shards[i], min(self.samples[i], remaining)))
+                remaining -= self.samples[i]
+        return shards[worker_id::num_workers]
+
+    def _read(self, shards: List[Tuple[str, int]]) -> Iterator[Dict]:
+        for shard, n_samples in shards:
+            embeddings = np.load(self.path / f'{shard}.npy', mmap_mode='r')
+            ratios = np.load(self.path / f'{shard}.ratio.npy')
+            for i in range(n_samples):
+                patch = np.array(embeddings[i]) if self.normalization is None else self.normalization(embeddings[i])
+                yield {'embeddings': torch.from_numpy(patch), 'label': {'ratio': ratios[i]}}
+
+    def __iter__(self) -> Iterator[Dict]:
+        samples = self._read(self._assigned_shards())
+        if not self.shuffle:
+            yield from samples
+            return
+
+        worker_info = get_worker_info()
+        rng = np.random.default_rng((self.seed, self.epoch, 0 if worker_info is None else worker_info.id))
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.buffer_size:
+                buffer.append(sample)
+                continue
+            i = rng.integers(len(buffer))
+            buffer[i], sample = sample, buffer[i]
+            yield sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def __len__(self) -> int:
+        """
+        Number of samples of the current rank.
+        """
+        _, world_size = self._rank()
+        return sum(self.samples) if world_size == 1 else self._balance(world_size)[1]
+
+
+class EpochDataLoader(DataLoader):
+    """
+    DataLoader calling `set_epoch` on its dataset every time it is iterated, before the workers
+    copy the dataset. Lightning only does so for samplers, which iterable datasets do not have.
+    """
+
+    def __init__(self, dataset: Dataset, epoch: int = 0, **kwargs):
+        super().__init__(dataset, **kwargs)
+        self.epoch = epoch
+
+    def __iter__(self):
+        if hasattr(self.dataset, 'set_epoch'):
+            self.dataset.set_epoch(self.epoch)
+        self.epoch += 1
+        return super().__iter__()
+
+
 class MangroveDataModule(LightningDataModule):
     """
     Based on PyTorch Lightning DataModule, this class is used to create a DataModule for a dataset.
     """
     def __init__(self,
-                 dataset: MangroveDataset,
+                 dataset: Dataset,
                  batch_size: int = 32,
                  num_processes: int = 1,
                  val_split: float = 0.1,
                  test_split: float = 0.1,
                  pin_memory: bool = False,
-                 shuffle: bool = False):
+                 shuffle: bool = False,
+                 splits_path: Optional[str] = None,
+                 seed: int = 42):
         """
         Args:
-            dataset(MangroveDataset): The dataset to be used.
+            dataset(Dataset): The dataset to be used, either a MangroveDataset or a ShardedMangroveDataset.
             batch_size (int, optional): Batch size for the dataloaders.
             num_processes (int, optional): Number of processes to use for loading the dataset.
             val_split (float, optional): Validation split ratio.
             test_split (float, optional): Test split ratio.
             pin_memory (bool, optional): Pin memory for faster GPU transfer.
             shuffle (bool, optional): Shuffle the dataset.
+            splits_path (str, optional): Directory of spatially blocked splits written by
+                mangroves.splits, memory-mapped instead of splitting the dataset at random.
+            seed (int, optional): Seed of the random split, when no splits_path is given.
         """
         super().__init__()
         self.batch_size = batch_size
@@ -71,24 +277,38 @@ class MangroveDataModule(LightningDataModule):
         self.pin_memory = pin_memory
         self.shuffle = shuffle
 
-        test_size = int(len(dataset) * test_split)
-        val_size = int(len(dataset) * val_split)
-        train_size = len(dataset) - test_size - val_size
-        assert train_size + val_size + test_size == len(dataset), 'Split sizes do not add up to dataset size'
-        randperm = torch.randperm(len(dataset))
-        self.train_index = randperm[:train_size]
-        self.val_index = randperm[train_size:train_size + val_size]
-        self.test_index = randperm[train_size + val_size:]
+        if isinstance(dataset, IterableDataset):
+            # Streaming datasets are split by shards and shuffle themselves
+            self.train_dataset, self.val_dataset, self.test_dataset = dataset.split(val_split, test_split)
+            self.shuffle = False
+            return
+
+        if splits_path is not None:
+            from mangroves.splits import load_splits
+            splits = load_splits(splits_path, len(dataset))
+            self.train_index, self.val_index, self.test_index = splits['train'], splits['val'], splits['test']
+        else:
+            test_size = int(len(dataset) * test_split)
+            val_size = int(len(dataset) * val_split)
+            train_size = len(dataset) - test_size - val_size
+            assert train_size + val_size + test_size == len(dataset), 'Split sizes do not add up to dataset size'
+            randperm = torch.randperm(len(dataset), generator=torch.Generator().manual_seed(seed))
+            self.train_index = randperm[:train_size]
+            self.val_index = randperm[train_size:train_size + val_size]
+            self.test_index = randperm[train_size + val_size:]
         self.train_dataset = Subset(dataset, self.train_index)
         self.val_dataset = Subset(dataset, self.val_index)
         self.test_dataset = Subset(dataset, self.test_index)
 
     def train_dataloader(self) -> DataLoader:
-        return DataLoader(self.train_dataset, 
-                          batch_size=self.batch_size, 
-                          num_workers=self.num_processes, 
-                          pin_memory=self.pin_memory, 
-                          shuffle=self.shuffle)
+        # Start from the restored epoch when resuming from a checkpoint
+        epoch = self.trainer.current_epoch if self.trainer is not None else 0
+        return EpochDataLoader(self.train_dataset, 
+                               epoch=epoch,
+                               batch_size=self.batch_size, 
+                               num_workers=self.num_processes, 
+                               pin_memory=self.pin_memory, 
+                               shuffle=self.shuffle)
 
     def val_dataloader(self) -> DataLoader:
         return DataLoader(self.val_dataset, 
@@ -1,81 +1,315 @@
-import torch.optim as Optimizer
-import torch.optim.lr_scheduler as LR_Scheduler
-import pytorch_lightning.callbacks as Callbacks
-import pytorch_lightning.loggers as Loggers
-import torchvision.transforms as T
-from pytorch_lightning import LightningDataModule, LightningModule, Trainer
-import mangroves.datasets as datasets
-import mangroves.models as models
-import mangroves.modules as modules
-import mangroves.transforms as mT
-from mangroves.scripts.data import MangroveDataset, MangroveDataModule
-from ruamel.yaml import YAML
-from typing import List
+import importlib
+import importlib.util
 import os
+import sys
+from pathlib import Path
+from ruamel.yaml import YAML
+from typing import Any, Dict, List, Sequence, Union
+
+
+# Modules searched for the class names of the configuration files, imported on first use only
+MODEL_MODULES = ['mangroves.models']
+LITMODULE_MODULES = ['mangroves.modules']
+OPTIMIZER_MODULES = ['torch.optim']
+LR_SCHEDULER_MODULES = ['torch.optim.lr_scheduler']
+CALLBACK_MODULES = ['pytorch_lightning.callbacks', 'mangroves.scripts.callbacks']
+LOGGER_MODULES = ['pytorch_lightning.loggers']
+
+DATASET_KEYS = {'path', 'max_samples', 'sharded', 'buffer_size', 'seed', 'normalize', 'clip_percentile'}
+
+
+class ConfigError(ValueError):
+    """
+    Invalid configuration file, listing all the problems found in it.
+    """
+
+    def __init__(self, path: str, errors: List[str]) -> None:
+        self.path = path
+        self.errors = errors
+        super().__init__(f'Invalid configuration {path}:\n' + '\n'.join(f'  - {error}' for error in errors))
+
+
+# Schemas: key -> (type, required), nested schemas being dictionaries
+DATAMODULE_SCHEMA = {
+    'name': (str, False),
+    'path': (str, True),
+    'max_samples': (int, False),
+    'sharded': (bool, False),
+    'buffer_size': (int, False),
+    'seed': (int, False),
+    'normalize': (bool, False),
+    'clip_percentile': (float, False),
+    'batch_size': (int, False),
+    'num_processes': (int, False),
+    'val_split': (float, False),
+    'test_split': (float, False),
+    'pin_memory': (bool, False),
+    'shuffle': (bool, False),
+    'splits_path': (str, False),
+}
+
+CLASS_SCHEMA = {
+    'name': (str, True),
+    'parameters': (dict, False),
+}
+
+LITMODULE_SCHEMA = {
+    'checkpoint_path': (str, False),
+    'model_options': ({
+        'model_class': (str, True),
+        'parameters': (dict, False),
+    }, True),
+    'litmodule_options': ({
+        'litmodule_class': (str, True),
+        'checkpoint_path': (str, False),
+        'optimizers': (CLASS_SCHEMA, False),
+        'lr_schedulers': (CLASS_SCHEMA, False),
+        'parameters': (dict, False),
+    }, True),
+}
+
+TRAINER_SCHEMA = {
+    'hyperparameters': (dict, True),
+    'callbacks': ({
+        'name': (list, True),
+        'parameters': (list, False),
+    }, False),
+    'logger': (CLASS_SCHEMA, False),
+}
+
+
+def validate(
+        config: Any,
+        schema: Dict,
+        prefix: str = '') -> List[str]:
+    """
+    Check a configuration against a schema.
+
+    Returns:
+        List[str]: The errors found, empty if the configuration is valid.
+    """
+    if not isinstance(config, dict):
+        return [f'{prefix or "configuration"} must be a mapping, got {type(config).__name__}']
+    errors = []
+    for key in config:
+        if key not in schema:
+            errors.append(f'unknown key {prefix}{key}')
+    for key, (expected, required) in schema.items():
+        if key not in config or config[key] is None:
+            if required:
+                errors.append(f'missing key {prefix}{key}')
+            continue
+        value = config[key]
+        if isinstance(expected, dict):
+            errors += validate(value, expected, f'{prefix}{key}.')
+        elif expected is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+            continue
+        elif not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            errors.append(f'{prefix}{key} must be of type {expected.__name__}, got {type(value).__name__}')
+    return errors
+
+
+def read_config(
+        path_config: str,
+        schema: Dict) -> Dict:
+    """
+    Read and validate a YAML configuration file.
+
+    Raises:
+        ConfigError: If the file does not exist, cannot be parsed or does not match the schema.
+    """
+    path_config = os.path.expanduser(path_config)
+    if not os.path.exists(path_config):
+        raise ConfigError(path_config, ['file does not exist'])
+    try:
+        with open(path_config, "r") as config:
+            config = YAML(typ="safe").load(config)
+    except Exception as e:
+        raise ConfigError(path_config, [f'cannot be parsed: {e}'])
+    errors = validate(config, schema)
+    if errors:
+        raise ConfigError(path_config, errors)
+    return config
+
 
+def resolve(
+        name: str,
+        modules: Sequence[str]) -> type:
+    """
+    Resolve a class from its name, importing the modules where it is searched only now.
+    Fully qualified names (e.g. `torch.optim.AdamW`) are imported directly.
+    """
+    if '.' in name:
+        module_name, _, name = name.rpartition('.')
+        modules = [module_name]
+    for module_name in modules:
+        module = importlib.import_module(module_name)
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise ConfigError(name, [f'class {name} not found in {", ".join(modules)}'])
 
-def load_datamodule_from_config(path_config: List[str]) -> LightningDataModule:
-    with open(path_config, "r") as config:
-        yaml = YAML(typ="safe")
-        config = yaml.load(config)
 
+def check_resolvable(
+        name: str,
+        modules: Sequence[str]) -> List[str]:
+    """
+    Check that the module of a class exists, without importing it. Submodules of packages that
+    are not imported yet (e.g. torch) are only checked down to the package.
+    """
+    if '.' in name:
+        modules = [name.rpartition('.')[0]]
+    for module_name in modules:
+        parts = module_name.split('.')
+        spec_name = parts[0]
+        for i in range(1, len(parts)):
+            if spec_name not in sys.modules:
+                break
+            spec_name = '.'.join(parts[:i + 1])
+        try:
+            if importlib.util.find_spec(spec_name) is not None:
+                return []
+        except ModuleNotFoundError:
+            pass
+    return [f'no module {" or ".join(modules)} to resolve {name}']
+
+
+def validate_configs(
+        litmodule_config: str,
+        datamodule_configs: Sequence[str] = (),
+        trainer_config: str = None) -> Dict[str, Dict]:
+    """
+    Validate configuration files without importing any heavy dependency, for dry runs.
+
+    Returns:
+        Dict[str, Dict]: The parsed configurations, by path.
+    Raises:
+        ConfigError: On the first invalid configuration.
+    """
+    configs = {}
+    for path_config in datamodule_configs:
+        config = read_config(path_config, DATAMODULE_SCHEMA)
+        if not os.path.exists(os.path.expanduser(config['path'])):
+            raise ConfigError(path_config, [f'dataset path {config["path"]} does not exist'])
+        if config.get('splits_path') and not os.path.exists(os.path.expanduser(config['splits_path'])):
+            raise ConfigError(path_config, [f'splits path {config["splits_path"]} does not exist'])
+        configs[path_config] = config
+
+    config = read_config(litmodule_config, LITMODULE_SCHEMA)
+    errors = check_resolvable(config['model_options']['model_class'], MODEL_MODULES)
+    errors += check_resolvable(config['litmodule_options']['litmodule_class'], LITMODULE_MODULES)
+    if errors:
+        raise ConfigError(litmodule_config, errors)
+    configs[litmodule_config] = config
+
+    if trainer_config is not None:
+        config = read_config(trainer_config, TRAINER_SCHEMA)
+        callbacks = config.get('callbacks') or {}
+        if len(callbacks.get('parameters') or []) not in (0, len(callbacks.get('name', []))):
+            raise ConfigError(trainer_config, ['callbacks.name and callbacks.parameters must have the same length'])
+        configs[trainer_config] = config
+    return configs
+
+
+def load_datamodule_from_config(path_config: Union[str, Sequence[str]]):
+    """
+    Build one MangroveDataModule per configuration file.
+
+    Returns:
+        List[MangroveDataModule] for a list of paths, a single MangroveDataModule otherwise.
+    """
+    if not isinstance(path_config, str):
+        return [load_datamodule_from_config(path) for path in path_config]
+
+    from mangroves.scripts.data import MangroveDataset, ShardedMangroveDataset, MangroveDataModule
+
+    config = read_config(path_config, DATAMODULE_SCHEMA)
     config['path'] = os.path.expanduser(config['path'])  # Convert ~ to /home/user
+    name = config.pop('name', Path(path_config).stem)
+    dataset_options = {key: config.pop(key) for key in DATASET_KEYS if key in config}
+    if 'seed' in dataset_options:
+        config['seed'] = dataset_options['seed']
+    if config.get('splits_path') is not None:
+        config['splits_path'] = os.path.expanduser(config['splits_path'])
 
-    return MangroveDataModule(**config)
+    if dataset_options.pop('sharded', False):
+        dataset_options.pop('max_samples', None)
+        dataset = ShardedMangroveDataset(**dataset_options)
+    else:
+        dataset_options.pop('buffer_size', None)
+        dataset_options.pop('seed', None)
+        dataset = MangroveDataset(**dataset_options)
 
+    datamodule = MangroveDataModule(dataset, **config)
+    datamodule.datamodule_name = name
+    return datamodule
 
-def load_litmodule_from_config(path_config: str) -> LightningModule:
-    with open(path_config, "r") as config:
-        yaml = YAML(typ="safe")
-        config = yaml.load(config)
 
-    # Load Model
-    model_options = config.get('model_options')
-    assert model_options is not None, "model_options must be provided in the configuration file."
+def load_normalization_from_config(path_config: str):
+    """
+    Normalization of the samples of the dataset of a LightningDataModule configuration file.
 
-    model_class = getattr(models, model_options.get('model_class'))
-    assert model_class is not None, f"Model class {model_options['model_class']} not found."
-        
-    net = model_class(**model_options['parameters'])
+    Returns:
+        Normalization or None: The normalization, None if the configuration does not normalize the samples.
+    """
+    config = read_config(path_config, DATAMODULE_SCHEMA)
+    if not config.get('normalize', False):
+        return None
+
+    from mangroves.stats import Normalization
+
+    return Normalization.from_dataset(config['path'], config.get('clip_percentile'))
 
-    # Load LitModule
-    litmodule_options = config.get('litmodule_options')
-    assert litmodule_options is not None, "litmodule_options must be provided in the configuration file."
 
-    litmodule_class = getattr(modules, litmodule_options.get("litmodule_class"))
-    assert litmodule_class is not None, f"LitModule class {litmodule_options['litmodule_class']} not found."
+def load_litmodule_from_config(path_config: str):
+    config = read_config(path_config, LITMODULE_SCHEMA)
+
+    # Load Model
+    model_options = config['model_options']
+    model_class = resolve(model_options['model_class'], MODEL_MODULES)
+    net = model_class(**model_options.get('parameters', {}))
+
+    # Load LitModule
+    litmodule_options = config['litmodule_options']
+    litmodule_class = resolve(litmodule_options['litmodule_class'], LITMODULE_MODULES)
 
     if litmodule_options.get('optimizers') is not None:  #TODO: Allow multiple optimizers
-        optimizer = getattr(Optimizer, litmodule_options['optimizers']['name'])(net.parameters(), **litmodule_options['optimizers']['parameters'])
+        optimizer_class = resolve(litmodule_options['optimizers']['name'], OPTIMIZER_MODULES)
+        optimizer = optimizer_class(net.parameters(), **litmodule_options['optimizers'].get('parameters', {}))
     else:
         optimizer = None
 
     if litmodule_options.get('lr_schedulers') is not None:
-        lr_scheduler = getattr(LR_Scheduler, litmodule_options['lr_schedulers']['name'])(optimizer, **litmodule_options['lr_schedulers']['parameters'])
+        lr_scheduler_class = resolve(litmodule_options['lr_schedulers']['name'], LR_SCHEDULER_MODULES)
+        lr_scheduler = lr_scheduler_class(optimizer, **litmodule_options['lr_schedulers'].get('parameters', {}))
     else:
         lr_scheduler = None
 
     litmodule_parameters = {'optimizer': optimizer, 'lr_scheduler': lr_scheduler, 'parameters': litmodule_options.get('parameters', {})}
     litmodule = litmodule_class(net, **litmodule_parameters)
 
-    if config.get('checkpoint_path', None) is not None:
-        litmodule_class.load_from_checkpoint(config['checkpoint_path'], net=litmodule.net)    
+    checkpoint_path = config.get('checkpoint_path') or litmodule_options.get('checkpoint_path')
+    if checkpoint_path:
+        litmodule = litmodule_class.load_from_checkpoint(os.path.expanduser(checkpoint_path), net=litmodule.net)
 
     return litmodule
 
 
-def load_trainer_from_config(path_config: str) -> Trainer:
-    with open(path_config, "r") as config:
-        yaml = YAML(typ="safe")
-        config = yaml.load(config)
+def load_trainer_from_config(path_config: str):
+    from pytorch_lightning import Trainer
 
+    config = read_config(path_config, TRAINER_SCHEMA)
     trainer_parameters = config['hyperparameters']
 
     callbacks = []
-    for c, p in zip(config['callbacks']['name'], config['callbacks']['parameters']):
-        callbacks.append(getattr(Callbacks, c)(**p))
+    callback_options = config.get('callbacks') or {}
+    names = callback_options.get('name', [])
+    parameters = callback_options.get('parameters') or [{} for _ in names]
+    for c, p in zip(names, parameters):
+        callbacks.append(resolve(c, CALLBACK_MODULES)(**(p or {})))
     trainer_parameters['callbacks'] = callbacks
 
-    trainer_parameters['logger'] = getattr(Loggers, config['logger']['name'])(**config['logger']['parameters'])
+    if config.get('logger') is not None:
+        logger_class = resolve(config['logger']['name'], LOGGER_MODULES)
+        trainer_parameters['logger'] = logger_class(**config['logger'].get('parameters', {}))
 
     return Trainer(**trainer_parameters)
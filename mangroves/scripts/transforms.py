@@ -1,8 +1,10 @@
+import abc
 import numpy as np
 import torch
+from torch.utils.data import default_collate
 from torchvision.transforms import functional as F
 import torchvision.transforms as T
-from typing import Tuple, Dict
+from typing import List, Sequence, Tuple, Dict
 
 
 class ParametricTransform(torch.nn.Module):
@@ -31,4 +33,191 @@ class Compose(T.Compose):
             else:
                 img = t(img)
         return img, compose_parameters
-    
\ No newline at end of file
+    
+
+class BatchParametricTransform(ParametricTransform):
+    """
+    Parametric transform applied to a whole (B, C, H, W) batch at once. The parameters
+    drawn for each sample are returned as tensors indexed by the batch dimension.
+    """
+
+
+class GeometricTransform(BatchParametricTransform, abc.ABC):
+    """
+    Batch transform moving pixels around. Subclasses draw per-sample parameters and map the
+    coordinates of the output pixels back to the input ones, so that consecutive geometric
+    transforms are fused into a single gather, i.e. a single pass over the batch.
+    """
+    @abc.abstractmethod
+    def sample(self, B: int, H: int, W: int, device: torch.device) -> Dict[str, torch.Tensor]:
+        pass
+
+    def output_size(self, H: int, W: int) -> Tuple[int, int]:
+        return H, W
+
+    @abc.abstractmethod
+    def source(self, 
+               rows: torch.Tensor, 
+               cols: torch.Tensor, 
+               parameters: Dict[str, torch.Tensor], 
+               H: int, 
+               W: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Args:
+            rows, cols (torch.Tensor): (B, h, w) coordinates of pixels in the output of the transform.
+            parameters (Dict[str, torch.Tensor]): The parameters drawn by `sample`.
+            H, W (int): Size of the input of the transform.
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: The coordinates of the same pixels in the input.
+        """
+
+    def forward(self, batch: torch.Tensor) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+        return apply_geometric([self], batch)
+
+
+def apply_geometric(
+        transforms: List[GeometricTransform], 
+        batch: torch.Tensor) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+    """
+    Apply a sequence of geometric transforms to a (B, C, H, W) batch with a single gather.
+
+    Returns:
+        Tuple[torch.Tensor, Dict[str, torch.Tensor]]: The transformed batch and the parameters of all the transforms.
+    """
+    B, C, H, W = batch.shape
+    sizes = [(H, W)]
+    parameters = []
+    for t in transforms:
+        parameters.append(t.sample(B, *sizes[-1], batch.device))
+        sizes.append(t.output_size(*sizes[-1]))
+
+    h, w = sizes[-1]
+    rows = torch.arange(h, device=batch.device)[None, :, None].expand(B, h, w)
+    cols = torch.arange(w, device=batch.device)[None, None, :].expand(B, h, w)
+    for t, p, size in reversed(list(zip(transforms, parameters, sizes[:-1]))):
+        rows, cols = t.source(rows, cols, p, *size)
+
+    index = (rows * W + cols).reshape(B, 1, h * w).expand(B, C, h * w)
+    batch = batch.reshape(B, C, H * W).gather(2, index).view(B, C, h, w)
+
+    compose_parameters = {}
+    for p in parameters:
+        compose_parameters.update(p)
+    return batch, compose_parameters
+
+
+class RandomFlip(GeometricTransform):
+    """
+    Flip each sample horizontally or vertically with probability p.
+    """
+    def __init__(self, p: float = 0.5, vertical: bool = False):
+        super().__init__()
+        self.p = p
+        self.vertical = vertical
+        self.name = 'vflip' if vertical else 'hflip'
+
+    def sample(self, B, H, W, device):
+        return {self.name: torch.rand(B, device=device) < self.p}
+
+    def source(self, rows, cols, parameters, H, W):
+        flip = parameters[self.name][:, None, None]
+        if self.vertical:
+            return torch.where(flip, H - 1 - rows, rows), cols
+        return rows, torch.where(flip, W - 1 - cols, cols)
+
+
+class RandomRot90(GeometricTransform):
+    """
+    Rotate each sample by a random multiple of 90 degrees, as torch.rot90 over the last two dimensions.
+    Images must be square.
+    """
+    def sample(self, B, H, W, device):
+        assert H == W, 'RandomRot90 requires square images.'
+        return {'rot90': torch.randint(0, 4, (B,), device=device)}
+
+    def source(self, rows, cols, parameters, H, W):
+        k = parameters['rot90'][:, None, None]
+        n = H - 1
+        src_rows = torch.where(k == 0, rows, torch.where(k == 1, cols, torch.where(k == 2, n - rows, n - cols)))
+        src_cols = torch.where(k == 0, cols, torch.where(k == 1, n - rows, torch.where(k == 2, n - cols, rows)))
+        return src_rows, src_cols
+
+
+class RandomCrop(GeometricTransform):
+    """
+    Crop each sample at a random location.
+    """
+    def __init__(self, size: Tuple[int, int]):
+        super().__init__()
+        self.size = (size, size) if isinstance(size, int) else tuple(size)
+
+    def sample(self, B, H, W, device):
+        h, w = self.size
+        assert h <= H and w <= W, f'Crop size {self.size} larger than the images ({H}, {W}).'
+        top = torch.randint(0, H - h + 1, (B,), device=device)
+        left = torch.randint(0, W - w + 1, (B,), device=device)
+        return {'crop': torch.stack([top, left], dim=1)}
+
+    def output_size(self, H, W):
+        return self.size
+
+    def source(self, rows, cols, parameters, H, W):
+        crop = parameters['crop'][:, :, None, None]
+        return rows + crop[:, 0], cols + crop[:, 1]
+
+
+class Normalize(torch.nn.Module):
+    """
+    Per-band normalization of (..., C, H, W) tensors, as a single broadcast operation.
+    """
+    def __init__(self, mean: Sequence[float], std: Sequence[float], inplace: bool = False):
+        super().__init__()
+        self.inplace = inplace
+        self.register_buffer('mean', torch.as_tensor(mean, dtype=torch.float32)[:, None, None])
+        self.register_buffer('inv_std', 1. / torch.as_tensor(std, dtype=torch.float32)[:, None, None])
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        if self.inplace:
+            return batch.sub_(self.mean).mul_(self.inv_std)
+        return (batch - self.mean) * self.inv_std
+
+
+class BatchCompose(Compose):
+    """
+    Compose transforms applied to whole (B, C, H, W) batches, typically in a `collate_fn`
+    or in `LightningModule.on_after_batch_transfer`. Consecutive geometric transforms are
+    fused into a single gather, and parameters are merged into a single dictionary of
+    per-sample tensors.
+    """
+    def __call__(self, batch: torch.Tensor) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+        compose_parameters = {}
+        geometric = []
+        for t in self.transforms + [None]:
+            if isinstance(t, GeometricTransform):
+                geometric.append(t)
+                continue
+            if len(geometric) > 0:
+                batch, parameters = apply_geometric(geometric, batch)
+                compose_parameters.update(parameters)
+                geometric = []
+            if t is None:
+                break
+            if isinstance(t, ParametricTransform):
+                batch, parameters = t(batch)
+                compose_parameters.update(parameters)
+            else:
+                batch = t(batch)
+        return batch, compose_parameters
+
+    def collate(self, samples: List[Dict]) -> Dict:
+        """
+        Collate function applying the transforms to the embeddings of the batch.
+
+        Args:
+            samples (List[Dict]): Samples of a MangroveDataset.
+        Returns:
+            Dict: The collated batch, with the parameters of the transforms under 'parameters'.
+        """
+        batch = default_collate(samples)
+        batch['embeddings'], batch['parameters'] = self(batch['embeddings'])
+        return batch
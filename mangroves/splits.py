@@ -0,0 +1,230 @@
+import os
+import json
+import math
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Optional
+from mangroves.constants import RADIUS_EARTH_M, SPATIAL_RESOLUTION_M, REGION_DIAMETER_P
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+SPLITS = ('train', 'val', 'test')
+BLOCK_SIZE_M = 4 * REGION_DIAMETER_P * SPATIAL_RESOLUTION_M  # 4 chips, about 10 km
+CHIP_SIZE_M = REGION_DIAMETER_P * SPATIAL_RESOLUTION_M
+
+
+def spatial_blocks(
+        lat_deg: np.ndarray,
+        lon_deg: np.ndarray,
+        block_size_m: float = BLOCK_SIZE_M) -> np.ndarray:
+    """
+    Assign points to square blocks of a grid of about `block_size_m` meters.
+
+    Rows are bands of latitude, and each row is split into columns at the scale of its center
+    latitude, so that blocks keep the same size in meters at all latitudes.
+
+    Returns:
+        np.ndarray: The int64 id of the block of each point.
+    """
+    meters_per_deg = RADIUS_EARTH_M * math.pi / 180
+    rows = np.floor(np.asarray(lat_deg) * meters_per_deg / block_size_m).astype(np.int64)
+    lat_c_rad = np.radians((rows + 0.5) * block_size_m / meters_per_deg)
+    cols = np.floor(np.asarray(lon_deg) * meters_per_deg * np.cos(lat_c_rad) / block_size_m).astype(np.int64)
+    return rows * (1 << 32) + cols
+
+
+def assign_blocks(
+        blocks: np.ndarray,
+        strata: np.ndarray,
+        val_split: float = 0.1,
+        test_split: float = 0.1,
+        seed: int = 42) -> np.ndarray:
+    """
+    Assign whole blocks to the splits, stratified by the dominant stratum of each block.
+
+    Within each stratum, blocks are visited from the largest, ties in a seeded random order, and
+    each one goes to the split furthest below its target number of samples, so that the splits get the requested
+    fractions of the samples of every stratum.
+
+    Args:
+        blocks (np.ndarray): The block of each sample.
+        strata (np.ndarray): The stratum of each sample, e.g. its coverage category.
+        val_split (float, optional): Fraction of the samples in the validation split.
+        test_split (float, optional): Fraction of the samples in the test split.
+        seed (int, optional): Seed of the order of the blocks.
+    Returns:
+        np.ndarray: The split of each sample, 0 for train, 1 for val and 2 for test.
+    """
+    fractions = np.array([1 - val_split - test_split, val_split, test_split])
+    assert fractions[0] > 0, 'Not enough samples left for training.'
+    rng = np.random.default_rng(seed)
+
+    block_ids, block_of_sample = np.unique(blocks, return_inverse=True)
+    block_sizes = np.bincount(block_of_sample)
+    # Dominant stratum of each block
+    stratum_ids, stratum_of_sample = np.unique(strata, return_inverse=True)
+    counts = np.zeros((len(block_ids), len(stratum_ids)), dtype=np.int64)
+    np.add.at(counts, (block_of_sample, stratum_of_sample), 1)
+    block_strata = counts.argmax(axis=1)
+
+    block_splits = np.zeros(len(block_ids), dtype=np.int8)
+    for stratum in range(len(stratum_ids)):
+        members = rng.permutation(np.flatnonzero(block_strata == stratum))
+        members = members[np.argsort(-block_sizes[members], kind='stable')]  # Large blocks first
+        targets = fractions * block_sizes[members].sum()
+        filled = np.zeros(3)
+        for block in members:
+            split = np.argmax(targets - filled)
+            block_splits[block] = split
+            filled[split] += block_sizes[block]
+    return block_splits[block_of_sample]
+
+
+def guard_band(
+        lat_deg: np.ndarray,
+        lon_deg: np.ndarray,
+        blocks: np.ndarray,
+        labels: np.ndarray,
+        chip_size_m: float = CHIP_SIZE_M,
+        block_size_m: float = BLOCK_SIZE_M) -> np.ndarray:
+    """
+    Samples whose chip reaches into a block of another split.
+
+    A corner of the chip of such a sample lies in a neighbouring block assigned to another split.
+    Dropping them leaves the chips of different splits at least `chip_size_m` apart, so that
+    they never overlap.
+
+    Returns:
+        np.ndarray: The boolean mask of the samples to drop.
+    """
+    lat_deg, lon_deg = np.asarray(lat_deg, dtype=np.float64), np.asarray(lon_deg, dtype=np.float64)
+    block_ids, first = np.unique(blocks, return_index=True)
+    block_labels = labels[first]
+    half_deg = chip_size_m / 2 / (RADIUS_EARTH_M * math.pi / 180)
+    half_lon_deg = half_deg / np.maximum(np.cos(np.radians(lat_deg)), 1e-6)
+    drop = np.zeros(len(lat_deg), dtype=bool)
+    for dlat in (-half_deg, half_deg):
+        for dlon in (-half_lon_deg, half_lon_deg):
+            corners = spatial_blocks(lat_deg + dlat, lon_deg + dlon, block_size_m)
+            position = np.minimum(np.searchsorted(block_ids, corners), len(block_ids) - 1)
+            # Blocks without any sample have no split, and no chip to overlap
+            corner_labels = np.where(block_ids[position] == corners, block_labels[position], -1)
+            drop |= (corner_labels >= 0) & (corner_labels != labels)
+    return drop
+
+
+def make_splits(
+        samples: pd.DataFrame,
+        output_path: str,
+        block_size_m: float = BLOCK_SIZE_M,
+        val_split: float = 0.1,
+        test_split: float = 0.1,
+        seed: int = 42,
+        chip_size_m: float = CHIP_SIZE_M) -> Dict[str, np.ndarray]:
+    """
+    Compute spatially blocked splits of samples and save them as index arrays.
+
+    Each split is saved as `<split>.npy`, the sorted int64 positions of its samples in `samples`,
+    next to `splits.json` holding the parameters and the number of samples. Samples whose chip
+    overlaps a block of another split are left out of all the splits (see guard_band).
+
+    Args:
+        samples (pd.DataFrame): The samples, with lat and lon columns, and a category or ratio column.
+        output_path (str): Directory of the index arrays.
+        block_size_m (float, optional): Size of the blocks in meters, a few chips so that
+            overlapping chips mostly share a block.
+        val_split (float, optional): Fraction of the samples in the validation split.
+        test_split (float, optional): Fraction of the samples in the test split.
+        seed (int, optional): Seed of the assignment.
+        chip_size_m (float, optional): Size of the chips in meters, the width of the guard band
+            between blocks of different splits. 0 keeps all the samples.
+    Returns:
+        Dict[str, np.ndarray]: The indices of each split.
+    """
+    for column in ('lat', 'lon'):
+        assert column in samples, f'Column {column} is required to split the samples spatially.'
+    if 'category' in samples:
+        strata = samples['category'].to_numpy()
+    else:
+        from mangroves.labels import get_category
+        strata = get_category(samples['ratio'].to_numpy())
+
+    blocks = spatial_blocks(samples['lat'].to_numpy(), samples['lon'].to_numpy(), block_size_m)
+    labels = assign_blocks(blocks, strata, val_split, test_split, seed)
+    n_dropped = 0
+    if chip_size_m > 0:
+        drop = guard_band(samples['lat'].to_numpy(), samples['lon'].to_numpy(), blocks, labels,
+                          chip_size_m, block_size_m)
+        labels[drop] = -1
+        n_dropped = int(drop.sum())
+
+    output_path = Path(os.path.expanduser(output_path))
+    output_path.mkdir(parents=True, exist_ok=True)
+    splits = {}
+    for i, name in enumerate(SPLITS):
+        splits[name] = np.flatnonzero(labels == i).astype(np.int64)
+        np.save(output_path / f'{name}.npy', splits[name])
+    with open(output_path / 'splits.json', 'w') as f:
+        json.dump({
+            'n_samples': len(samples), 'n_blocks': int(len(np.unique(blocks))), 'block_size_m': block_size_m,
+            'val_split': val_split, 'test_split': test_split, 'seed': seed,
+            'chip_size_m': chip_size_m, 'n_dropped': n_dropped,
+            'sizes': {name: len(indices) for name, indices in splits.items()},
+        }, f, indent=2)
+    logger.info(f'Split {len(samples)} samples in {len(np.unique(blocks))} blocks: '
+                + ', '.join(f'{len(indices)} {name}' for name, indices in splits.items())
+                + f', {n_dropped} dropped in the guard band')
+    return splits
+
+
+def load_splits(
+        path: str,
+        n_samples: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Memory-map the index arrays written by make_splits.
+
+    Args:
+        path (str): Directory of the index arrays.
+        n_samples (int, optional): Number of samples of the dataset. A dataset truncated with
+            max_samples keeps the indices of its first samples only.
+    Returns:
+        Dict[str, np.ndarray]: The indices of each split.
+    """
+    path = Path(os.path.expanduser(path))
+    splits = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in SPLITS}
+    if n_samples is not None:
+        with open(path / 'splits.json', 'r') as f:
+            expected = json.load(f)['n_samples']
+        assert n_samples <= expected, f'The splits of {path} are for {expected} samples, not {n_samples}.'
+        if n_samples < expected:
+            splits = {name: indices[:np.searchsorted(indices, n_samples)] for name, indices in splits.items()}
+    return splits
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Split the training samples of a dataset by spatial blocks.')
+    parser.add_argument('path', help='Directory of the dataset, with index.csv (embedding store) or data.csv.')
+    parser.add_argument('--output', default=None, help='(Optional) Directory of the splits, defaults to <path>/splits.')
+    parser.add_argument('--block_size_m', type=float, default=BLOCK_SIZE_M, help='(Optional) Size of the blocks in meters.')
+    parser.add_argument('--val_split', type=float, default=0.1, help='(Optional) Fraction of the samples in the validation split.')
+    parser.add_argument('--test_split', type=float, default=0.1, help='(Optional) Fraction of the samples in the test split.')
+    parser.add_argument('--seed', type=int, default=42, help='(Optional) Seed of the assignment.')
+    parser.add_argument('--chip_size_m', type=float, default=CHIP_SIZE_M, help='(Optional) Width of the guard band, 0 to disable.')
+    args = parser.parse_args()
+
+    from mangroves.store import EmbeddingStore
+    path = Path(os.path.expanduser(args.path))
+    samples = pd.read_csv(path / (EmbeddingStore.INDEX_FILE if EmbeddingStore.exists(path) else 'data.csv'))
+    # Same rows, in the same order, as MangroveDataset(train=True)
+    samples = samples[samples['train'] == 1].reset_index(drop=True)
+    output = path / 'splits' if args.output is None else args.output
+    make_splits(samples, output, args.block_size_m, args.val_split, args.test_split, args.seed, args.chip_size_m)
+
+
+if __name__ == '__main__':
+    main()
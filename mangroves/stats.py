@@ -0,0 +1,269 @@
+import os
+import argparse
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+STATS_FILE = 'stats.npz'
+
+
+class BandStatistics:
+    """
+    Streaming per-band statistics of embedding patches: count, mean and variance (Welford, with
+    the parallel update of Chan et al. so that whole patches are added at once), minimum, maximum
+    and a fixed-range histogram for percentiles.
+
+    Accumulators computed over disjoint parts of a dataset, e.g. in different processes, are
+    combined with `merge`, giving the same result as a single pass.
+    """
+
+    def __init__(
+            self,
+            n_bands: int = 64,
+            n_bins: int = 4096,
+            value_range: Tuple[float, float] = (-1., 1.)) -> None:
+        """
+        Args:
+            n_bands (int, optional): Number of bands of the patches.
+            n_bins (int, optional): Number of bins of the histograms, the resolution of the percentiles.
+            value_range (Tuple[float, float], optional): Range of the histograms, values outside
+                it being counted in the edge bins. AlphaEarth embeddings are unit-length vectors.
+        """
+        self.n_bands = n_bands
+        self.n_bins = n_bins
+        self.value_range = (float(value_range[0]), float(value_range[1]))
+        self.count = 0
+        self.mean = np.zeros(n_bands)
+        self.m2 = np.zeros(n_bands)
+        self.min = np.full(n_bands, np.inf)
+        self.max = np.full(n_bands, -np.inf)
+        self.histogram = np.zeros((n_bands, n_bins), dtype=np.int64)
+
+    def _combine(
+            self,
+            count: int,
+            mean: np.ndarray,
+            m2: np.ndarray) -> None:
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def update(self, patch: np.ndarray) -> 'BandStatistics':
+        """
+        Add the pixels of a (D, H, W) patch.
+        """
+        x = np.asarray(patch).reshape(self.n_bands, -1)
+        if x.shape[1] == 0:
+            return self
+        mean = x.mean(axis=1, dtype=np.float64)
+        m2 = np.square(x.astype(np.float64, copy=False) - mean[:, None]).sum(axis=1)
+        self._combine(x.shape[1], mean, m2)
+        np.minimum(self.min, x.min(axis=1), out=self.min)
+        np.maximum(self.max, x.max(axis=1), out=self.max)
+
+        low, high = self.value_range
+        bins = ((x - low) * (self.n_bins / (high - low))).astype(np.int64)
+        np.clip(bins, 0, self.n_bins - 1, out=bins)
+        bins += np.arange(self.n_bands)[:, None] * self.n_bins
+        self.histogram += np.bincount(bins.ravel(), minlength=self.n_bands * self.n_bins).reshape(self.n_bands, -1)
+        return self
+
+    def merge(self, other: 'BandStatistics') -> 'BandStatistics':
+        """
+        Add the statistics of another accumulator with the same bands and histogram bins.
+        """
+        assert (other.n_bands, other.n_bins, other.value_range) == (self.n_bands, self.n_bins, self.value_range), \
+            'Statistics with different bands or histograms cannot be merged.'
+        if other.count == 0:
+            return self
+        self._combine(other.count, other.mean, other.m2)
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.histogram += other.histogram
+        return self
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.m2 / max(self.count, 1))
+
+    def percentile(self, q: float) -> np.ndarray:
+        """
+        Per-band q-th percentile, interpolated within the histogram bins and clipped to the observed range.
+        """
+        low, high = self.value_range
+        width = (high - low) / self.n_bins
+        cumulative = np.cumsum(self.histogram, axis=1)
+        rank = q / 100 * cumulative[:, -1]
+        bins = np.minimum((cumulative < rank[:, None]).sum(axis=1), self.n_bins - 1)
+        rows = np.arange(self.n_bands)
+        before = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+        fraction = (rank - before) / np.maximum(self.histogram[rows, bins], 1)
+        return np.clip(low + (bins + fraction) * width, self.min, self.max)
+
+    def save(self, path: str) -> None:
+        np.savez(
+            os.path.expanduser(path),
+            count=self.count, mean=self.mean, m2=self.m2, min=self.min, max=self.max,
+            histogram=self.histogram, value_range=np.asarray(self.value_range),
+            std=self.std,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'BandStatistics':
+        with np.load(os.path.expanduser(path)) as npzfile:
+            stats = cls(len(npzfile['mean']), npzfile['histogram'].shape[1], tuple(npzfile['value_range']))
+            stats.count = int(npzfile['count'])
+            stats.mean, stats.m2 = npzfile['mean'], npzfile['m2']
+            stats.min, stats.max = npzfile['min'], npzfile['max']
+            stats.histogram = npzfile['histogram']
+        return stats
+
+
+class Normalization:
+    """
+    Per-band normalization of patches, `(clip(x, low, high) - mean) / std`, with all the
+    constants precomputed from saved statistics so that loading a sample costs one clipped copy
+    and an in-place multiply-add.
+    """
+
+    def __init__(
+            self,
+            stats: BandStatistics,
+            clip_percentile: Optional[float] = None) -> None:
+        """
+        Args:
+            stats (BandStatistics): Statistics of the training set.
+            clip_percentile (float, optional): Clip each band to its [p, 100 - p] percentiles before
+                normalizing, e.g. 0.5. No clipping by default.
+        """
+        self.scale = (1 / np.maximum(stats.std, 1e-12)).astype(np.float32)[:, None, None]
+        self.shift = (-stats.mean * self.scale[:, 0, 0]).astype(np.float32)[:, None, None]
+        if clip_percentile is None:
+            self.low, self.high = None, None
+        else:
+            self.low = stats.percentile(clip_percentile).astype(np.float32)[:, None, None]
+            self.high = stats.percentile(100 - clip_percentile).astype(np.float32)[:, None, None]
+
+    @classmethod
+    def from_dataset(
+            cls,
+            path: str,
+            clip_percentile: Optional[float] = None) -> 'Normalization':
+        """
+        Load the statistics saved next to a dataset, in its directory or the parent of its shards.
+        """
+        path = Path(os.path.expanduser(path))
+        for candidate in (path / STATS_FILE, path.parent / STATS_FILE):
+            if candidate.exists():
+                return cls(BandStatistics.load(candidate), clip_percentile)
+        raise FileNotFoundError(f'No {STATS_FILE} for {path}, compute it with `python -m mangroves.stats {path}`.')
+
+    def __call__(self, patch: np.ndarray) -> np.ndarray:
+        """
+        Normalize a (D, H, W) patch, e.g. a slice of a memory map, into a new float32 array.
+        """
+        if self.low is None:
+            out = np.multiply(patch, self.scale, dtype=np.float32)
+        else:
+            out = np.clip(patch, self.low, self.high, dtype=np.float32)
+            out *= self.scale
+        out += self.shift
+        return out
+
+
+def _store_statistics(task: Tuple[str, np.ndarray, int, Tuple[float, float]]) -> BandStatistics:
+    from mangroves.store import EmbeddingStore
+    path, offsets, n_bins, value_range = task
+    store = EmbeddingStore(path)
+    stats = BandStatistics(store.data.shape[1], n_bins, value_range)
+    for offset in offsets:
+        stats.update(store[offset])
+    return stats
+
+
+def _file_statistics(task: Tuple[List[str], int, Tuple[float, float]]) -> BandStatistics:
+    from mangroves.embeddings import Embeddings
+    files, n_bins, value_range = task
+    stats = None
+    for file in files:
+        patch = Embeddings._read_data(file)
+        stats = BandStatistics(patch.shape[0], n_bins, value_range) if stats is None else stats
+        stats.update(patch)
+    return stats
+
+
+def compute_statistics(
+        path: str,
+        output_path: Optional[str] = None,
+        train_only: bool = True,
+        max_workers: Optional[int] = None,
+        chunk_size: int = 64,
+        n_bins: int = 4096,
+        value_range: Tuple[float, float] = (-1., 1.)) -> BandStatistics:
+    """
+    Compute the per-band statistics of a dataset in one streaming pass, split into chunks of
+    patches accumulated in a pool of processes then merged, and save them next to the dataset.
+
+    Args:
+        path (str): Directory of an EmbeddingStore, or of Embeddings files (`.npz` or `.emb`).
+        output_path (str, optional): Path of the statistics, defaults to `<path>/stats.npz`.
+        train_only (bool, optional): Only use the training samples of a store, not to leak the test set.
+            Directories of Embeddings files have no split, and require False.
+        max_workers (int, optional): Number of processes.
+        chunk_size (int, optional): Number of patches per task.
+        n_bins (int, optional): Number of bins of the histograms.
+        value_range (Tuple[float, float], optional): Range of the histograms.
+    Returns:
+        BandStatistics: The statistics of the dataset.
+    """
+    from mangroves.store import EmbeddingStore
+    path = Path(os.path.expanduser(path))
+    if EmbeddingStore.exists(path):
+        index = EmbeddingStore(path).index
+        if train_only and 'train' in index:
+            index = index[index['train'] == 1]
+        offsets = index['offset'].to_numpy()
+        tasks = [(str(path), offsets[i:i + chunk_size], n_bins, value_range) for i in range(0, len(offsets), chunk_size)]
+        worker = _store_statistics
+    else:
+        assert not train_only, (f'{path} is not an embedding store, its files have no train/test split. '
+                                f'Pass train_only=False (--all) to use all of them.')
+        files = sorted(str(file) for pattern in ('**/*.npz', '**/*.emb') for file in path.glob(pattern)
+                       if file.name != STATS_FILE)
+        tasks = [(files[i:i + chunk_size], n_bins, value_range) for i in range(0, len(files), chunk_size)]
+        worker = _file_statistics
+    assert len(tasks) > 0, f'No patch found in {path}.'
+
+    stats = None
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for partial in executor.map(worker, tasks):
+            stats = partial if stats is None else stats.merge(partial)
+
+    output_path = path / STATS_FILE if output_path is None else Path(os.path.expanduser(output_path))
+    stats.save(output_path)
+    logger.info(f'Saved the statistics of {stats.count} pixels of {path} to {output_path}')
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute the per-band normalization statistics of a dataset.')
+    parser.add_argument('path', help='Directory of an embedding store, or of Embeddings files.')
+    parser.add_argument('--output', default=None, help='(Optional) Path of the statistics, defaults to <path>/stats.npz.')
+    parser.add_argument('--all', action='store_true', help='(Optional) Also use the test samples of a store.')
+    parser.add_argument('--workers', type=int, default=None, help='(Optional) Number of processes.')
+    parser.add_argument('--chunk_size', type=int, default=64, help='(Optional) Number of patches per task.')
+    parser.add_argument('--n_bins', type=int, default=4096, help='(Optional) Number of bins of the histograms.')
+    args = parser.parse_args()
+    compute_statistics(args.path, args.output, not args.all, args.workers, args.chunk_size, args.n_bins)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import os
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+import rasterio
+from pathlib import Path
+from typing import Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """
+    Consolidated store of embedding patches.
+
+    All the patches of a dataset are stacked in a single N×D×H×W `.npy` file, read through a
+    memory map, next to an index (`index.csv`) holding the rows of `data.csv` and the offset of
+    each patch in the array. Reading a patch is a slice of the memory map, with no file to open.
+    """
+
+    DATA_FILE = 'embeddings.npy'
+    INDEX_FILE = 'index.csv'
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Directory containing the store.
+        """
+        self.path = Path(os.path.expanduser(path))
+        self.index = pd.read_csv(self.path / self.INDEX_FILE)
+        self._data = None
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        path = Path(os.path.expanduser(path))
+        return (path / cls.DATA_FILE).exists() and (path / cls.INDEX_FILE).exists()
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        The N×D×H×W memory-mapped array, opened on first access in each process.
+        Copy-on-write mode gives writable views without ever modifying the file.
+        """
+        if self._data is None:
+            self._data = np.load(self.path / self.DATA_FILE, mmap_mode='c')
+        return self._data
+
+    def __getstate__(self) -> dict:
+        # Memory maps are reopened by each DataLoader worker instead of being pickled
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __getitem__(self, offset: int) -> np.ndarray:
+        return self.data[offset]
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def resolve_path(
+        root: Path,
+        file: str) -> Path:
+    """
+    Resolve a path of `data.csv`, either absolute, relative to the dataset directory, or
+    relative to another directory (e.g. `../share/data//train/00.tif` written from the notebooks).
+    """
+    file = Path(file)
+    for candidate in (file, root / file, root / file.parent.name / file.name):
+        if candidate.exists():
+            return candidate
+    raise FileNotFoundError(f'Embeddings file {file} not found from {root}')
+
+
+def convert_tif_dataset(
+        path: str,
+        output_path: Optional[str] = None,
+        dtype: np.dtype = np.float32) -> EmbeddingStore:
+    """
+    Convert a dataset made of one GeoTIFF per sample, listed in `data.csv`, into an EmbeddingStore.
+
+    Args:
+        path (str): Directory containing `data.csv`.
+        output_path (str, optional): Directory of the store, defaults to the dataset directory.
+        dtype (np.dtype, optional): Data type of the stored patches.
+    Returns:
+        EmbeddingStore: The created store.
+    """
+    root = Path(os.path.expanduser(path))
+    output_path = root if output_path is None else Path(os.path.expanduser(output_path))
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    index = pd.read_csv(root / 'data.csv')
+    files = [resolve_path(root, file) for file in index['embeddings']]
+
+    with rasterio.open(files[0], 'r') as f:
+        shape: Tuple[int, int, int] = (f.count, f.height, f.width)
+    data = np.lib.format.open_memmap(
+        output_path / EmbeddingStore.DATA_FILE, mode='w+', dtype=dtype, shape=(len(files),) + shape)
+
+    for offset, file in enumerate(files):
+        with rasterio.open(file, 'r') as f:
+            patch = f.read()
+        assert patch.shape == shape, f'{file} has shape {patch.shape}, expected {shape}.'
+        data[offset] = patch
+    data.flush()
+    del data
+
+    index['offset'] = np.arange(len(index))
+    index.to_csv(output_path / EmbeddingStore.INDEX_FILE, index=False)
+    logger.info(f'Converted {len(files)} patches of shape {shape} into {output_path}')
+    return EmbeddingStore(output_path)
+
+
+def write_shards(
+        store: EmbeddingStore,
+        output_path: str,
+        shard_size: int = 64,
+        seed: int = 42) -> pd.DataFrame:
+    """
+    Split an EmbeddingStore into sequential shards for streaming.
+
+    Each shard is a `.npy` file of at most `shard_size` patches, read sequentially, with the
+    ratios of its samples in a companion `.ratio.npy` file. Samples are shuffled once before
+    sharding so that every shard is representative of the dataset, and training and test
+    samples go to distinct shards. The shards are listed in `shards.csv`.
+
+    Args:
+        store (EmbeddingStore): The store to split.
+        output_path (str): Directory of the shards.
+        shard_size (int, optional): Number of patches per shard.
+        seed (int, optional): Seed of the shuffling of the samples.
+    Returns:
+        pd.DataFrame: The list of shards with their number of samples.
+    """
+    output_path = Path(os.path.expanduser(output_path))
+    output_path.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    shards = []
+    for train, subset in store.index.groupby('train'):
+        split = 'train' if train else 'test'
+        offsets = rng.permutation(subset['offset'].to_numpy())
+        ratios = subset.set_index('offset').loc[offsets, 'ratio'].to_numpy(dtype=np.float32)
+        for i, start in enumerate(range(0, len(offsets), shard_size)):
+            name = f'{split}-{i:05d}'
+            batch = np.sort(offsets[start:start + shard_size])  # Sorted reads are sequential in the store
+            order = np.argsort(offsets[start:start + shard_size])
+            np.save(output_path / f'{name}.npy', store.data[batch])
+            np.save(output_path / f'{name}.ratio.npy', ratios[start:start + shard_size][order])
+            shards.append({'shard': name, 'samples': len(batch), 'train': int(train)})
+
+    shards = pd.DataFrame(shards)
+    shards.to_csv(output_path / 'shards.csv', index=False)
+    logger.info(f'Wrote {len(shards)} shards of up to {shard_size} patches into {output_path}')
+    return shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a GeoTIFF dataset into an embedding store.')
+    parser.add_argument('path', help='Directory containing data.csv.')
+    parser.add_argument('--output', default=None, help='Directory of the store, defaults to the dataset directory.')
+    parser.add_argument('--shards', default=None, help='(Optional) Directory where to also write streaming shards.')
+    parser.add_argument('--shard_size', type=int, default=64, help='(Optional) Number of patches per shard.')
+    args = parser.parse_args()
+    store = convert_tif_dataset(args.path, args.output)
+    if args.shards is not None:
+        write_shards(store, args.shards, args.shard_size)
+
+
+if __name__ == '__main__':
+    main()
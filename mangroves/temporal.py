@@ -0,0 +1,184 @@
+import os
+import json
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence
+from mangroves.geometry import Region
+from mangroves.collection import Collection
+from mangroves.constants import SPATIAL_RESOLUTION_M
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TemporalStack:
+    """
+    Multi-year T×D×H×W stack of embedding patches of a chip, stored without duplicating the
+    tiles that do not change from one year to the next.
+
+    The patches are cut into square tiles. A tile is stored once, and the following years point
+    to it for as long as they stay within `tolerance` of it, so that a stable mangrove stand
+    costs one tile whatever the number of years. The directory holds:
+
+    - `tiles.npy`: the U×D×S×S unique tiles, memory-mapped.
+    - `refs.npy`: the T×I×J index of the tile of each year and tile position.
+    - `stack.json`: the years, shape and metadata of the chip.
+
+    Reading the time series of a pixel only reads T×D values, and a year only its own tiles.
+    """
+
+    TILES_FILE = 'tiles.npy'
+    REFS_FILE = 'refs.npy'
+    META_FILE = 'stack.json'
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Directory of the stack.
+        """
+        self.path = Path(os.path.expanduser(path))
+        with open(self.path / self.META_FILE, 'r') as f:
+            self.metadata: Dict = json.load(f)
+        self.years = self.metadata['years']
+        self.shape = tuple(self.metadata['shape'])
+        self.tile_size = self.metadata['tile_size']
+        self.refs = np.load(self.path / self.REFS_FILE)
+        self.tiles = np.load(self.path / self.TILES_FILE, mmap_mode='r')
+
+    @classmethod
+    def write(
+            cls,
+            path: str,
+            stack: np.ndarray,
+            years: Sequence[int],
+            metadata: Optional[Dict] = None,
+            tile_size: int = 16,
+            tolerance: float = 0.) -> 'TemporalStack':
+        """
+        Deduplicate and write a stack.
+
+        Args:
+            path (str): Directory of the stack.
+            stack (np.ndarray): The T×D×H×W stack, e.g. from Collection.extract_years.
+            years (Sequence[int]): The year of each patch of the stack.
+            metadata (Dict, optional): Metadata of the chip saved with the stack, e.g. its coordinates.
+            tile_size (int, optional): Side of the tiles in pixels.
+            tolerance (float, optional): Largest absolute difference between a tile and the stored
+                tile of the previous year for the year to reuse it, 0 keeping the stack exact.
+        Returns:
+            TemporalStack: The written stack.
+        """
+        n_years, n_bands, height, width = stack.shape
+        assert len(years) == n_years, 'One year is required per patch of the stack.'
+        n_i, n_j = -(-height // tile_size), -(-width // tile_size)
+        padded = np.zeros((n_years, n_bands, n_i * tile_size, n_j * tile_size), dtype=stack.dtype)
+        padded[:, :, :height, :width] = stack
+        # T×I×J×D×S×S view of the tiles of every year
+        tiles = padded.reshape(n_years, n_bands, n_i, tile_size, n_j, tile_size).transpose(0, 2, 4, 1, 3, 5)
+
+        refs = np.zeros((n_years, n_i, n_j), dtype=np.int32)
+        refs[0] = np.arange(n_i * n_j).reshape(n_i, n_j)
+        unique = [tiles[0].reshape(n_i * n_j, n_bands, tile_size, tile_size)]
+        n_unique = n_i * n_j
+        current = tiles[0].copy()  # Stored tile of each position, compared with the next year
+        for t in range(1, n_years):
+            changed = np.abs(tiles[t] - current).max(axis=(2, 3, 4)) > tolerance
+            refs[t] = refs[t - 1]
+            refs[t][changed] = n_unique + np.arange(changed.sum())
+            current[changed] = tiles[t][changed]
+            unique.append(tiles[t][changed])
+            n_unique += int(changed.sum())
+
+        path = Path(os.path.expanduser(path))
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / cls.TILES_FILE, np.concatenate(unique))
+        np.save(path / cls.REFS_FILE, refs)
+        with open(path / cls.META_FILE, 'w') as f:
+            json.dump({
+                'years': [int(year) for year in years],
+                'shape': [n_years, n_bands, height, width],
+                'tile_size': tile_size,
+                'tolerance': tolerance,
+                **(metadata or {}),
+            }, f, indent=2)
+        logger.info(f'Wrote a stack of {n_years} years with {n_unique} unique tiles out of {n_years * n_i * n_j} '
+                    f'({stack.nbytes / max(1, (path / cls.TILES_FILE).stat().st_size):.1f}x smaller)')
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+    def read(self, year: int) -> np.ndarray:
+        """
+        The D×H×W patch of a year.
+        """
+        t = self.years.index(year)
+        _, n_bands, height, width = self.shape
+        n_i, n_j = self.refs.shape[1:]
+        tiles = self.tiles[self.refs[t].ravel()].reshape(n_i, n_j, n_bands, self.tile_size, self.tile_size)
+        patch = tiles.transpose(2, 0, 3, 1, 4).reshape(n_bands, n_i * self.tile_size, n_j * self.tile_size)
+        return np.ascontiguousarray(patch[:, :height, :width])
+
+    def read_all(self) -> np.ndarray:
+        """
+        The full T×D×H×W stack.
+        """
+        return np.stack([self.read(year) for year in self.years])
+
+    def timeseries(
+            self,
+            rows: Iterable[int],
+            cols: Iterable[int]) -> np.ndarray:
+        """
+        Time series of pixels, reading only their values from the tiles.
+
+        Args:
+            rows (Iterable[int]): Rows of the pixels.
+            cols (Iterable[int]): Columns of the pixels.
+        Returns:
+            np.ndarray: The N×T×D values of the pixels, or T×D for a single pixel.
+        """
+        single = np.ndim(rows) == 0
+        rows, cols = np.atleast_1d(rows), np.atleast_1d(cols)
+        i, r = np.divmod(rows, self.tile_size)
+        j, c = np.divmod(cols, self.tile_size)
+        refs = self.refs[:, i, j].T  # N×T
+        values = self.tiles[refs, :, r[:, None], c[:, None]]  # N×T×D
+        return values[0] if single else values
+
+    def changes(self) -> np.ndarray:
+        """
+        T×I×J boolean map of the tiles stored anew each year, i.e. that changed since the previous year.
+        """
+        changed = np.ones(self.refs.shape, dtype=bool)
+        changed[1:] = self.refs[1:] != self.refs[:-1]
+        return changed
+
+
+def extract_stack(
+        collection: Collection,
+        region: Region,
+        years: Sequence[int],
+        output_path: str,
+        tile_size: int = 16,
+        tolerance: float = 0.,
+        years_per_request: Optional[int] = None) -> Optional[TemporalStack]:
+    """
+    Extract the patches of a chip for several years and write them as a TemporalStack.
+
+    Returns:
+        TemporalStack or None: The stack, or None if extraction fails.
+    """
+    result = collection.extract_years(region, years, years_per_request)
+    if result is None:
+        return None
+    stack, available = result
+    metadata = {
+        'latitude_deg': region.lat0_deg,
+        'longitude_deg': region.lon0_deg,
+        'regionDiameter_p': region.nPixels,
+        'spatialResolution_m': SPATIAL_RESOLUTION_M,
+        'available': available.tolist(),
+    }
+    return TemporalStack.write(output_path, stack, years, metadata, tile_size, tolerance)
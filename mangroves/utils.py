@@ -1,17 +1,44 @@
 import numpy as np
 import math
-from typing import Tuple, List
-from mangroves.constants import RADIUS_EARTH_M 
+import pyproj
+from functools import lru_cache
+from typing import Tuple, List, Union
+from mangroves.constants import RADIUS_EARTH_M
+
+
+ArrayLike = Union[float, np.ndarray, List[float]]
+
+
+def utm_epsg(
+        lat_deg: ArrayLike,
+        lon_deg: ArrayLike) -> Union[int, np.ndarray]:
+    """
+    EPSG code of the WGS 84 UTM zone containing a point, or of each point of arrays of coordinates.
+    """
+    zone = np.minimum((np.add(lon_deg, 180) // 6).astype(np.int64) + 1, 60)
+    epsg = np.where(np.asarray(lat_deg) >= 0, 32600, 32700) + zone
+    return int(epsg) if epsg.ndim == 0 else epsg
+
+
+@lru_cache(maxsize=None)
+def get_transformer(
+        source_crs: str,
+        target_crs: str) -> pyproj.Transformer:
+    """
+    Cached transformer between two CRS, built once per process and pair of CRS.
+    """
+    return pyproj.Transformer.from_crs(source_crs, target_crs, always_xy=True)
 
 
 def haversine(lat1_deg: float, lat2_deg: float, lon1_deg: float, lon2_deg: float, R: float = RADIUS_EARTH_M) -> float:
     """
     Calculate the Haversine distance between two geographic coordinates.
+    Arrays of coordinates are broadcast against each other.
     """
     lat1_rad = np.radians(lat1_deg)
     lat2_rad = np.radians(lat2_deg)
-    dlat_rad = np.radians(lat2_deg - lat1_deg)
-    dlon_rad = np.radians(lon2_deg - lon1_deg)
+    dlat_rad = np.radians(np.subtract(lat2_deg, lat1_deg))
+    dlon_rad = np.radians(np.subtract(lon2_deg, lon1_deg))
 
     a = np.sin(dlat_rad / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon_rad / 2) ** 2
     c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
@@ -20,49 +47,158 @@ def haversine(lat1_deg: float, lat2_deg: float, lon1_deg: float, lon2_deg: float
     return distance
 
 
+def haversine_matrix(
+        lat1_deg: ArrayLike,
+        lat2_deg: ArrayLike,
+        lon1_deg: ArrayLike,
+        lon2_deg: ArrayLike,
+        R: float = RADIUS_EARTH_M,
+        block_size: int = 1024) -> np.ndarray:
+    """
+    Calculate the pairwise Haversine distances between two sets of geographic coordinates.
+    Rows are processed by blocks so that the temporaries stay bounded by block_size x M.
+
+    Returns:
+        np.ndarray: The (N, M) matrix of distances.
+    """
+    lat1_deg, lon1_deg = np.atleast_1d(lat1_deg), np.atleast_1d(lon1_deg)
+    lat2_deg, lon2_deg = np.atleast_1d(lat2_deg), np.atleast_1d(lon2_deg)
+    distances = np.empty((len(lat1_deg), len(lat2_deg)))
+    for start in range(0, len(lat1_deg), block_size):
+        stop = start + block_size
+        distances[start:stop] = haversine(
+            lat1_deg[start:stop, None], lat2_deg[None, :], lon1_deg[start:stop, None], lon2_deg[None, :], R
+        )
+    return distances
+
+
+def _unit_vectors(lat_deg: np.ndarray, lon_deg: np.ndarray) -> np.ndarray:
+    """
+    Convert geographic coordinates to unit vectors in Earth-centered Cartesian coordinates.
+    """
+    lat_rad, lon_rad = np.radians(lat_deg), np.radians(lon_deg)
+    return np.stack([np.cos(lat_rad) * np.cos(lon_rad), np.cos(lat_rad) * np.sin(lon_rad), np.sin(lat_rad)], axis=-1)
+
+
+def nearest_neighbours(
+        lat_deg: ArrayLike,
+        lon_deg: ArrayLike,
+        ref_lat_deg: ArrayLike,
+        ref_lon_deg: ArrayLike,
+        k: int = 1,
+        exclude_self: bool = False,
+        R: float = RADIUS_EARTH_M,
+        block_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the k nearest reference points of each query point on the sphere.
+
+    Neighbours are ranked with dot products of unit vectors, computed by blocks of queries
+    so that memory stays bounded by block_size x M, then their exact Haversine distances
+    are computed.
+
+    Args:
+        lat_deg, lon_deg (ArrayLike): Coordinates of the N query points in degrees.
+        ref_lat_deg, ref_lon_deg (ArrayLike): Coordinates of the M reference points in degrees.
+        k (int, optional): Number of neighbours.
+        exclude_self (bool, optional): Whether the queries are the reference points themselves,
+            in which case each point is not its own neighbour.
+        R (float, optional): Radius of the sphere.
+        block_size (int, optional): Number of queries processed at once.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (N, k) distances and indices of the neighbours, sorted by distance.
+    """
+    lat_deg, lon_deg = np.atleast_1d(lat_deg), np.atleast_1d(lon_deg)
+    ref_lat_deg, ref_lon_deg = np.atleast_1d(ref_lat_deg), np.atleast_1d(ref_lon_deg)
+    n_refs = len(ref_lat_deg) - (1 if exclude_self else 0)
+    assert 0 < k <= n_refs, f'k must be between 1 and {n_refs}.'
+
+    queries = _unit_vectors(lat_deg, lon_deg)
+    references = _unit_vectors(ref_lat_deg, ref_lon_deg)
+    indices = np.empty((len(lat_deg), k), dtype=np.int64)
+    for start in range(0, len(lat_deg), block_size):
+        stop = min(start + block_size, len(lat_deg))
+        similarity = queries[start:stop] @ references.T
+        if exclude_self:
+            similarity[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        if k < similarity.shape[1]:
+            candidates = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(similarity.shape[1]), (stop - start, k))
+        indices[start:stop] = candidates
+
+    distances = haversine(lat_deg[:, None], ref_lat_deg[indices], lon_deg[:, None], ref_lon_deg[indices], R)
+    order = np.argsort(distances, axis=1)
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+def geodesic_circles(
+        lat0_deg: ArrayLike,
+        lon0_deg: ArrayLike,
+        distance_m: ArrayLike,
+        n_points: int = 360,
+        R: float = RADIUS_EARTH_M) -> np.ndarray:
+    """
+    Generate points approximating circles around N reference points using geodesic calculations.
+
+    Returns:
+        np.ndarray: The (N, n_points, 2) latitudes and longitudes of the points in degrees.
+    """
+    lat0_rad = np.radians(np.atleast_1d(lat0_deg))[:, None]
+    lon0_rad = np.radians(np.atleast_1d(lon0_deg))[:, None]
+    delta = np.broadcast_to(np.asarray(distance_m, dtype=np.float64) / R, lat0_rad.shape[:1])[:, None]
+    theta = 2 * np.pi * np.arange(n_points)[None, :] / n_points  # bearing
+
+    sin_lat = np.sin(lat0_rad) * np.cos(delta) + np.cos(lat0_rad) * np.sin(delta) * np.cos(theta)
+    lat_rad = np.arcsin(sin_lat)
+    y = np.sin(theta) * np.sin(delta) * np.cos(lat0_rad)
+    x = np.cos(delta) - np.sin(lat0_rad) * sin_lat
+    lon_rad = lon0_rad + np.arctan2(y, x)
+    lon_rad = (lon_rad + np.pi) % (2 * np.pi) - np.pi  # Normalize lon to [-pi, pi]
+    return np.stack([np.degrees(lat_rad), np.degrees(lon_rad)], axis=-1)
+
+
 def geodesic_circle(
-        lat0_deg: float, 
-        lon0_deg: float, 
-        distance_m: float, 
-        n_points: int = 360, 
+        lat0_deg: float,
+        lon0_deg: float,
+        distance_m: float,
+        n_points: int = 360,
         R: float = RADIUS_EARTH_M) -> List[Tuple[float, float]]:
     """
     Generate points approximating a circle around a reference point using geodesic calculations.
     """
-    lat0_rad = math.radians(lat0_deg)
-    lon0_rad = math.radians(lon0_deg)
-    delta = distance_m / R
-    pts = []
-    for k in range(n_points):
-        theta = 2 * math.pi * k / n_points  # bearing
-        sin_lat = math.sin(lat0_rad) * math.cos(delta) + math.cos(lat0_rad) * math.sin(delta) * math.cos(theta)
-        lat_rad = math.asin(sin_lat)
-        y = math.sin(theta) * math.sin(delta) * math.cos(lat0_rad)
-        x = math.cos(delta) - math.sin(lat0_rad) * sin_lat
-        lon_rad = lon0_rad + math.atan2(y, x)
-        lon_rad = (lon_rad + math.pi) % (2 * math.pi) - math.pi  # Normalize lon to [-pi, pi]
-        lat_deg = math.degrees(lat_rad)
-        lon_deg = math.degrees(lon_rad)
-        pts.append((lat_deg, lon_deg))
-    return pts
+    return [tuple(pt) for pt in geodesic_circles(lat0_deg, lon0_deg, distance_m, n_points, R)[0].tolist()]
+
+
+def planar_approx_circles(
+        lat0_deg: ArrayLike,
+        lon0_deg: ArrayLike,
+        distance_m: ArrayLike,
+        n_points: int = 360,
+        R: float = RADIUS_EARTH_M) -> np.ndarray:
+    """
+    Generate points approximating circles around N reference points using planar approximation.
+
+    Returns:
+        np.ndarray: The (N, n_points, 2) latitudes and longitudes of the points in degrees.
+    """
+    K = R * (math.pi / 180)  # meters per degree latitude at equator (approx 111320 m)
+    lat0_deg = np.atleast_1d(np.asarray(lat0_deg, dtype=np.float64))[:, None]
+    lon0_deg = np.atleast_1d(np.asarray(lon0_deg, dtype=np.float64))[:, None]
+    distance_m = np.broadcast_to(np.asarray(distance_m, dtype=np.float64), lat0_deg.shape[:1])[:, None]
+    theta = 2 * np.pi * np.arange(n_points)[None, :] / n_points  # angle
+
+    dlat_deg = (distance_m * np.cos(theta)) / K
+    dlon_deg = (distance_m * np.sin(theta)) / (K * np.cos(np.radians(lat0_deg)))
+    return np.stack([lat0_deg + dlat_deg, lon0_deg + dlon_deg], axis=-1)
 
 
 def planar_approx_circle(
-        lat0_deg: float, 
-        lon0_deg: float, 
-        distance_m: float, 
-        n_points: int = 360, 
+        lat0_deg: float,
+        lon0_deg: float,
+        distance_m: float,
+        n_points: int = 360,
         R: float = RADIUS_EARTH_M) -> List[Tuple[float, float]]:
     """
     Generate points approximating a circle around a reference point using planar approximation.
     """
-    K = R * (math.pi / 180)  # meters per degree latitude at equator (approx 111320 m)
-    pts = []
-    for k in range(n_points):
-        theta = 2 * math.pi * k / n_points  # angle
-        dlat_deg = (distance_m * math.cos(theta)) / K
-        dlon_deg = (distance_m * math.sin(theta)) / (K * math.cos(lat0_deg * (math.pi / 180)))
-        lat_deg = lat0_deg + dlat_deg
-        lon_deg = lon0_deg + dlon_deg
-        pts.append((lat_deg, lon_deg))
-    return pts
\ No newline at end of file
+    return [tuple(pt) for pt in planar_approx_circles(lat0_deg, lon0_deg, distance_m, n_points, R)[0].tolist()]
@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 setup(
     name="mangroves",
     version="0.1",
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'tests.*']),
     entry_points={
         'console_scripts': {
             'run = mangroves.run:main',
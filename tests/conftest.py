@@ -0,0 +1,29 @@
+"""
+The tests run offline against the fake Earth Engine backend of benchmarks/fake_ee.py, installed
+as `ee` before any `mangroves` module is imported.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import fake_ee  # noqa: E402
+from fake_server import FakeEarthEngineServer  # noqa: E402
+
+fake_ee.install()
+
+
+@pytest.fixture(autouse=True)
+def fake_backend():
+    """
+    Fake backend without latency nor failures, reset before every test.
+    """
+    fake_ee.configure(size=16)
+    return fake_ee
+
+
+@pytest.fixture
+def fake_server():
+    with FakeEarthEngineServer() as server:
+        yield server
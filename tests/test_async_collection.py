@@ -0,0 +1,46 @@
+import asyncio
+from contextlib import aclosing
+from mangroves.collection import Collection
+from mangroves.async_collection import AsyncCollection
+
+SITES = [(1.3 + 0.01 * i, 103.9, 2020) for i in range(12)]
+
+
+async def _collect(async_collection, sites, stop_after=None):
+    results = []
+    async with aclosing(async_collection.embeddings(sites, regionDiameter_p=16)) as embeddings_iterator:
+        async for embeddings in embeddings_iterator:
+            results.append(embeddings)
+            if len(results) == stop_after:
+                break
+    # Nothing left running once the generator is closed
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+    return results
+
+
+def test_embeddings_over_http(fake_backend, fake_server):
+    fake_backend.configure(size=16, latency_s=0.01, failure_rate=0.2, seed=1)
+    collection = Collection('test', requests_per_second=1e6, url=fake_server.url)
+    async_collection = AsyncCollection(collection, max_in_flight=4, max_retries=20, backoff_s=0.001)
+    try:
+        results = asyncio.run(_collect(async_collection, SITES))
+    finally:
+        async_collection.close()
+
+    assert sorted(embeddings.latitude_deg for embeddings in results) == [lat for lat, _, _ in SITES]
+    assert all(embeddings.data.shape == (64, 16, 16) for embeddings in results)
+    # Every site went through the server, two requests each, and failed requests were retried
+    failures = fake_backend.STATS['failures']
+    assert failures > 0
+    assert fake_backend.STATS['requests'] == 2 * len(SITES) + failures
+
+
+def test_embeddings_early_exit(fake_backend, fake_server):
+    fake_backend.configure(size=16, latency_s=0.05)
+    collection = Collection('test', requests_per_second=1e6, url=fake_server.url)
+    async_collection = AsyncCollection(collection, max_in_flight=2)
+    try:
+        results = asyncio.run(_collect(async_collection, SITES, stop_after=1))
+    finally:
+        async_collection.close()
+    assert len(results) == 1
@@ -0,0 +1,107 @@
+import numpy as np
+from mangroves.cache import PatchCache, CachedCollection
+from mangroves.collection import Collection
+from mangroves.geometry import Region
+
+BANDS = [f'A{i:02d}' for i in range(64)]
+
+
+def _patch(value: float) -> np.ndarray:
+    return np.full((64, 16, 16), value, dtype=np.float32)
+
+
+def test_hit_and_miss(tmp_path):
+    cache = PatchCache(tmp_path)
+    key = cache.key(Region(1.3, 103.9, 16), 2020, BANDS)
+    assert cache.get(key) is None
+    cache.put(key, _patch(1.))
+    np.testing.assert_array_equal(cache.get(key), _patch(1.))
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_keys_differ_by_year_and_region():
+    region = Region(1.3, 103.9, 16)
+    keys = {PatchCache.key(region, 2020, BANDS), PatchCache.key(region, 2021, BANDS),
+            PatchCache.key(Region(1.31, 103.9, 16), 2020, BANDS)}
+    assert len(keys) == 3
+    assert PatchCache.key(Region(1.3, 103.9, 16), 2020, BANDS) in keys
+    assert PatchCache.key(region, 2020, BANDS, np.float64) not in keys
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = PatchCache(tmp_path)
+    cache.put('a' * 40, _patch(0.))
+    size = cache.stats()['bytes']
+    cache = PatchCache(tmp_path, max_bytes=int(2.5 * size))
+    cache.put('b' * 40, _patch(1.))
+    cache.get('a' * 40)  # a becomes more recent than b
+    cache.put('c' * 40, _patch(2.))
+
+    assert cache.stats()['evictions'] == 1
+    assert cache.get('b' * 40) is None
+    assert cache.get('a' * 40) is not None and cache.get('c' * 40) is not None
+    assert not (tmp_path / 'bb' / f'{"b" * 40}.npz').exists()
+
+
+def test_persists_across_instances(tmp_path):
+    PatchCache(tmp_path).put('a' * 40, _patch(3.))
+    cache = PatchCache(tmp_path)
+    assert len(cache) == 1
+    np.testing.assert_array_equal(cache.get('a' * 40), _patch(3.))
+
+
+def test_cached_collection_fetches_misses_once(tmp_path, fake_backend):
+    collection = CachedCollection(Collection('test', requests_per_second=1e6), PatchCache(tmp_path))
+    regions = [Region(1.3 + 0.01 * i, 103.9, 16) for i in range(6)]
+    first = dict((id(region), patch) for region, patch in collection.extract_many(regions, 2020, batch_size=4))
+    requests = fake_backend.STATS['requests']
+    second = dict((id(region), patch) for region, patch in collection.extract_many(regions, 2020, batch_size=4))
+
+    assert fake_backend.STATS['requests'] == requests == 2 * len(regions)
+    assert collection.cache.stats()['hits'] == len(regions)
+    for region in regions:
+        # Stored as float16
+        assert second[id(region)].dtype == np.float32
+        np.testing.assert_allclose(first[id(region)], second[id(region)], atol=1e-3)
+
+
+def test_stores_compact_patches(tmp_path):
+    patch = np.random.default_rng(0).normal(size=(64, 16, 16)).astype(np.float32)
+    for dtype, atol in (('int8', 0.02), ('float16', 1e-2), ('float32', 0.)):
+        cache = PatchCache(tmp_path / dtype, dtype=dtype)
+        cache.put('a' * 40, patch)
+        np.testing.assert_allclose(cache.get('a' * 40), patch, atol=atol)
+        if dtype != 'float32':
+            assert cache.stats()['bytes'] < patch.nbytes / 2
+
+
+def test_caches_regions_without_data(tmp_path):
+    cache = PatchCache(tmp_path)
+    cache.put('a' * 40, None)
+    assert PatchCache(tmp_path).lookup('a' * 40) == (True, None)
+    assert cache.lookup('b' * 40) == (False, None)
+
+
+def test_cached_collection_caches_regions_without_data_only(tmp_path, fake_backend, monkeypatch):
+    collection = CachedCollection(Collection('test', requests_per_second=1e6), PatchCache(tmp_path))
+    regions = [Region(1.3 + 0.01 * i, 103.9, 16) for i in range(4)]
+    # No image for the first region, the requests of the second one always fail
+    fetch = Collection.fetch_image_from_region_in_collection
+
+    def fetch_image(self, region, year):
+        if region is regions[0]:
+            return None
+        if region is regions[1]:
+            raise fake_backend.EEException('Too many concurrent aggregations.')
+        return fetch(self, region, year)
+
+    monkeypatch.setattr(Collection, 'fetch_image_from_region_in_collection', fetch_image)
+    first = dict((id(region), patch) for region, patch in collection.extract_many(regions, 2020, max_retries=1,
+                                                                                  backoff_s=0.001))
+    assert first[id(regions[0])] is None and first[id(regions[1])] is None
+    assert len(collection.cache) == 3
+
+    monkeypatch.setattr(Collection, 'fetch_image_from_region_in_collection', fetch)
+    assert collection.extract(regions[0], 2020) is None
+    assert collection.extract(regions[1], 2020).shape == (64, 16, 16)
+    assert len(collection.cache) == 4
@@ -0,0 +1,123 @@
+import time
+import numpy as np
+import pytest
+from mangroves import collection as collection_module
+from mangroves.collection import Collection, RateLimiter, assemble_patch
+from mangroves.constants import BANDS
+from mangroves.geometry import Region
+
+REGIONS = [Region(1.3 + 0.01 * i, 103.9, 16) for i in range(8)]
+
+
+@pytest.mark.parametrize('size, n_missing', [(250, 0), (246, 0), (243, 0), (247, 5)])
+def test_assemble_patch_matches_legacy(size, n_missing):
+    from bench_band_assembly import legacy_assemble_patch, synthetic_properties
+    properties = synthetic_properties(size, n_missing, seed=size)
+    legacy = legacy_assemble_patch(properties, BANDS, 246)
+    patch = assemble_patch(properties, BANDS, 246, np.float64)
+    assert patch.shape == (len(BANDS), 246, 246)
+    assert np.array_equal(legacy, patch)
+    assert assemble_patch({}, BANDS, 246) is None
+
+
+@pytest.mark.parametrize('band', [[[0.5]], [0.5] * 246, np.zeros((246, 246, 2)).tolist()])
+def test_assemble_patch_rejects_wrong_shape(band):
+    # A 1x1 band is what sampleRectangle returns for an image left in its default projection
+    with pytest.raises(ValueError):
+        assemble_patch({BANDS[0]: band}, BANDS, 246)
+
+
+def test_rate_limiter_paces_requests():
+    limiter = RateLimiter(rate=50, burst=1)
+    start = time.perf_counter()
+    for _ in range(11):
+        limiter.acquire()
+    # The first request uses the initial token, the next 10 wait 1/50 s each
+    assert time.perf_counter() - start >= 10 / 50 * 0.9
+
+
+def test_rate_limiter_burst():
+    limiter = RateLimiter(rate=1, burst=5)
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.perf_counter() - start < 0.1
+
+
+def test_extract_many_retries_failures(fake_backend):
+    fake_backend.configure(size=16, failure_rate=0.3, seed=3)
+    collection = Collection('test', requests_per_second=1e6)
+    results = list(collection.extract_many(REGIONS, 2020, max_workers=4, max_retries=20, backoff_s=0.001))
+
+    assert {id(region) for region, _ in results} == {id(region) for region in REGIONS}
+    assert all(patch is not None and patch.shape == (64, 16, 16) for _, patch in results)
+    assert fake_backend.STATS['failures'] > 0
+    # Two requests per patch, and a failed attempt repeats one or both of them
+    failures = fake_backend.STATS['failures']
+    assert 2 * len(REGIONS) + failures <= fake_backend.STATS['requests'] <= 2 * len(REGIONS) + 2 * failures
+
+
+def test_retry_gives_up_with_exponential_backoff(fake_backend, monkeypatch):
+    fake_backend.configure(size=16, failure_rate=1.)
+    delays = []
+    monkeypatch.setattr(collection_module.time, 'sleep', delays.append)
+    collection = Collection('test', requests_per_second=1e6)
+
+    assert collection._extract_with_retry(REGIONS[0], 2020, max_retries=3, backoff_s=0.5) is None
+    assert fake_backend.STATS['requests'] == 4
+    # Doubled on every retry, with up to 100% of jitter. The fake requests sleep for no latency
+    delays = [delay for delay in delays if delay > 0]
+    assert len(delays) == 3
+    for attempt, delay in enumerate(delays):
+        assert 0.5 * 2 ** attempt <= delay <= 2 * 0.5 * 2 ** attempt
+
+
+def test_sample_points_deduplicates_pixels(fake_backend):
+    collection = Collection('test', requests_per_second=1e6)
+    # Same point, a point 1 cm away, then points 20 m North and 20 m East
+    lats = np.array([1.3, 1.3 + 1e-7, 1.3 + 2e-4, 1.3, 85.])
+    lons = np.array([103.9, 103.9, 103.9, 103.9 + 2e-4, 103.9])
+    values = collection.sample_points(np.r_[lats, lats[0]], np.r_[lons, lons[0]], 2020)
+
+    assert values.shape == (6, 64)
+    # The first, second and last points share a pixel, the others have their own
+    assert fake_backend.STATS['pixels'] == 3
+    np.testing.assert_array_equal(values[0], values[1])
+    np.testing.assert_array_equal(values[0], values[5])
+    # No data beyond 80 degrees of latitude
+    assert np.isnan(values[4]).all()
+    assert not np.isnan(values[:4]).any()
+
+
+def test_sample_points_chunks(fake_backend):
+    collection = Collection('test', requests_per_second=1e6)
+    rng = np.random.default_rng(0)
+    # All in UTM zone 47N
+    lats, lons = rng.uniform(0, 10, 250), rng.uniform(97, 101, 250)
+    values = collection.sample_points(lats, lons, 2020, points_per_request=100, max_workers=2)
+    assert fake_backend.STATS['requests'] == 3
+    assert not np.isnan(values).any()
+
+
+def test_sample_points_in_the_projection_of_their_zone(fake_backend, monkeypatch):
+    requests = []
+    sample_regions = fake_backend.FUNCTIONS['Image.sampleRegions']
+
+    def record(image, collection, projection=None, **kwargs):
+        requests.append((projection.crs, projection.scale, [feature['geometry']['coordinates'][0] for feature in collection]))
+        return sample_regions(image, collection, projection=projection, **kwargs)
+
+    monkeypatch.setitem(fake_backend.FUNCTIONS, 'Image.sampleRegions', record)
+    collection = Collection('test', requests_per_second=1e6)
+    # Zones 47, 48 and 49, with 5 points in zone 48
+    lons = np.array([101.5, 102.5, 103, 104, 105, 106, 108.5])
+    values = collection.sample_points(np.full(len(lons), 1.3), lons, 2020, points_per_request=3)
+
+    assert not np.isnan(values).any()
+    zones = {}
+    for crs, scale, chunk in requests:
+        assert scale == 10
+        zones.setdefault(crs, []).extend(chunk)
+    assert {crs: sorted(chunk) for crs, chunk in zones.items()} == {
+        'EPSG:32647': [101.5], 'EPSG:32648': [102.5, 103, 104, 105, 106], 'EPSG:32649': [108.5]}
+    assert len(requests) == 4
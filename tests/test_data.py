@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from mangroves.scripts.data import EpochDataLoader, ShardedMangroveDataset
+
+SHARD_SIZES = [7, 3, 5, 9, 2, 4, 6]
+
+
+@pytest.fixture
+def shards(tmp_path):
+    for k, n in enumerate(SHARD_SIZES):
+        np.save(tmp_path / f's{k}.npy', np.zeros((n, 2, 2, 2), dtype=np.float32))
+        np.save(tmp_path / f's{k}.ratio.npy', 100 * k + np.arange(n, dtype=np.float32))
+    pd.DataFrame({'shard': [f's{k}' for k in range(len(SHARD_SIZES))], 'train': 1,
+                  'samples': SHARD_SIZES}).to_csv(tmp_path / 'shards.csv', index=False)
+    return tmp_path
+
+
+def _ratios(dataset) -> list:
+    return [float(sample['label']['ratio']) for sample in dataset]
+
+
+def test_loader_draws_a_new_shuffling_every_epoch(shards):
+    loader = EpochDataLoader(ShardedMangroveDataset(shards, buffer_size=4), batch_size=8)
+    epochs = [[float(r) for batch in loader for r in batch['label']['ratio']] for _ in range(3)]
+    assert loader.dataset.epoch == 2
+    assert all(sorted(epoch) == sorted(epochs[0]) for epoch in epochs)
+    assert len({tuple(epoch) for epoch in epochs}) == 3
+
+
+@pytest.mark.parametrize('world_size', [2, 3, 4])
+def test_ranks_get_the_same_number_of_samples(shards, monkeypatch, world_size):
+    dataset = ShardedMangroveDataset(shards)
+    seen = set()
+    for rank in range(world_size):
+        monkeypatch.setattr(ShardedMangroveDataset, '_rank', staticmethod(lambda: (rank, world_size)))
+        ratios = _ratios(dataset)
+        assert len(ratios) == len(dataset)
+        seen.update(ratios)
+    # Padding repeats samples but none is left out
+    assert len(seen) == sum(SHARD_SIZES)
+    assert len(dataset) * world_size >= sum(SHARD_SIZES)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from mangroves import quantization
+from mangroves.embeddings import Embeddings, index_directory
+
+
+def _embeddings() -> Embeddings:
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(64, 16, 16)).astype(np.float32)
+    embeddings = Embeddings()
+    embeddings.from_patch(1.3, 103.9, 2020, 16, 10, data / np.linalg.norm(data, axis=0, keepdims=True))
+    return embeddings
+
+
+@pytest.mark.parametrize('dtype, tolerance', [('float32', 0.), ('float16', 1e-3), ('int8', 1e-2)])
+def test_emb_round_trip(tmp_path, dtype, tolerance):
+    embeddings = _embeddings()
+    path = str(tmp_path / 'patch')
+    assert embeddings.save(path, 7, dtype)
+    path += quantization.EXTENSION
+
+    assert quantization.is_compact(path)
+    header = quantization.read_header(path)
+    assert (header['latitude_deg'], header['longitude_deg'], header['year']) == (1.3, 103.9, 2020)
+    data = quantization.read(path)
+    assert data.shape == (64, 16, 16)
+    assert np.abs(data - embeddings.data).max() <= tolerance
+
+
+def test_int8_quantization_error_is_half_a_step():
+    data = _embeddings().data
+    q, scale, offset = quantization.quantize(data, 'int8')
+    error = np.abs(quantization.dequantize(q, scale, offset) - data)
+    assert (error <= scale[:, None, None] / 2 + 1e-6).all()
+
+
+def test_emb_pixels_are_read_without_loading_the_patch(tmp_path):
+    embeddings = _embeddings()
+    path = str(tmp_path / 'patch')
+    embeddings.save(path, 0, 'int8')
+    raw = quantization.read(path + quantization.EXTENSION, raw=True)
+    assert isinstance(raw, np.memmap) and raw.dtype == np.int8
+
+
+@pytest.mark.parametrize('dtype, tolerance', [(None, 0.), ('float32', 0.), ('float16', 1e-3), ('int8', 1e-2)])
+def test_from_file(tmp_path, dtype, tolerance):
+    embeddings = _embeddings()
+    path = str(tmp_path / 'patch')
+    assert embeddings.save(path, 7, dtype)
+    path += '.npz' if dtype is None else quantization.EXTENSION
+
+    loaded = Embeddings()
+    loaded.from_file(path)
+    assert loaded.data.shape == (64, 16, 16)
+    assert np.abs(loaded.data - embeddings.data).max() <= tolerance
+    assert (loaded.latitude_deg, loaded.longitude_deg, loaded.year) == (1.3, 103.9, 2020)
+    assert Embeddings.read_metadata(path)['feature_id'] == 7
+
+
+@pytest.mark.parametrize('dtype', [None, 'int8'])
+def test_lazy_loading_reads_data_on_access(tmp_path, dtype):
+    embeddings = _embeddings()
+    path = str(tmp_path / 'patch')
+    embeddings.save(path, 0, dtype)
+    path += '.npz' if dtype is None else quantization.EXTENSION
+
+    loaded = Embeddings()
+    loaded.from_file(path, lazy=True)
+    assert loaded._data is None and loaded.year == 2020
+    assert np.abs(loaded.data - embeddings.data).max() <= 1e-2
+
+
+def test_index_directory(tmp_path):
+    embeddings = _embeddings()
+    embeddings.save(str(tmp_path / 'a'), 1)
+    embeddings.save(str(tmp_path / 'b'), 2, 'int8')
+    (tmp_path / 'notes.txt').write_text('not a patch')
+
+    index = index_directory(str(tmp_path))
+    assert list(index['feature_id']) == [1, 2]
+    assert (index['year'] == 2020).all()
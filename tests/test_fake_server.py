@@ -0,0 +1,59 @@
+import os
+import json
+import urllib.error
+import urllib.request
+import pytest
+import record_expressions
+
+RECORDED = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ee_expressions.json')
+
+
+def _recorded():
+    with open(RECORDED) as f:
+        return json.load(f)
+
+
+def _compute(url: str, expression: dict) -> dict:
+    request = urllib.request.Request(
+        f'{url}/v1/projects/test/value:compute?prettyPrint=false&alt=json',
+        data=json.dumps({'expression': expression}).encode(),
+        headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200
+        return json.loads(response.read())['result']
+
+
+def test_server_answers_the_real_client(fake_server):
+    cases = _recorded()
+    rows = _compute(fake_server.url, cases['extract'][1])['properties']
+    assert len(rows) == 64 and all(len(row) == 16 and len(row[0]) == 16 for row in rows.values())
+    assert _compute(fake_server.url, cases['is_available'][0]) == 1
+    features = _compute(fake_server.url, cases['sample_points'][0])['features']
+    # The point outside of the coverage is dropped
+    assert [len(feature['properties']) for feature in features] == [65, 65]
+    for requests in cases.values():
+        for expression in requests:
+            _compute(fake_server.url, expression)
+
+
+def test_fake_client_sends_the_requests_of_the_real_client(fake_backend, monkeypatch):
+    payloads = []
+    evaluate = fake_backend.evaluate
+
+    def record(expression):
+        payloads.append(expression)
+        return evaluate(expression)
+
+    monkeypatch.setattr(fake_backend, 'evaluate', record)
+    cases = record_expressions.run_cases(payloads)
+    recorded = _recorded()
+    assert cases.keys() == recorded.keys()
+    for name, requests in recorded.items():
+        assert [record_expressions.inline(e) for e in cases[name]] == [record_expressions.inline(e) for e in requests], name
+
+
+def test_unknown_algorithm_is_rejected(fake_server):
+    expression = {'result': '0', 'values': {'0': {'functionInvocationValue': {'functionName': 'Image.unknown', 'arguments': {}}}}}
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _compute(fake_server.url, expression)
+    assert error.value.code == 400
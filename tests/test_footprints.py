@@ -0,0 +1,77 @@
+import numpy as np
+from mangroves import profiling
+from mangroves.collection import Collection
+from mangroves.constants import EMBEDDING_COLLECTION
+from mangroves.footprints import FootprintIndex
+from mangroves.geometry import Region
+
+REGION = Region(1.3, 103.9, 16)
+
+
+def _index() -> FootprintIndex:
+    c = REGION.coords
+    index = FootprintIndex()
+    # A box containing the region, one overlapping its East edge, and one away from it
+    index.add(2020, ['west', 'east', 'far'], [
+        [c['xMin'] - 0.1, c['yMin'] - 0.1, c['xMax'] + 0.1, c['yMax'] + 0.1],
+        [c['xMax'] - 1e-4, c['yMin'] - 0.1, c['xMax'] + 0.2, c['yMax'] + 0.1],
+        [c['xMax'] + 1, c['yMin'], c['xMax'] + 2, c['yMax']],
+    ])
+    return index
+
+
+def test_lookup_puts_containing_boxes_first():
+    index = _index()
+    assert index.lookup(REGION, 2020) == ['west', 'east']
+    assert index.lookup(Region(1.3, 110., 16), 2020) == []
+    assert index.lookup(REGION, 2019) == [] and not index.has_year(2019)
+
+
+def test_save_and_load(tmp_path):
+    index = _index()
+    index.add(2019, ['a'], [[0, 0, 1, 1]])
+    index.save(str(tmp_path / 'footprints.npz'))
+    loaded = FootprintIndex()
+    loaded.from_file(str(tmp_path / 'footprints.npz'))
+
+    assert sorted(loaded.ids) == [2019, 2020]
+    for year in (2019, 2020):
+        np.testing.assert_array_equal(loaded.ids[year], index.ids[year])
+        np.testing.assert_array_equal(loaded.bounds[year], index.bounds[year])
+    assert loaded.lookup(REGION, 2020) == ['west', 'east']
+
+
+def test_build_through_the_rate_limiter(fake_backend):
+    collection = Collection('test', requests_per_second=1e6)
+    profiling.enable()
+    try:
+        index = collection.build_footprints([2019, 2020], page_size=10)
+        # One count and one page per year
+        assert profiling.report()['counters']['gee.requests'] == 4
+    finally:
+        profiling.disable()
+        profiling.reset()
+    assert index is collection.footprint_index
+    assert index.ids[2020].tolist() == ['fake']
+    np.testing.assert_array_equal(index.bounds[2020], [[-180, -90, 180, 90]])
+    assert collection.is_available(REGION, 2020)
+    assert fake_backend.STATS['requests'] == 4
+
+
+def test_overlapping_candidates_are_mosaicked(fake_backend, monkeypatch):
+    mosaicked = []
+    mosaic = fake_backend.FUNCTIONS['ImageCollection.mosaic']
+
+    def record(collection):
+        mosaicked.append([image.image_id for image in collection])
+        return mosaic(collection)
+
+    monkeypatch.setitem(fake_backend.FUNCTIONS, 'ImageCollection.mosaic', record)
+    collection = Collection('test', requests_per_second=1e6, footprint_index=_index())
+    patch = collection.extract(REGION, 2020)
+    # Both candidates, the one containing the region on top
+    assert mosaicked == [[f'{EMBEDDING_COLLECTION}/east', f'{EMBEDDING_COLLECTION}/west']]
+    # The mosaic keeps the 10 m projection of the images instead of WGS84 at 1 degree
+    assert patch.shape == (64, 16, 16)
+    assert (np.linalg.norm(patch, axis=0) > 0.99).all()
+    assert fake_backend.STATS['requests'] == 1
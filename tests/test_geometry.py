@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from mangroves.constants import SPATIAL_RESOLUTION_M
+from mangroves.geometry import Region, RegionBatch, bounding_boxes
+from mangroves.utils import geodesic_circles, haversine
+
+RNG = np.random.default_rng(0)
+LATS, LONS = RNG.uniform(-60, 60, 50), RNG.uniform(-179.9, 179.9, 50)
+SIZES = RNG.integers(16, 256, 50)
+
+
+def test_batch_items_equal_regions():
+    batch = RegionBatch(LATS, LONS, SIZES)
+    assert len(batch) == len(LATS) and len(batch.geometries()) == len(LATS)
+    for i, region in enumerate(batch):
+        expected = Region(LATS[i], LONS[i], int(SIZES[i]))
+        assert (region.lat0_deg, region.lon0_deg, region.nPixels) == (expected.lat0_deg, expected.lon0_deg, expected.nPixels)
+        assert region.coords == pytest.approx(expected.coords, rel=1e-12)
+        np.testing.assert_allclose(region.pts, expected.pts, rtol=1e-12)
+    assert batch[3].region is not None
+
+
+def test_shared_size_and_invalid_coordinates():
+    batch = RegionBatch(LATS[:3], LONS[:3], 64)
+    assert batch[2].nPixels == 64 and batch[2].coords == pytest.approx(Region(LATS[2], LONS[2], 64).coords)
+    with pytest.raises(AssertionError):
+        RegionBatch([10., 95.], [0., 0.], 64)
+
+
+def test_bounding_boxes_are_great_circle_points():
+    lats_deg, lons_deg = bounding_boxes(LATS, LONS, SIZES)
+    distance_m = (SIZES + 2) / 2 * SPATIAL_RESOLUTION_M
+    # North, East, South and West, at the half-size of the region plus one pixel
+    circles = geodesic_circles(LATS, LONS, distance_m, 4)
+    np.testing.assert_allclose(lats_deg, circles[..., 0], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(lons_deg, circles[..., 1], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(haversine(LATS[:, None], lats_deg, LONS[:, None], lons_deg),
+                               np.broadcast_to(distance_m[:, None], (50, 4)), rtol=1e-9)
+    assert (lats_deg[:, 0] > LATS).all() and (lats_deg[:, 2] < LATS).all()
+    np.testing.assert_allclose(lons_deg[:, [0, 2]], np.repeat(LONS[:, None], 2, axis=1), atol=1e-9)
@@ -0,0 +1,44 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from mangroves.geometry import Region
+from mangroves.gmw import GMWTileStore, build_tiles
+from mangroves.labels import chip_mask
+
+# Polygons around the 102° E border of UTM zones 47 and 48, and across the 1° N tile border
+POLYGONS = [
+    shapely.box(101.995, 0.995, 102.004, 1.004),
+    shapely.Polygon([(102.0005, 1.0005), (102.003, 1.0001), (102.002, 1.002)]),
+    shapely.box(101.990, 0.990, 101.996, 0.999),
+    shapely.box(103.500, 1.500, 103.501, 1.501),
+    shapely.box(102.001, 0.996, 102.002, 0.998).buffer(0.0005),
+]
+
+
+def _layer(tmp_path) -> str:
+    path = str(tmp_path / 'gmw.gpkg')
+    gpd.GeoDataFrame({'id': np.arange(len(POLYGONS))}, geometry=POLYGONS, crs='EPSG:4326').to_file(path)
+    return path
+
+
+def test_build_tiles(tmp_path):
+    index = build_tiles(_layer(tmp_path), tmp_path / 'tiles', chunk_size=2)
+    assert list(index['name']) == ['+000+0101', '+000+0102', '+001+0101', '+001+0102', '+001+0103']
+    assert list(index['epsg']) == [32647, 32648, 32647, 32648, 32648]
+    # The polygon across the four tiles is in each of them, the spill files are removed
+    assert index['count'].sum() == len(POLYGONS) + 3
+    assert sorted(p.name for p in (tmp_path / 'tiles').iterdir()) == ['index.npz', 'tiles']
+
+
+def test_labels_match_chip_mask(tmp_path):
+    build_tiles(_layer(tmp_path), tmp_path / 'tiles', chunk_size=2)
+    store = GMWTileStore(tmp_path / 'tiles')
+    # Chips centered in zone 47 and in zone 48, both overlapping polygons of the other zone
+    for lat, lon in [(1.0, 101.9995), (1.0, 102.0005), (0.997, 101.996), (1.5005, 103.5005), (2.5, 105.)]:
+        region = Region(lat, lon, 64)
+        ratio, mask = store.label(region)
+        expected = chip_mask(np.array(POLYGONS), lat, lon, 64)
+        assert np.abs(mask.astype(int) - expected).sum() <= 2, (lat, lon)
+        assert abs(ratio - expected.mean()) < 1e-3
+    assert store.label(Region(1.0, 101.9995, 64))[0] > 0.5
+    assert store.label(Region(2.5, 105., 64))[0] == 0
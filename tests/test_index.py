@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from mangroves.embeddings import Embeddings
+from mangroves.index import PixelIndex, assign, kmeans
+
+N_PATCHES, SIZE = 6, 16
+
+
+def _unit(x: np.ndarray, axis: int) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=axis, keepdims=True)
+
+
+@pytest.fixture(scope='module')
+def patches(tmp_path_factory):
+    """
+    Patches of unit-length pixels drawn around 12 directions, saved as `.emb` files.
+    """
+    rng = np.random.default_rng(0)
+    centers = _unit(rng.normal(size=(12, 64)), axis=1)
+    path = tmp_path_factory.mktemp('patches')
+    files, data = [], []
+    for i in range(N_PATCHES):
+        labels = rng.integers(0, len(centers), size=SIZE * SIZE)
+        pixels = _unit(centers[labels] + 0.1 * rng.normal(size=(SIZE * SIZE, 64)), axis=1)
+        embeddings = Embeddings()
+        embeddings.from_patch(1.3 + 0.01 * i, 103.9, 2020, SIZE, 10, pixels.T.reshape(64, SIZE, SIZE).astype(np.float32))
+        embeddings.save(str(path / f'{i}'), i, 'float32')
+        files.append(str(path / f'{i}.emb'))
+        data.append(embeddings.data)
+    return files, np.stack(data)
+
+
+@pytest.fixture(scope='module')
+def index(patches, tmp_path_factory):
+    files, _ = patches
+    return PixelIndex.build(files, tmp_path_factory.mktemp('index'), n_lists=16, n_subvectors=8, n_iter=10)
+
+
+def _brute_force(data: np.ndarray, queries: np.ndarray, k: int):
+    pixels = data.transpose(0, 2, 3, 1).reshape(-1, 64)
+    distances = ((pixels[None] - queries[:, None]) ** 2).sum(axis=2)
+    best = np.argsort(distances, axis=1)[:, :k]
+    ids = np.stack(np.unravel_index(best, (N_PATCHES, SIZE, SIZE)), axis=2)
+    return np.take_along_axis(distances, best, axis=1), ids
+
+
+def _recall(ids: np.ndarray, expected: np.ndarray) -> float:
+    found = [len({tuple(i) for i in a} & {tuple(i) for i in b}) for a, b in zip(ids, expected)]
+    return sum(found) / expected[:, :, 0].size
+
+
+def test_kmeans_converges_to_cluster_means():
+    rng = np.random.default_rng(1)
+    centers = 10 * rng.normal(size=(5, 8))
+    x = (centers[rng.integers(0, 5, size=1000)] + rng.normal(size=(1000, 8))).astype(np.float32)
+    centroids = kmeans(x, 8, n_iter=50, seed=0)
+    labels = assign(x, centroids)
+    # Lloyd's fixed point: every centroid is the mean of the points assigned to it
+    for j in range(len(centroids)):
+        np.testing.assert_allclose(centroids[j], x[labels == j].mean(axis=0), atol=1e-4)
+    # Every cluster is covered, with the inertia of the noise
+    assert np.linalg.norm(centroids[:, None] - centers[None], axis=2).min(axis=0).max() < 2
+    assert ((x - centroids[labels]) ** 2).sum(axis=1).mean() < 8
+
+
+def test_recall_against_brute_force(index, patches):
+    _, data = patches
+    rng = np.random.default_rng(2)
+    queries = _unit(data.transpose(0, 2, 3, 1).reshape(-1, 64)[rng.choice(N_PATCHES * SIZE * SIZE, 20)]
+                    + 0.05 * rng.normal(size=(20, 64)), axis=1).astype(np.float32)
+    _, expected = _brute_force(data, queries, 10)
+
+    _, ids = index.search(queries, k=10, n_probe=4)
+    assert ids.shape == (20, 10, 3)
+    assert _recall(ids, expected) > 0.4
+    # Product quantization ranks the neighbours roughly, exact distances re-rank them
+    _, ids = index.search(queries, k=10, n_probe=4, refine=10)
+    assert _recall(ids, expected) > 0.95
+    # Scanning every list and re-ranking enough candidates is exact
+    distances, ids = index.search(queries, k=10, n_probe=16, refine=50)
+    assert _recall(ids, expected) == 1.
+
+
+def test_refine_returns_exact_distances(index, patches):
+    _, data = patches
+    query = data[2, :, 3, 4]
+    distances, ids = index.search(query, k=5, n_probe=16, refine=10)
+    exact = ((index.vectors(ids[0]) - query) ** 2).sum(axis=1)
+    np.testing.assert_allclose(distances[0], exact, atol=1e-6)
+    assert tuple(ids[0, 0]) == (2, 3, 4) and distances[0, 0] < 1e-10
+    assert (np.diff(distances[0]) >= 0).all()
+
+    neighbours = index.neighbours(query, k=5, n_probe=16, refine=10)
+    np.testing.assert_allclose(neighbours['similarity'], 1 - exact / 2, atol=1e-6)
@@ -0,0 +1,62 @@
+import numpy as np
+import torch
+from mangroves.inference import SlidingWindowPredictor
+from mangroves.scripts.load import load_normalization_from_config
+from mangroves.stats import BandStatistics, Normalization, STATS_FILE
+
+
+def _mosaic(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(4, 37, 50)) * np.array([0.1, 0.2, 0.3, 0.4])[:, None, None]
+            + np.array([0.5, -0.2, 0., 0.3])[:, None, None]).astype(np.float32)
+
+
+def _net() -> torch.nn.Module:
+    # Dense map of the band mean of each pixel, the same in every window containing it
+    net = torch.nn.Conv2d(4, 1, kernel_size=1)
+    with torch.no_grad():
+        net.weight.fill_(0.25)
+        net.bias.zero_()
+    return net
+
+
+def test_predicts_normalized_windows(tmp_path):
+    mosaic = _mosaic()
+    np.save(tmp_path / 'mosaic.npy', mosaic)
+    normalization = Normalization(BandStatistics(4).update(mosaic))
+    predictor = SlidingWindowPredictor(_net(), window=16, overlap=4, batch_size=3, normalization=normalization)
+    output = predictor.predict(str(tmp_path / 'mosaic.npy'), str(tmp_path / 'prediction.npy'))
+
+    assert isinstance(output, np.memmap) and output.shape == (1, 37, 50)
+    assert np.load(tmp_path / 'prediction.npy', mmap_mode='r').shape == (1, 37, 50)
+    assert not (tmp_path / 'prediction.weights.npy').exists()
+    # Blending predictions that agree gives them back, edges and last windows included
+    np.testing.assert_allclose(output[0], normalization(mosaic).mean(axis=0), atol=1e-5)
+    assert np.abs(output[0] - mosaic.mean(axis=0)).max() > 0.1
+
+
+def test_blends_window_predictions(tmp_path):
+    class WindowMean(torch.nn.Module):
+        def forward(self, x):
+            return x.mean(dim=(1, 2, 3))
+
+    mosaic = _mosaic()
+    output = SlidingWindowPredictor(WindowMean(), window=16, overlap=8, batch_size=4).predict(
+        mosaic, str(tmp_path / 'prediction.npy'))
+    assert output.shape == (1, 37, 50)
+    # Weighted averages of the window means, varying smoothly across the scene
+    assert output.min() >= mosaic.mean() - 0.1 and output.max() <= mosaic.mean() + 0.1
+    assert np.abs(np.diff(output[0], axis=1)).max() < 0.02
+
+
+def test_normalization_from_config(tmp_path):
+    mosaic = _mosaic()
+    BandStatistics(4).update(mosaic).save(tmp_path / STATS_FILE)
+    config = tmp_path / 'datamodule.yml'
+    config.write_text(f'path: {tmp_path}\nnormalize: true\n')
+    normalization = load_normalization_from_config(str(config))
+    np.testing.assert_allclose(normalization(mosaic).mean(axis=(1, 2)), 0, atol=1e-5)
+    np.testing.assert_allclose(normalization(mosaic).std(axis=(1, 2)), 1, atol=1e-4)
+
+    config.write_text(f'path: {tmp_path}\n')
+    assert load_normalization_from_config(str(config)) is None
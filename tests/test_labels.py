@@ -0,0 +1,66 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from mangroves.geometry import Region
+from mangroves.labels import LabelEngine, chip_grid, get_category
+from mangroves.utils import utm_epsg
+
+# Mangrove stands of a few hundred meters around Pulau Ubin
+POLYGONS = [
+    shapely.box(103.940, 1.395, 103.950, 1.405),
+    shapely.Point(103.962, 1.405).buffer(0.0015),
+    shapely.Polygon([(103.950, 1.410), (103.953, 1.410), (103.950, 1.413)]),
+]
+SITES = [(1.400, 103.945), (1.401, 103.9505), (1.405, 103.962), (1.411, 103.951), (1.42, 103.97)]
+
+
+def _notebook_category(ratio):
+    """
+    get_category of notebooks/create_labels.ipynb.
+    """
+    if ratio == 0: return 0
+    elif ratio <= 0.2: return 1
+    elif ratio <= 0.4: return 2
+    elif ratio <= 0.6: return 3
+    elif ratio <= 0.8: return 4
+    else: return 5
+
+
+def _notebook_coverage(lat_deg, lon_deg, nPixels):
+    """
+    calculate_global_coverage of notebooks/create_labels.ipynb: the area of the polygons inside
+    the chip, in the UTM zone of the chip.
+    """
+    crs = f'EPSG:{utm_epsg(lat_deg, lon_deg)}'
+    polygons = gpd.GeoSeries(POLYGONS, crs='EPSG:4326').to_crs(crs)
+    _, transform = chip_grid(lat_deg, lon_deg, nPixels)
+    size_m = nPixels * 10
+    chip = shapely.box(transform.c, transform.f - size_m, transform.c + size_m, transform.f)
+    return min(polygons.intersection(chip).area.sum() / chip.area, 1.)
+
+
+def test_category_matches_notebook():
+    ratios = np.array([0, 1e-6, 0.1, 0.2, 0.2 + 1e-9, 0.4, 0.5, 0.6, 0.8, 0.8 + 1e-9, 1.])
+    assert list(get_category(ratios)) == [_notebook_category(ratio) for ratio in ratios]
+
+
+def test_coverage_matches_notebook(tmp_path):
+    engine = LabelEngine(np.array(POLYGONS))
+    regions = [Region(lat, lon, 64) for lat, lon in SITES]
+    labels = engine.label_many(regions, max_workers=2, masks_path=str(tmp_path / 'masks.npy'), chunksize=1)
+
+    expected = np.array([_notebook_coverage(lat, lon, 64) for lat, lon in SITES])
+    assert 0 < expected[:4].min() and expected[0] == 1 and expected[4] == 0
+    # Pixel centers against exact areas, to within the pixels along the edges
+    np.testing.assert_allclose(labels['ratio'], expected, atol=0.03)
+    assert list(labels['category']) == [_notebook_category(ratio) for ratio in labels['ratio']]
+    masks = np.load(tmp_path / 'masks.npy')
+    assert masks.shape == (len(SITES), 64, 64)
+    np.testing.assert_allclose(masks.mean(axis=(1, 2)), labels['ratio'])
+    for region, ratio in zip(regions, labels['ratio']):
+        assert engine.label(region)[0] == ratio
+
+
+def test_no_regions():
+    labels = LabelEngine(np.array(POLYGONS)).label_many([])
+    assert len(labels) == 0 and list(labels.columns) == ['lat', 'lon', 'ratio', 'category']
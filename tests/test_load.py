@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+from mangroves.scripts.load import ConfigError, validate_configs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['torch', 'pytorch_lightning', 'mangroves.models', 'mangroves.modules']
+
+# Runs main.py with the given arguments, then lists the heavy modules it imported
+DRY_RUN = """
+import sys, json
+from mangroves import main
+heavy = json.loads(sys.argv[2])
+sys.argv = ['main.py'] + json.loads(sys.argv[1])
+try:
+    main.main()
+    code = 0
+except SystemExit as e:
+    code = e.code
+print(json.dumps({'code': code, 'imported': [m for m in heavy if m in sys.modules]}))
+"""
+
+
+def write_configs(tmp_path, dataset_path, model_class='torch.nn.Identity'):
+    datamodule = tmp_path / 'datamodule.yml'
+    datamodule.write_text(f'path: "{dataset_path}"\nbatch_size: 32\n')
+    litmodule = tmp_path / 'litmodule.yml'
+    litmodule.write_text(f'model_options:\n  model_class: "{model_class}"\n'
+                         'litmodule_options:\n  litmodule_class: "pytorch_lightning.LightningModule"\n')
+    return str(litmodule), str(datamodule)
+
+
+def dry_run(*args):
+    arguments = list(args) + ['--dry-run']
+    result = subprocess.run([sys.executable, '-c', DRY_RUN, json.dumps(arguments), json.dumps(HEAVY_MODULES)],
+                            cwd=ROOT, capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def test_validate_configs(tmp_path):
+    litmodule, datamodule = write_configs(tmp_path, tmp_path)
+    configs = validate_configs(litmodule, [datamodule])
+    assert configs[datamodule]['path'] == str(tmp_path)
+    assert configs[litmodule]['model_options']['model_class'] == 'torch.nn.Identity'
+
+
+def test_validate_configs_missing_dataset(tmp_path):
+    litmodule, datamodule = write_configs(tmp_path, tmp_path / 'missing')
+    with pytest.raises(ConfigError, match='dataset path .* does not exist'):
+        validate_configs(litmodule, [datamodule])
+
+
+def test_validate_configs_unresolvable_class(tmp_path):
+    litmodule, datamodule = write_configs(tmp_path, tmp_path, model_class='unknown_package.Model')
+    with pytest.raises(ConfigError, match='no module unknown_package to resolve unknown_package.Model'):
+        validate_configs(litmodule, [datamodule])
+
+
+@pytest.mark.parametrize('dataset, model_class, code', [
+    ('.', 'torch.nn.Identity', 0), ('missing', 'torch.nn.Identity', 1), ('.', 'unknown_package.Model', 1)])
+def test_dry_run_does_not_import_heavy_modules(tmp_path, dataset, model_class, code):
+    litmodule, datamodule = write_configs(tmp_path, tmp_path / dataset, model_class)
+    result, stderr = dry_run('--litmodule_config', litmodule, '--datamodule_config', datamodule)
+    assert result == {'code': code, 'imported': []}, stderr
+    if code:
+        assert 'Invalid configuration' in stderr
@@ -0,0 +1,45 @@
+import json
+import numpy as np
+from mangroves.collection import Collection
+from mangroves.mosaic import TiledExtractor
+
+
+def _extractor(path, tile_size=16) -> TiledExtractor:
+    return TiledExtractor(103.9, 1.3, 103.903, 1.303, 2020, str(path), tile_size=tile_size)
+
+
+def test_resumes_missing_tiles(tmp_path, fake_backend):
+    collection = Collection('test', requests_per_second=1e6)
+    extractor = _extractor(tmp_path)
+    expected = np.array(extractor.run(collection, max_workers=2))
+    assert fake_backend.STATS['requests'] == 2 * extractor.rows * extractor.cols
+
+    # Forget two tiles, as if the first run had been interrupted
+    tiles = np.load(tmp_path / 'tiles.npy', mmap_mode='r+')
+    tiles[0, 1] = tiles[2, 2] = False
+    tiles.flush()
+    del tiles
+    requests = fake_backend.STATS['requests']
+    mosaic = _extractor(tmp_path).run(collection, max_workers=2)
+
+    assert fake_backend.STATS['requests'] - requests == 2 * 2
+    np.testing.assert_array_equal(mosaic, expected)
+    assert np.load(tmp_path / 'tiles.npy').all()
+
+
+def test_complete_mosaic_needs_no_request(tmp_path, fake_backend):
+    collection = Collection('test', requests_per_second=1e6)
+    _extractor(tmp_path).run(collection)
+    requests = fake_backend.STATS['requests']
+    _extractor(tmp_path).run(collection)
+    assert fake_backend.STATS['requests'] == requests
+
+
+def test_other_dtype_or_area_is_not_resumed(tmp_path, fake_backend):
+    _extractor(tmp_path).run(Collection('test', requests_per_second=1e6))
+    requests = fake_backend.STATS['requests']
+    mosaic = _extractor(tmp_path).run(Collection('test', requests_per_second=1e6, dtype=np.float16))
+    assert mosaic.dtype == np.float16
+    assert fake_backend.STATS['requests'] == 2 * requests
+    with open(tmp_path / 'mosaic.json') as f:
+        assert json.load(f)['dtype'] == np.dtype(np.float16).str
@@ -0,0 +1,134 @@
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from mangroves.collection import Collection
+from mangroves.pipeline import DatasetBuilder, Journal
+
+N_SAMPLES = 12
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedCollection:
+    """
+    Collection whose extractions stop after a number of patches, as an interrupted run would.
+    """
+
+    def __init__(self, collection: Collection, n_patches: int) -> None:
+        self.collection = collection
+        self.n_patches = n_patches
+
+    def extract_many(self, regions, year, **kwargs):
+        for k, result in enumerate(self.collection.extract_many(regions, year, **kwargs)):
+            if k == self.n_patches:
+                raise Interrupted()
+            yield result
+
+
+class RecordingLabeller:
+    """
+    Labeller recording the number of GEE requests issued when each patch is labelled.
+    """
+
+    def __init__(self, fake_backend) -> None:
+        self.fake_backend = fake_backend
+        self.requests = []
+
+    def label(self, region):
+        self.requests.append(self.fake_backend.STATS['requests'])
+        return 0.5, None
+
+
+@pytest.fixture
+def samples() -> pd.DataFrame:
+    return pd.DataFrame({
+        'id': np.arange(N_SAMPLES),
+        'lat': 1.3 + 0.01 * np.arange(N_SAMPLES),
+        'lon': 103.9,
+        'year': [2019] * 6 + [2020] * 6,
+        'category': 1,
+        'ratio': 0.1 * np.arange(N_SAMPLES) / N_SAMPLES,
+        'train': 1,
+    })
+
+
+def _run(builder: DatasetBuilder, samples: pd.DataFrame, timeout_s: float = 30.):
+    """
+    Run the builder in a thread, failing instead of hanging if the run never ends.
+    """
+    result = {}
+
+    def target():
+        try:
+            result['journals'] = builder.run(samples)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout_s)
+    assert not thread.is_alive(), 'The run hangs.'
+    if 'error' in result:
+        raise result['error']
+    return result['journals']
+
+
+def test_resumes_after_an_interrupted_run(tmp_path, fake_backend, samples):
+    collection = Collection('test', requests_per_second=1e6)
+    builder = DatasetBuilder(tmp_path, InterruptedCollection(collection, 4), regionDiameter_p=16, max_workers=2)
+    with pytest.raises(Interrupted):
+        _run(builder, samples)
+    interrupted = Journal(tmp_path / 'journal' / 'fetch.log')
+    assert len(interrupted) == 4
+    interrupted.close()
+    # A crash while writing leaves a truncated line, ignored on resume
+    with open(tmp_path / 'journal' / 'label.log', 'a') as f:
+        f.write('11\t0.')
+
+    requests = fake_backend.STATS['requests']
+    builder = DatasetBuilder(tmp_path, collection, regionDiameter_p=16, max_workers=2)
+    fetched, labelled = _run(builder, samples)
+    assert set(fetched.entries) == set(labelled.entries) == set(range(N_SAMPLES))
+    # Only the remaining patches are fetched, two requests each
+    assert fake_backend.STATS['requests'] - requests == 2 * (N_SAMPLES - 4)
+    assert [float(labelled.entries[item]) for item in range(N_SAMPLES)] == pytest.approx(samples['ratio'])
+
+    store = builder.pack(samples, labelled)
+    assert len(store) == N_SAMPLES
+
+
+def test_labels_while_fetching(tmp_path, fake_backend, samples):
+    fake_backend.configure(latency_s=0.02, size=16)
+    labeller = RecordingLabeller(fake_backend)
+    builder = DatasetBuilder(
+        tmp_path, Collection('test', requests_per_second=1e6), labeller, regionDiameter_p=16, max_workers=2)
+    _, labelled = _run(builder, samples)
+
+    assert len(labelled) == N_SAMPLES
+    assert all(float(ratio) == 0.5 for ratio in labelled.entries.values())
+    # The first patches are labelled long before the last ones are fetched
+    assert labeller.requests[0] < fake_backend.STATS['requests'] / 2
+
+
+def test_unknown_ids_are_skipped(tmp_path, fake_backend, samples):
+    # Fetched by a previous run on other samples
+    journal = Journal(tmp_path / 'journal' / 'fetch.log')
+    journal.record(N_SAMPLES + 1)
+    journal.close()
+    builder = DatasetBuilder(tmp_path, Collection('test', requests_per_second=1e6), regionDiameter_p=16, queue_size=1)
+    _, labelled = _run(builder, samples)
+    assert set(labelled.entries) == set(range(N_SAMPLES))
+
+
+def test_a_dead_label_stage_fails_the_run(tmp_path, fake_backend, samples, monkeypatch):
+    def label(*args):
+        raise MemoryError()
+
+    builder = DatasetBuilder(tmp_path, Collection('test', requests_per_second=1e6), regionDiameter_p=16, queue_size=1)
+    monkeypatch.setattr(builder, 'label', label)
+    with pytest.raises(RuntimeError) as error:
+        _run(builder, samples)
+    assert isinstance(error.value.__cause__, MemoryError)
@@ -0,0 +1,100 @@
+import csv
+import json
+import math
+import time
+from types import SimpleNamespace
+import pytest
+from mangroves import profiling
+from mangroves.profiling import Histogram, Profiler
+from mangroves.scripts.callbacks import ProfilingCallback
+
+
+@pytest.fixture
+def profiler():
+    """
+    The global profiler, disabled and emptied before and after the test.
+    """
+    enabled = profiling.enabled()
+    profiling.disable()
+    profiling.reset()
+    yield profiling.PROFILER
+    profiling.reset()
+    profiling.PROFILER.enabled = enabled
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    profiler.count('requests')
+    profiler.observe('latency', 1.)
+    with profiler.timer('step'):
+        pass
+    assert profiler.timed('call')(lambda x: x + 1)(1) == 2
+    report = profiler.report()
+    assert report['counters'] == {} and report['histograms'] == {}
+
+
+def test_timers_counters_and_percentiles():
+    profiler = Profiler(enabled=True)
+    profiler.count('requests')
+    profiler.count('bytes', 512)
+    profiler.count('bytes', 512)
+    with profiler.timer('sleep'):
+        time.sleep(0.01)
+    profiler.timed('double')(lambda x: 2 * x)(3)
+    for value in range(1, 101):
+        profiler.observe('values', value)
+
+    report = profiler.report()
+    assert report['counters'] == {'bytes': 1024, 'requests': 1}
+    assert report['histograms']['sleep']['count'] == 1 and report['histograms']['sleep']['min'] >= 0.01
+    assert report['histograms']['double']['count'] == 1
+    values = report['histograms']['values']
+    assert (values['count'], values['total'], values['min'], values['max']) == (100, 5050, 1, 100)
+    # Percentiles to within a factor of 2
+    assert 50 <= values['p50'] <= 64 and 90 <= values['p90'] <= 100 and values['p99'] == 100
+
+
+def test_histogram_of_nothing():
+    summary = Histogram().to_dict()
+    assert summary['count'] == 0 and math.isnan(summary['p50']) and math.isnan(summary['mean'])
+
+
+def test_reports_are_written(tmp_path):
+    profiler = Profiler(enabled=True)
+    profiler.count('requests', 3)
+    profiler.observe('latency', 0.5)
+    profiler.save(tmp_path / 'report.json')
+    profiler.save(tmp_path / 'nested' / 'report.csv')
+
+    with open(tmp_path / 'report.json') as f:
+        report = json.load(f)
+    assert report['counters'] == {'requests': 3} and report['histograms']['latency']['max'] == 0.5
+    with open(tmp_path / 'nested' / 'report.csv') as f:
+        rows = {row['name']: row for row in csv.DictReader(f)}
+    assert rows['requests']['kind'] == 'counter' and rows['requests']['count'] == '3'
+    assert rows['latency']['kind'] == 'histogram' and float(rows['latency']['p50']) == 0.5
+
+
+def test_callback_restores_disabled_profiler(profiler, tmp_path):
+    logged = []
+    trainer = SimpleNamespace(current_epoch=0, global_step=2, is_global_zero=True,
+                              logger=SimpleNamespace(log_metrics=lambda metrics, step: logged.append(metrics)))
+    callback = ProfilingCallback(output_path=str(tmp_path / 'report.json'))
+    callback.on_fit_start(trainer, None)
+    assert profiling.enabled()
+    callback.on_train_epoch_start(trainer, None)
+    for i in range(2):
+        callback.on_train_batch_start(trainer, None, None, i)
+        callback.on_train_batch_end(trainer, None, None, None, i)
+    callback.on_train_epoch_end(trainer, None)
+    callback.on_fit_end(trainer, None)
+
+    assert not profiling.enabled()
+    assert set(logged[0]) == {'profiling/train.data_wait_ms', 'profiling/train.step_ms'}
+    with open(tmp_path / 'report.json') as f:
+        assert json.load(f)['histograms']['train.step']['count'] == 2
+    # Enabled before the fit, it stays enabled
+    profiling.enable()
+    callback.on_fit_start(trainer, None)
+    callback.on_fit_end(trainer, None)
+    assert profiling.enabled()
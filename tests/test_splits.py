@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from mangroves.constants import RADIUS_EARTH_M
+from mangroves.splits import SPLITS, CHIP_SIZE_M, make_splits, load_splits, spatial_blocks
+
+
+def _samples(n: int = 2000, seed: int = 0) -> pd.DataFrame:
+    # Clusters of chips a few kilometers wide, as sampled along mangrove coasts
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([-10, 100], [10, 120], size=(40, 2))[rng.integers(40, size=n)]
+    lat, lon = (centers + rng.normal(scale=0.05, size=(n, 2))).T
+    return pd.DataFrame({'lat': lat, 'lon': lon, 'category': rng.integers(1, 6, size=n)})
+
+
+def test_deterministic(tmp_path):
+    samples = _samples()
+    first = make_splits(samples, tmp_path / 'a', seed=1)
+    second = make_splits(samples, tmp_path / 'b', seed=1)
+    other = make_splits(samples, tmp_path / 'c', seed=2)
+    for name in SPLITS:
+        np.testing.assert_array_equal(first[name], second[name])
+        np.testing.assert_array_equal(first[name], load_splits(tmp_path / 'a')[name])
+    assert any(len(first[name]) != len(other[name]) or (first[name] != other[name]).any() for name in SPLITS)
+
+
+def test_splits_are_disjoint_blocks(tmp_path):
+    samples = _samples()
+    splits = make_splits(samples, tmp_path, chip_size_m=0)
+    assert sum(len(indices) for indices in splits.values()) == len(samples)
+    blocks = spatial_blocks(samples['lat'].to_numpy(), samples['lon'].to_numpy())
+    train, val, test = (set(blocks[splits[name]]) for name in SPLITS)
+    assert not train & val and not train & test and not val & test
+
+
+def test_guard_band_separates_chips(tmp_path):
+    samples = _samples()
+    splits = make_splits(samples, tmp_path)
+    labels = np.full(len(samples), -1)
+    for i, name in enumerate(SPLITS):
+        labels[splits[name]] = i
+    kept = np.flatnonzero(labels >= 0)
+    assert len(kept) < len(samples)
+
+    # Chips overlap when their centers are less than a chip apart along both axes
+    meters_per_deg = RADIUS_EARTH_M * np.pi / 180
+    y = samples['lat'].to_numpy()[kept] * meters_per_deg
+    x = samples['lon'].to_numpy()[kept] * meters_per_deg * np.cos(np.radians(samples['lat'].to_numpy()[kept]))
+    overlap = (np.abs(y[:, None] - y[None]) < CHIP_SIZE_M * 0.99) & (np.abs(x[:, None] - x[None]) < CHIP_SIZE_M * 0.99)
+    assert not (overlap & (labels[kept][:, None] != labels[kept][None])).any()
+
+
+def test_truncated_dataset_keeps_first_samples(tmp_path):
+    samples = _samples()
+    splits = make_splits(samples, tmp_path)
+    truncated = load_splits(tmp_path, n_samples=500)
+    for name in SPLITS:
+        np.testing.assert_array_equal(truncated[name], splits[name][splits[name] < 500])
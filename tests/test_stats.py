@@ -0,0 +1,63 @@
+import numpy as np
+from mangroves.stats import BandStatistics, Normalization
+
+
+def _patches(n: int = 6, seed: int = 0, size: int = 8):
+    rng = np.random.default_rng(seed)
+    return [np.clip(rng.normal(loc=0.1 * i, scale=0.3, size=(4, size, size)), -1, 1).astype(np.float32)
+            for i in range(n)]
+
+
+def test_merge_matches_single_pass():
+    patches = _patches()
+    single = BandStatistics(4, n_bins=256)
+    for patch in patches:
+        single.update(patch)
+    first, second = BandStatistics(4, n_bins=256), BandStatistics(4, n_bins=256)
+    for patch in patches[:2]:
+        first.update(patch)
+    for patch in patches[2:]:
+        second.update(patch)
+    merged = first.merge(second)
+
+    assert merged.count == single.count
+    np.testing.assert_allclose(merged.mean, single.mean, rtol=1e-10)
+    np.testing.assert_allclose(merged.std, single.std, rtol=1e-10)
+    np.testing.assert_array_equal(merged.min, single.min)
+    np.testing.assert_array_equal(merged.max, single.max)
+    np.testing.assert_array_equal(merged.histogram, single.histogram)
+
+
+def test_matches_numpy():
+    patches = _patches(size=64)
+    stats = BandStatistics(4, n_bins=4096)
+    for patch in patches:
+        stats.update(patch)
+    pixels = np.concatenate([patch.reshape(4, -1) for patch in patches], axis=1).astype(np.float64)
+    np.testing.assert_allclose(stats.mean, pixels.mean(axis=1), atol=1e-6)
+    np.testing.assert_allclose(stats.std, pixels.std(axis=1), atol=1e-6)
+    # Percentiles to within a bin of the histograms
+    np.testing.assert_allclose(stats.percentile(10), np.percentile(pixels, 10, axis=1), atol=2 / 4096)
+
+
+def test_save_load_and_normalization(tmp_path):
+    stats = BandStatistics(4)
+    for patch in _patches():
+        stats.update(patch)
+    stats.save(tmp_path / 'stats.npz')
+    normalization = Normalization.from_dataset(tmp_path)
+
+    patch = _patches(1, seed=1)[0]
+    expected = (patch - stats.mean[:, None, None]) / stats.std[:, None, None]
+    np.testing.assert_allclose(normalization(patch), expected, atol=1e-5)
+
+
+def test_float16_patches_and_empty_patches():
+    rng = np.random.default_rng(2)
+    patch = (0.9 + 1e-3 * rng.normal(size=(4, 32, 32))).astype(np.float16)
+    stats = BandStatistics(4).update(patch).update(np.zeros((4, 0, 0), dtype=np.float16))
+    pixels = patch.reshape(4, -1).astype(np.float64)
+    assert stats.count == 32 * 32
+    np.testing.assert_allclose(stats.mean, pixels.mean(axis=1), rtol=1e-9)
+    # Deviations from the mean are not rounded to float16
+    np.testing.assert_allclose(stats.std, pixels.std(axis=1), rtol=1e-6)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from mangroves.collection import Collection
+from mangroves.geometry import Region
+from mangroves.temporal import TemporalStack, extract_stack
+
+
+def _stack(n_years: int = 4) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    stack = np.repeat(rng.normal(size=(1, 8, 20, 20)).astype(np.float32), n_years, axis=0)
+    stack[2, :, :5, :5] += 1  # A change in the first tile in the third year
+    return stack
+
+
+def test_round_trip(tmp_path):
+    stack = _stack()
+    written = TemporalStack.write(tmp_path, stack, [2017, 2018, 2019, 2020], {'latitude_deg': 1.3}, tile_size=8)
+    loaded = TemporalStack(tmp_path)
+
+    np.testing.assert_array_equal(loaded.read_all(), stack)
+    np.testing.assert_array_equal(loaded.read(2019), stack[2])
+    assert loaded.metadata['latitude_deg'] == 1.3 and len(loaded) == 4
+    # 3x3 tiles stored for the first year, then the changed tile in the third and fourth years
+    assert len(written.tiles) == 9 + 2
+    assert loaded.changes()[1:].sum() == 2
+
+
+def test_timeseries(tmp_path):
+    stack = _stack()
+    loaded = TemporalStack.write(tmp_path, stack, [2017, 2018, 2019, 2020], tile_size=8)
+    rows, cols = np.array([0, 3, 19, 10]), np.array([0, 17, 19, 4])
+    np.testing.assert_array_equal(loaded.timeseries(rows, cols), stack[:, :, rows, cols].transpose(2, 0, 1))
+    np.testing.assert_array_equal(loaded.timeseries(3, 4), stack[:, :, 3, 4])
+
+
+def test_tolerance_reuses_close_tiles(tmp_path):
+    stack = _stack()
+    stack[3] += 1e-4
+    exact = TemporalStack.write(tmp_path / 'exact', stack, [2017, 2018, 2019, 2020], tile_size=8)
+    close = TemporalStack.write(tmp_path / 'close', stack, [2017, 2018, 2019, 2020], tile_size=8, tolerance=1e-3)
+    assert len(exact.tiles) == 9 + 1 + 9
+    assert len(close.tiles) == 9 + 2
+    assert np.abs(close.read_all() - stack).max() <= 1e-3
+
+
+@pytest.mark.parametrize('years_per_request', [None, 2])
+def test_extract_stack_samples_the_mosaics_at_10m(tmp_path, fake_backend, years_per_request):
+    collection = Collection('test', requests_per_second=1e6)
+    years = [2017, 2018, 2019, 2020]
+    stack = extract_stack(collection, Region(1.3, 103.9, 16), years, tmp_path, years_per_request=years_per_request)
+
+    assert stack.metadata['available'] == [True] * 4
+    data = stack.read_all()
+    assert data.shape == (4, 64, 16, 16)
+    # Unit-length embeddings, none of the pixels is left to zero
+    assert (np.linalg.norm(data, axis=1) > 0.99).all()
@@ -0,0 +1,48 @@
+import pytest
+import torch
+from mangroves.scripts.transforms import (BatchCompose, GeometricTransform, Normalize, RandomCrop, RandomFlip,
+                                         RandomRot90)
+
+
+def _sequential(image: torch.Tensor, parameters: dict, i: int, size: int) -> torch.Tensor:
+    """
+    The transforms of a sample applied one after the other, with the parameters drawn for it.
+    """
+    if parameters['hflip'][i]:
+        image = torch.flip(image, dims=(-1,))
+    if parameters['vflip'][i]:
+        image = torch.flip(image, dims=(-2,))
+    image = torch.rot90(image, int(parameters['rot90'][i]), dims=(-2, -1))
+    top, left = parameters['crop'][i].tolist()
+    return image[:, top:top + size, left:left + size]
+
+
+def test_fused_geometric_transforms_match_sequential():
+    torch.manual_seed(0)
+    batch = torch.randn(16, 3, 12, 12)
+    transforms = BatchCompose([RandomFlip(), RandomFlip(vertical=True), RandomRot90(), RandomCrop(8)])
+    output, parameters = transforms(batch)
+
+    assert output.shape == (16, 3, 8, 8)
+    for i in range(len(batch)):
+        torch.testing.assert_close(output[i], _sequential(batch[i], parameters, i, 8), rtol=0, atol=0)
+
+
+def test_normalize_after_geometric_transforms():
+    torch.manual_seed(1)
+    batch = torch.rand(4, 3, 8, 8)
+    mean, std = [0.1, 0.2, 0.3], [0.5, 1., 2.]
+    output, parameters = BatchCompose([RandomRot90(), Normalize(mean, std)])(batch)
+    for i in range(len(batch)):
+        expected = torch.rot90(batch[i], int(parameters['rot90'][i]), dims=(-2, -1))
+        expected = (expected - torch.tensor(mean)[:, None, None]) / torch.tensor(std)[:, None, None]
+        torch.testing.assert_close(output[i], expected)
+
+
+def test_geometric_transforms_must_map_coordinates():
+    class Shift(GeometricTransform):
+        def sample(self, B, H, W, device):
+            return {}
+
+    with pytest.raises(TypeError):
+        Shift()
@@ -0,0 +1,48 @@
+import math
+import numpy as np
+from bench_utils import legacy_geodesic_circle, legacy_nearest_neighbour, legacy_planar_approx_circle
+from mangroves.constants import RADIUS_EARTH_M
+from mangroves.utils import (
+    geodesic_circle, geodesic_circles, haversine, haversine_matrix, nearest_neighbours, planar_approx_circle,
+    planar_approx_circles
+)
+
+RNG = np.random.default_rng(0)
+LATS, LONS = RNG.uniform(-60, 60, 200), RNG.uniform(-180, 180, 200)
+
+
+def _legacy_haversine(lat1_deg, lat2_deg, lon1_deg, lon2_deg):
+    dlat, dlon = math.radians(lat2_deg - lat1_deg), math.radians(lon2_deg - lon1_deg)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1_deg)) * math.cos(math.radians(lat2_deg)) * math.sin(dlon / 2) ** 2
+    return RADIUS_EARTH_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def test_circles_match_legacy():
+    expected = np.array([legacy_geodesic_circle(lat, lon, 1220., 36) for lat, lon in zip(LATS, LONS)])
+    np.testing.assert_allclose(geodesic_circles(LATS, LONS, 1220., 36), expected, rtol=0, atol=1e-9)
+    expected = np.array([legacy_planar_approx_circle(lat, lon, 1220., 36) for lat, lon in zip(LATS, LONS)])
+    np.testing.assert_allclose(planar_approx_circles(LATS, LONS, 1220., 36), expected, rtol=0, atol=1e-9)
+    # Single circles, and one distance per center
+    np.testing.assert_allclose(geodesic_circle(LATS[0], LONS[0], 500., 8), legacy_geodesic_circle(LATS[0], LONS[0], 500., 8))
+    np.testing.assert_allclose(planar_approx_circle(LATS[0], LONS[0], 500., 8), legacy_planar_approx_circle(LATS[0], LONS[0], 500., 8))
+    distances = RNG.uniform(100, 5000, len(LATS))
+    circles = geodesic_circles(LATS, LONS, distances, 8)
+    np.testing.assert_allclose(haversine(LATS[:, None], circles[..., 0], LONS[:, None], circles[..., 1]),
+                               np.broadcast_to(distances[:, None], (len(LATS), 8)), rtol=1e-6)
+
+
+def test_haversine_matrix_matches_scalar():
+    matrix = haversine_matrix(LATS[:30], LATS[30:70], LONS[:30], LONS[30:70], block_size=7)
+    expected = [[_legacy_haversine(LATS[i], LATS[j], LONS[i], LONS[j]) for j in range(30, 70)] for i in range(30)]
+    assert matrix.shape == (30, 40)
+    np.testing.assert_allclose(matrix, expected, rtol=1e-9)
+
+
+def test_nearest_neighbours_match_brute_force():
+    _, indices = nearest_neighbours(LATS, LONS, LATS, LONS, exclude_self=True, block_size=64)
+    np.testing.assert_array_equal(indices[:, 0], legacy_nearest_neighbour(LATS, LONS))
+
+    distances, indices = nearest_neighbours(LATS[:50], LONS[:50], LATS[50:], LONS[50:], k=5, block_size=16)
+    matrix = haversine_matrix(LATS[:50], LATS[50:], LONS[:50], LONS[50:])
+    np.testing.assert_array_equal(indices, np.argsort(matrix, axis=1)[:, :5])
+    np.testing.assert_allclose(distances, np.sort(matrix, axis=1)[:, :5], rtol=1e-9)